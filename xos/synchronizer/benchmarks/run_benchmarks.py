@@ -0,0 +1,367 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Benchmarks for the lookup and sync hot paths of the synchronizer.
+
+    The benchmarks run against the same mock model accessor and requests_mock fixtures as the unit tests, so they
+    need the same checkout layout (this repository under orchestration/xos-services/ next to orchestration/xos),
+    but no XOS core or ONOS:
+
+        python benchmarks/run_benchmarks.py --output results.json
+
+    Every benchmark sweeps its own parameters: the number of BNGPortMappings and the width of their ranges for
+    find_bng, the width of the pattern for range_matches, and the number of FabricCrossconnectServiceInstances spread
+    over a number of switches for find_crossconnect and sync_record, up to every VLAN on every switch. --quick runs a
+    much smaller sweep, to check that the benchmarks still work.
+
+    onos_sync_record runs sync_record end to end, over HTTP against the ONOS stand-in in tools/onos_standin.py with
+    latency and failures injected, from several threads at once. Its results also have the percentiles of the time
+    each sync_record took, in milliseconds, and the requests the stand-in handled.
+
+    The results are written as JSON, one entry per benchmark and set of parameters, so that runs on two revisions can
+    be compared.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer as timer
+
+from mock import patch
+import requests_mock
+
+benchmark_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+steps_path = os.path.join(benchmark_path, "../steps")
+tools_path = os.path.join(benchmark_path, "../tools")
+
+VLANS = 4094
+DEVICE = "of:%016x"
+ONOS_URL = "http://onos-fabric:8181/onos/segmentrouting/xconnect"
+
+FULL = {"mappings": [1, 10, 100, 1000],
+        "widths": [1, 16, 256, VLANS],
+        "fcsis": [(100, 1), (1000, 4), (VLANS, 1), (VLANS * 8, 8)],
+        "sync_fcsis": [(100, 1), (1000, 4), (VLANS, 8)],
+        # (fcsis, switches, threads, latency, error_rate) against the ONOS stand-in
+        "onos": [(1000, 4, 1, 0.002, 0), (1000, 4, 8, 0.002, 0), (VLANS, 8, 8, 0.002, 0), (1000, 4, 8, 0.002, 0.05)]}
+
+QUICK = {"mappings": [1, 10],
+         "widths": [1, 16],
+         "fcsis": [(20, 2)],
+         "sync_fcsis": [(10, 2)],
+         "onos": [(20, 2, 2, 0, 0.1)]}
+
+
+class NullLog(object):
+    """ Stands in for the step logger, so that the benchmarks measure the step rather than the log formatting """
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class Benchmarks(object):
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.results = []
+
+    def setup(self):
+        """ Set up the config and the mock model accessor the same way the unit tests do """
+        from xosconfig import Config
+        Config.clear()
+        Config.init(os.path.join(benchmark_path, "benchmark_config.yaml"), "synchronizer-config-schema.yaml")
+
+        from xossynchronizer.mock_modelaccessor_build import mock_modelaccessor_config
+        mock_modelaccessor_config(steps_path, [("fabric-crossconnect", "fabric-crossconnect.xproto"), ])
+
+        sys.path.append(steps_path)
+        sys.path.append(tools_path)
+
+        import xossynchronizer.modelaccessor
+        import mock_modelaccessor
+        reload(mock_modelaccessor)  # in case the unit tests loaded it already
+        reload(xossynchronizer.modelaccessor)
+        # and the sync steps, which hold on to the model classes they were first loaded with
+        for name in ["sync_fabric_crossconnect_service_instance", "sync_bng_port_mapping"]:
+            if name in sys.modules:
+                reload(sys.modules[name])
+
+        from xossynchronizer.modelaccessor import model_accessor
+        self.model_accessor = model_accessor
+        self.models = model_accessor.all_model_classes
+
+        onos_fabric = self.models["Service"](name="onos-fabric", rest_hostname="onos-fabric", rest_port="8181",
+                                             rest_username="onos", rest_password="rocks")
+        self.service = self.models["FabricCrossconnectService"](id=1, name="fcservice",
+                                                                provider_services=[onos_fabric])
+
+        from xconnect_queue import get_xconnect_queue
+        # measure the step itself, not the time the queue waits for other operations to coalesce with
+        get_xconnect_queue().window = 0
+
+    def invalidate(self):
+        from bng_index import get_bng_index
+        from crossconnect_index import get_crossconnect_index
+        from onos_endpoints import get_onos_endpoints
+        from xconnect_table import get_xconnect_tables
+
+        get_bng_index().invalidate()
+        get_crossconnect_index().invalidate()
+        get_onos_endpoints().invalidate()
+        get_xconnect_tables().invalidate()
+        self.clear_pattern_cache()
+
+    def clear_pattern_cache(self):
+        import s_tag_pattern
+        s_tag_pattern._pattern_cache.clear()
+
+    def record(self, benchmark, params, operations, seconds, **extra):
+        result = {"benchmark": benchmark,
+                  "params": params,
+                  "operations": operations,
+                  "seconds": seconds,
+                  "usec_per_op": (seconds * 1e6 / operations) if operations else None}
+        result.update(extra)
+        self.results.append(result)
+        print("%-20s %-45s %8d ops %10.4fs %10.2f us/op" % (benchmark, json.dumps(params, sort_keys=True),
+                                                            operations, seconds, result["usec_per_op"] or 0),
+              file=sys.stderr)
+
+    def make_mappings(self, count, width):
+        """ count BNGPortMappings of width s-tags each, spread over the VLAN range, plus an ANY mapping """
+        BNGPortMapping = self.models["BNGPortMapping"]
+        mappings = [BNGPortMapping(id=1, s_tag="ANY", switch_port=1)]
+        step = max(1, VLANS // count)
+        for i in range(count):
+            first = 1 + (i * step) % VLANS
+            last = min(VLANS, first + width - 1)
+            s_tag = str(first) if first == last else "%d-%d" % (first, last)
+            mappings.append(BNGPortMapping(id=i + 2, s_tag=s_tag, switch_port=2 + i % 48))
+        return mappings
+
+    def make_fcsis(self, count, switches, service=None):
+        """ count FabricCrossconnectServiceInstances, using each VLAN once per switch """
+        FabricCrossconnectServiceInstance = self.models["FabricCrossconnectServiceInstance"]
+        service = service or self.service
+        return [FabricCrossconnectServiceInstance(id=1000 + i, owner=service, owner_id=service.id,
+                                                  s_tag=1 + (i // switches) % VLANS, source_port=3,
+                                                  switch_datapath_id=DEVICE % (1 + i % switches),
+                                                  updated=1, policed=2)
+                for i in range(count)]
+
+    def bench_range_matches(self):
+        from helpers import Helpers
+
+        for width in self.sizes["widths"]:
+            pattern = "1-%d" % width if width > 1 else "1"
+            for cached in [False, True]:
+                self.clear_pattern_cache()
+                start = timer()
+                for vlan in range(1, VLANS + 1):
+                    if not cached:
+                        self.clear_pattern_cache()
+                    Helpers.range_matches(vlan, pattern)
+                self.record("range_matches", {"width": width, "cached": cached}, VLANS, timer() - start)
+
+    def bench_find_bng(self):
+        from sync_fabric_crossconnect_service_instance import SyncFabricCrossconnectServiceInstance
+        BNGPortMapping = self.models["BNGPortMapping"]
+
+        for count in self.sizes["mappings"]:
+            for width in self.sizes["widths"]:
+                self.invalidate()
+                mappings = self.make_mappings(count, width)
+                step = SyncFabricCrossconnectServiceInstance(model_accessor=self.model_accessor)
+                step.log = NullLog()
+
+                with patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+                    bng_objects.return_value = mappings
+
+                    # the first lookup builds the index
+                    start = timer()
+                    step.find_bng(s_tag=1)
+                    self.record("find_bng_build", {"mappings": count, "width": width}, 1, timer() - start)
+
+                    start = timer()
+                    for vlan in range(1, VLANS + 1):
+                        step.find_bng(s_tag=vlan)
+                    self.record("find_bng", {"mappings": count, "width": width}, VLANS, timer() - start)
+
+    def filter_fcsis(self, fcsis):
+        # the mock object manager only supports equality, and find_crossconnect filters by s-tag range
+        def filter(**kwargs):
+            s_tag_min = kwargs.get("s_tag__gte", kwargs.get("s_tag"))
+            s_tag_max = kwargs.get("s_tag__lte", kwargs.get("s_tag"))
+            return [fcsi for fcsi in fcsis if s_tag_min <= fcsi.s_tag <= s_tag_max]
+        return filter
+
+    def bench_find_crossconnect(self):
+        from sync_bng_port_mapping import SyncBNGPortMapping
+        FabricCrossconnectServiceInstance = self.models["FabricCrossconnectServiceInstance"]
+
+        for (count, switches) in self.sizes["fcsis"]:
+            fcsis = self.make_fcsis(count, switches)
+            for width in self.sizes["widths"]:
+                self.invalidate()
+                step = SyncBNGPortMapping(model_accessor=self.model_accessor)
+                step.log = NullLog()
+                patterns = ["%d-%d" % (first, min(VLANS, first + width - 1)) if width > 1 else str(first)
+                            for first in range(1, VLANS + 1, max(width, VLANS // 64))]
+
+                with patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                        patch.object(FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter:
+                    fcsi_objects.return_value = fcsis
+                    fcsi_filter.side_effect = self.filter_fcsis(fcsis)
+
+                    start = timer()
+                    found = 0
+                    for pattern in patterns:
+                        found += len(step.find_crossconnect(pattern))
+                    self.record("find_crossconnect", {"fcsis": count, "switches": switches, "width": width,
+                                                      "found": found}, len(patterns), timer() - start)
+
+    def bench_sync_record(self):
+        from sync_fabric_crossconnect_service_instance import SyncFabricCrossconnectServiceInstance
+        FabricCrossconnectServiceInstance = self.models["FabricCrossconnectServiceInstance"]
+        BNGPortMapping = self.models["BNGPortMapping"]
+        ServiceInstance = self.models["ServiceInstance"]
+
+        for (count, switches) in self.sizes["sync_fcsis"]:
+            self.invalidate()
+            fcsis = self.make_fcsis(count, switches)
+            step = SyncFabricCrossconnectServiceInstance(model_accessor=self.model_accessor)
+            step.log = NullLog()
+
+            with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
+                    patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                    patch.object(FabricCrossconnectServiceInstance, "save"), \
+                    requests_mock.Mocker() as m:
+                serviceinstance_objects.return_value = fcsis
+                bng_objects.return_value = self.make_mappings(100, 32)
+                m.post(ONOS_URL, status_code=200)
+
+                # the first pass pushes every xconnect, the second finds them already pushed
+                for phase in ["push", "skip"]:
+                    start = timer()
+                    for fcsi in fcsis:
+                        step.sync_record(fcsi)
+                    self.record("sync_record", {"fcsis": count, "switches": switches, "phase": phase}, count,
+                                timer() - start)
+
+    def bench_onos_sync_record(self):
+        from onos_standin import ONOSStandIn, percentiles
+        from onos_client import get_onos_client
+        from sync_fabric_crossconnect_service_instance import SyncFabricCrossconnectServiceInstance
+        FabricCrossconnectServiceInstance = self.models["FabricCrossconnectServiceInstance"]
+        BNGPortMapping = self.models["BNGPortMapping"]
+        ServiceInstance = self.models["ServiceInstance"]
+
+        for (count, switches, threads, latency, error_rate) in self.sizes["onos"]:
+            with ONOSStandIn(latency=latency, error_rate=error_rate, seed=count) as standin:
+                self.invalidate()
+                (host, port) = standin.address
+                onos = self.models["Service"](name="onos-standin", rest_hostname=host, rest_port=port,
+                                              rest_username="onos", rest_password="rocks")
+                service = self.models["FabricCrossconnectService"](id=2, name="fcservice-standin",
+                                                                   provider_services=[onos])
+                fcsis = self.make_fcsis(count, switches, service)
+                step = SyncFabricCrossconnectServiceInstance(model_accessor=self.model_accessor)
+                step.log = NullLog()
+
+                client = get_onos_client({"url": standin.url, "user": "onos", "pass": "rocks"})
+                # retry injected failures straight away, the backoff would only measure time.sleep()
+                client.backoff = 0.001
+
+                def sync(fcsi):
+                    start = timer()
+                    try:
+                        step.sync_record(fcsi)
+                        failed = False
+                    except Exception:
+                        failed = True
+                    return (timer() - start, failed)
+
+                with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
+                        patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                        patch.object(FabricCrossconnectServiceInstance, "save"):
+                    serviceinstance_objects.return_value = fcsis
+                    bng_objects.return_value = self.make_mappings(100, 32)
+
+                    pool = ThreadPool(threads)
+                    try:
+                        start = timer()
+                        syncs = pool.map(sync, fcsis)
+                        seconds = timer() - start
+                    finally:
+                        pool.close()
+                        pool.join()
+                client.close()
+
+                latencies = percentiles([duration * 1000 for (duration, failed) in syncs])
+                self.record("onos_sync_record", {"fcsis": count, "switches": switches, "threads": threads,
+                                                 "latency": latency, "error_rate": error_rate}, count, seconds,
+                            failed=len([failed for (duration, failed) in syncs if failed]),
+                            latency_ms=dict([("p%d" % point, value) for (point, value) in latencies.items()]),
+                            onos=standin.stats())
+
+    def run(self, names=None):
+        self.setup()
+        for name in names or ["range_matches", "find_bng", "find_crossconnect", "sync_record", "onos_sync_record"]:
+            getattr(self, "bench_" + name)()
+        return self.results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=benchmark_path,
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the fabric-crossconnect synchronizer hot paths")
+    parser.add_argument("--output", help="write the results to this file, rather than to stdout")
+    parser.add_argument("--quick", action="store_true", help="run a small sweep")
+    parser.add_argument("benchmarks", nargs="*", help="benchmarks to run, default all of them")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    results = Benchmarks(QUICK if args.quick else FULL).run(args.benchmarks)
+    output = {"revision": git_revision(),
+              "python": platform.python_version(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+              "quick": args.quick,
+              "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import shutil
+import tempfile
+import unittest
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestRunBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+        self.tmpdir = tempfile.mkdtemp()
+
+        sys.path.append(os.path.join(test_path, "../steps"))
+        from xconnect_queue import get_xconnect_queue
+        self.window = get_xconnect_queue().window
+
+        import run_benchmarks
+        self.module = run_benchmarks
+
+    def tearDown(self):
+        from xconnect_queue import get_xconnect_queue
+        get_xconnect_queue().window = self.window
+
+        shutil.rmtree(self.tmpdir)
+        sys.path = self.sys_path_save
+
+    def test_quick(self):
+        output = os.path.join(self.tmpdir, "results.json")
+
+        self.module.main(["--quick", "--output", output])
+
+        with open(output) as f:
+            results = json.load(f)
+
+        self.assertTrue(results["quick"])
+        benchmarks = set([result["benchmark"] for result in results["results"]])
+        self.assertEqual(benchmarks, set(["range_matches", "find_bng_build", "find_bng", "find_crossconnect",
+                                          "sync_record", "onos_sync_record"]))
+        for result in results["results"]:
+            keys = ["benchmark", "operations", "params", "seconds", "usec_per_op"]
+            if result["benchmark"] == "onos_sync_record":
+                keys += ["failed", "latency_ms", "onos"]
+            self.assertEqual(sorted(result.keys()), sorted(keys))
+            self.assertGreater(result["operations"], 0)
+
+        # every crossconnect is found by the widest pattern
+        found = [result["params"]["found"] for result in results["results"]
+                 if (result["benchmark"] == "find_crossconnect") and (result["params"]["width"] == 16)]
+        self.assertEqual(found, [20])
+
+        # every xconnect that was synchronized made it to the ONOS stand-in, despite the injected failures
+        [onos] = [result for result in results["results"] if result["benchmark"] == "onos_sync_record"]
+        self.assertEqual(onos["onos"]["xconnects"], 20 - onos["failed"])
+        self.assertEqual(sorted(onos["latency_ms"].keys()), ["p100", "p50", "p90", "p99"])
+
+
+if __name__ == '__main__':
+    unittest.main()
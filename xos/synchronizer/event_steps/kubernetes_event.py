@@ -16,10 +16,17 @@
 
 import json
 from xossynchronizer.event_steps.eventstep import EventStep
-from xossynchronizer.modelaccessor import FabricCrossconnectService, FabricCrossconnectServiceInstance, Service
+from xossynchronizer.modelaccessor import FabricCrossconnectService, FabricCrossconnectServiceInstance
 from xosconfig import Config
 from multistructlog import create_logger
 
+# helpers lives in the steps directory, which the synchronizer adds to sys.path when it loads the steps
+from helpers import Helpers
+from onos_endpoints import get_onos_service_index
+from xconnect_reconciler import XconnectReconciler
+from event_debouncer import get_pod_event_debouncer
+from metrics import timed
+
 log = create_logger(Config().get('logging'))
 
 
@@ -27,21 +34,58 @@ class KubernetesPodDetailsEventStep(EventStep):
     topics = ["xos.kubernetes.pod-details"]
     technology = "kafka"
 
+    # a flapping pod sends a burst of events, wait for it to settle and then resynchronize once
+    debounce_seconds = 5
+
     def __init__(self, *args, **kwargs):
         super(KubernetesPodDetailsEventStep, self).__init__(*args, **kwargs)
 
-    @staticmethod
-    def get_fabric_onos(service):
-        service = Service.objects.get(id=service.id)
-
-        # get the onos_fabric service
-        fabric_onos = [s.leaf_model for s in service.provider_services if "onos" in s.name.lower()]
-
-        if len(fabric_onos) == 0:
-            raise Exception('Cannot find ONOS service in provider_services of Fabric-Crossconnect')
-
-        return fabric_onos[0]
-
+    def get_fabric_onos_info(self, service):
+        # resolved through the same cache as the sync steps, so repeated events don't walk provider_services
+        return Helpers.get_fabric_onos_info(self.model_accessor, service)
+
+    def dirty_service_instance(self, service_instance):
+        """ Mark an instance to be pushed to ONOS again by the sync step, returning False if it already was """
+        if (service_instance.backend_code == 0) and (service_instance.push_fingerprint is None):
+            # already waiting to be synchronized, and will be pushed when it is
+            return False
+
+        log.info("Dirtying FabricCrossconnectServiceInstance", service_instance=service_instance)
+        service_instance.backend_code = 0
+        service_instance.backend_status = "resynchronize due to kubernetes event"
+        # ONOS has lost its xconnects, make sure the sync step pushes this one again
+        service_instance.push_fingerprint = None
+        service_instance.save(
+            update_fields=[
+                "updated",
+                "backend_code",
+                "backend_status",
+                "push_fingerprint"],
+            always_update_timestamp=True)
+        return True
+
+    def dirty_service_instances(self, service_id):
+        """ Mark the instances of a FabricCrossconnectService to be pushed to ONOS again, returning how many were """
+        service_instances = FabricCrossconnectServiceInstance.objects.filter(owner_id=service_id)
+        return len([si for si in service_instances if self.dirty_service_instance(si)])
+
+    def replay_service_instances(self, service_id):
+        """ Push the xconnects of a FabricCrossconnectService straight to its restarted ONOS. The instances that
+            were not pushed are dirtied, so that the sync step retries them. Returns (replayed, dirtied).
+        """
+        service_instances = FabricCrossconnectServiceInstance.objects.filter(owner_id=service_id)
+        try:
+            # waits for the restarted ONOS to come up, this runs in the debouncer's thread rather than the event's
+            remaining = XconnectReconciler(self.model_accessor).replay(service_instances)
+        except Exception as e:
+            log.exception("Failed to replay xconnects, resynchronizing every instance", service=service_id,
+                          error=str(e))
+            return (0, self.dirty_service_instances(service_id))
+
+        dirtied = len([si for si in remaining if self.dirty_service_instance(si)])
+        return (len(service_instances) - len(remaining), dirtied)
+
+    @timed("event_seconds", "process_event")
     def process_event(self, event):
         value = json.loads(event.value)
 
@@ -55,18 +99,19 @@ class KubernetesPodDetailsEventStep(EventStep):
         if not xos_service:
             return
 
-        for service in FabricCrossconnectService.objects.all():
-            fabric_onos = KubernetesPodDetailsEventStep.get_fabric_onos(service)
-            if (fabric_onos.name.lower() != xos_service.lower()):
-                continue
-
-            for service_instance in service.service_instances.all():
-                log.info("Dirtying FabricCrossconnectServiceInstance", service_instance=service_instance)
-                service_instance.backend_code = 0
-                service_instance.backend_status = "resynchronize due to kubernetes event"
-                service_instance.save(
-                    update_fields=[
-                        "updated",
-                        "backend_code",
-                        "backend_status"],
-                    always_update_timestamp=True)
+        # only pods of an ONOS that a FabricCrossconnectService uses are worth debouncing
+        service_ids = get_onos_service_index().lookup(FabricCrossconnectService, self.get_fabric_onos_info,
+                                                      xos_service)
+        if not service_ids:
+            return
+
+        # ONOS service names are matched case-insensitively, and so are bursts
+        get_pod_event_debouncer().submit(xos_service.lower(), lambda: self.resynchronize(xos_service, service_ids),
+                                         delay=self.debounce_seconds)
+
+    @timed("event_seconds", "resynchronize")
+    def resynchronize(self, xos_service, service_ids):
+        for service_id in service_ids:
+            (replayed, dirtied) = self.replay_service_instances(service_id)
+            log.info("Resynchronized FabricCrossconnectService due to kubernetes event", service=service_id,
+                     xos_service=xos_service, replayed=replayed, dirtied=dirtied)
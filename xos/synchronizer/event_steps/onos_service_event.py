@@ -0,0 +1,50 @@
+
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from xossynchronizer.event_steps.eventstep import EventStep
+from xosconfig import Config
+from multistructlog import create_logger
+
+# onos_endpoints lives in the steps directory, which the synchronizer adds to sys.path when it loads the steps
+from onos_endpoints import get_onos_endpoints, get_onos_service_index
+from metrics import timed
+
+log = create_logger(Config().get('logging'))
+
+
+class ONOSServiceEventStep(EventStep):
+    """ Invalidates the cached ONOS endpoints, and the index from ONOS name to FabricCrossconnectService, when the
+        models they are resolved from change.
+
+        The XOS core publishes an event keyed by model name on xos.gui_events whenever a model is saved or deleted.
+    """
+
+    topics = ["xos.gui_events"]
+    technology = "kafka"
+
+    # models that a FabricCrossconnectService's ONOS endpoint is resolved from
+    watched_models = ["ONOSService", "Service", "ServiceDependency", "FabricCrossconnectService"]
+
+    def __init__(self, *args, **kwargs):
+        super(ONOSServiceEventStep, self).__init__(*args, **kwargs)
+
+    @timed("event_seconds", "process_event")
+    def process_event(self, event):
+        if event.key not in self.watched_models:
+            return
+
+        log.info("Invalidating cached ONOS endpoints", model=event.key)
+        get_onos_endpoints().invalidate()
+        get_onos_service_index().invalidate()
@@ -15,6 +15,7 @@
 import unittest
 import json
 from mock import patch, call, Mock
+import requests_mock
 
 import os
 import sys
@@ -50,6 +51,22 @@ class TestKubernetesEvent(unittest.TestCase):
 
         from mock_modelaccessor import MockObjectList
 
+        # the synchronizer puts the steps directory on sys.path before loading the event steps
+        sys.path.append(os.path.join(test_path, "../steps"))
+
+        from onos_endpoints import get_onos_endpoints, get_onos_service_index
+        get_onos_endpoints().invalidate()
+        get_onos_service_index().invalidate()
+
+        from bng_index import get_bng_index
+        get_bng_index().invalidate()
+
+        from metrics import get_metrics
+        self.metrics = get_metrics()
+        self.metrics.reset()
+
+        import kubernetes_event
+        reload(kubernetes_event)  # bind the model classes that were just reloaded
         from kubernetes_event import KubernetesPodDetailsEventStep
 
         # import all class names to globals
@@ -57,6 +74,13 @@ class TestKubernetesEvent(unittest.TestCase):
             globals()[k] = v
 
         self.event_step = KubernetesPodDetailsEventStep
+        # process events as they arrive, unless a test is about debouncing
+        self.event_step.debounce_seconds = 0
+
+        from event_debouncer import EventDebouncer
+        self.debouncer = EventDebouncer()
+        self.debouncer_patch = patch.object(kubernetes_event, "get_pod_event_debouncer", return_value=self.debouncer)
+        self.debouncer_patch.start()
 
         self.onos = ONOSService(name="myonos",
                                 id=1111,
@@ -75,11 +99,13 @@ class TestKubernetesEvent(unittest.TestCase):
 
         self.fcsi1 = FabricCrossconnectServiceInstance(name="myfcsi1",
                                                        owner=self.fcservice,
+                                                       owner_id=self.fcservice.id,
                                                        backend_code=1,
                                                        backend_status="succeeded")
 
         self.fcsi2 = FabricCrossconnectServiceInstance(name="myfcsi2",
                                                        owner=self.fcservice,
+                                                       owner_id=self.fcservice.id,
                                                        backend_code=1,
                                                        backend_status="succeeded")
 
@@ -88,13 +114,16 @@ class TestKubernetesEvent(unittest.TestCase):
         self.log = Mock()
 
     def tearDown(self):
+        self.debouncer_patch.stop()
         sys.path = self.sys_path_save
 
     def test_process_event(self):
         with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
                 patch.object(Service.objects, "get_items") as service_objects, \
+                patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
                 patch.object(FabricCrossconnectServiceInstance, "save", autospec=True) as fcsi_save:
             fcservice_objects.return_value = [self.fcservice]
+            fcsi_objects.return_value = [self.fcsi1, self.fcsi2]
             service_objects.return_value = [self.onos, self.fcservice]
 
             event_dict = {"status": "created",
@@ -111,11 +140,126 @@ class TestKubernetesEvent(unittest.TestCase):
             self.assertEqual(self.fcsi2.backend_code, 0)
             self.assertEqual(self.fcsi2.backend_status, "resynchronize due to kubernetes event")
 
-            fcsi_save.assert_has_calls([call(self.fcsi1, update_fields=["updated", "backend_code", "backend_status"],
-                                             always_update_timestamp=True),
-                                        call(self.fcsi2, update_fields=["updated", "backend_code", "backend_status"],
+            update_fields = ["updated", "backend_code", "backend_status", "push_fingerprint"]
+            fcsi_save.assert_has_calls([call(self.fcsi1, update_fields=update_fields, always_update_timestamp=True),
+                                        call(self.fcsi2, update_fields=update_fields, always_update_timestamp=True)])
+            self.assertIsNone(self.fcsi1.push_fingerprint)
+
+    def test_process_event_already_dirty(self):
+        with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
+                patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save", autospec=True) as fcsi_save:
+            fcservice_objects.return_value = [self.fcservice]
+            fcsi_objects.return_value = [self.fcsi1, self.fcsi2]
+
+            self.fcsi2.backend_code = 0
+
+            event_dict = {"status": "created",
+                          "labels": {"xos_service": "myonos"}}
+            event = Mock()
+            event.value = json.dumps(event_dict)
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(event)
+            step.process_event(event)
+
+            # fcsi2 was waiting to be synchronized already, and fcsi1 is only dirtied by the first event
+            self.assertEqual(self.fcsi2.backend_status, "succeeded")
+            self.assertEqual(fcsi_save.call_count, 1)
+            self.assertEqual(fcsi_save.call_args[0][0], self.fcsi1)
+
+    @requests_mock.Mocker()
+    def test_process_event_replay(self, m):
+        m.get("http://onos-url:8181/onos/segmentrouting/xconnect", status_code=200, json={"xconnects": []})
+        m.post("http://onos-url:8181/onos/segmentrouting/xconnect", status_code=200)
+
+        for (fcsi, s_tag) in [(self.fcsi1, 111), (self.fcsi2, 222)]:
+            fcsi.id = 5000 + s_tag
+            fcsi.s_tag = s_tag
+            fcsi.source_port = 3
+            fcsi.switch_datapath_id = "of:0000000000000201"
+        self.fcsi1.backend_handle = "111/of:0000000000000201"
+        # fcsi2 has not been synchronized yet, so it is left to the sync step
+        bng_mapping = BNGPortMapping(id=1, s_tag="ANY", switch_port=4)
+
+        with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
+                patch.object(Service.objects, "get_items") as service_objects, \
+                patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save", autospec=True) as fcsi_save:
+            fcservice_objects.return_value = [self.fcservice]
+            fcsi_objects.return_value = [self.fcsi1, self.fcsi2]
+            service_objects.return_value = [self.onos, self.fcservice]
+            bng_objects.return_value = [bng_mapping]
+
+            event = Mock()
+            event.value = json.dumps({"status": "created", "labels": {"xos_service": "myonos"}})
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(event)
+
+            self.assertEqual([r.json() for r in m.request_history if r.method == "POST"],
+                             [{"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]}])
+            self.assertEqual(self.metrics.onos_request_seconds.count(method="POST", status="200"), 1)
+            for operation in ["process_event", "resynchronize"]:
+                self.assertEqual(self.metrics.event_seconds.count(step="KubernetesPodDetailsEventStep",
+                                                                  operation=operation, result="success"), 1)
+
+            self.assertEqual(self.fcsi1.backend_code, 1)
+            self.assertEqual(self.fcsi1.push_fingerprint, "of:0000000000000201/111/3,4")
+            self.assertEqual(self.fcsi2.backend_code, 0)
+            self.assertEqual(self.fcsi2.backend_status, "resynchronize due to kubernetes event")
+
+            fcsi_save.assert_has_calls([call(self.fcsi1, update_fields=["push_fingerprint"]),
+                                        call(self.fcsi2, update_fields=["updated", "backend_code", "backend_status",
+                                                                        "push_fingerprint"],
                                              always_update_timestamp=True)])
 
+    def test_process_event_index(self):
+        with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
+                patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save") as fcsi_save:
+            fcservice_objects.return_value = [self.fcservice]
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            for xos_service in ["something_else", "other", "MyONOS"]:
+                event = Mock()
+                event.value = json.dumps({"status": "created", "labels": {"xos_service": xos_service}})
+                step.process_event(event)
+
+            # the services are only walked once, and only the matching event looks at instances
+            self.assertEqual(fcservice_objects.call_count, 1)
+            self.assertEqual(fcsi_objects.call_count, 1)
+
+    def test_process_event_debounce(self):
+        self.event_step.debounce_seconds = 60
+
+        with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
+                patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save") as fcsi_save:
+            fcservice_objects.return_value = [self.fcservice]
+            fcsi_objects.return_value = [self.fcsi1, self.fcsi2]
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            for xos_service in ["myonos", "MyONOS", "myonos", "other"]:
+                event = Mock()
+                event.value = json.dumps({"status": "created", "labels": {"xos_service": xos_service}})
+                step.process_event(event)
+
+            # nothing happens until the burst has settled
+            fcsi_save.assert_not_called()
+            # "other" isn't used by any FabricCrossconnectService, so it was never debounced
+            self.assertEqual(self.debouncer.stats(), {"received": 3, "suppressed": 2, "pending": 1,
+                                                      "suppressed_by_key": {"myonos": 2}})
+
+            self.debouncer.flush()
+
+            # the burst for myonos resynchronized its instances once
+            self.assertEqual(fcsi_objects.call_count, 1)
+            self.assertEqual(fcsi_save.call_count, 2)
+            self.assertEqual(self.fcsi1.backend_code, 0)
+            self.assertEqual(self.debouncer.stats()["pending"], 0)
+
     def test_process_event_unknownstatus(self):
         with patch.object(FabricCrossconnectService.objects, "get_items") as fcservice_objects, \
                 patch.object(Service.objects, "get_items") as service_objects, \
@@ -153,6 +297,7 @@ class TestKubernetesEvent(unittest.TestCase):
 
             step = self.event_step(model_accessor=self.model_accessor, log=self.log)
             step.process_event(event)
+            self.assertEqual(self.debouncer.stats()["received"], 0)
 
             self.assertEqual(self.fcsi1.backend_code, 1)
             self.assertEqual(self.fcsi1.backend_status, "succeeded")
@@ -0,0 +1,74 @@
+
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestONOSServiceEvent(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        # the synchronizer puts the steps directory on sys.path before loading the event steps
+        sys.path.append(os.path.join(test_path, "../steps"))
+
+        from onos_endpoints import get_onos_endpoints, get_onos_service_index
+        self.endpoints = get_onos_endpoints()
+        self.endpoints.invalidate()
+        self.service_index = get_onos_service_index()
+        self.service_index.services = {"myonos": [1112]}
+
+        from onos_service_event import ONOSServiceEventStep
+        self.event_step = ONOSServiceEventStep
+
+        self.log = Mock()
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def process_event(self, key):
+        event = Mock()
+        event.key = key
+        event.value = "{}"
+        self.event_step(model_accessor=Mock(), log=self.log).process_event(event)
+
+    def test_invalidate(self):
+        self.endpoints.get(1112, lambda: {"url": "http://onos-url:8181"})
+        self.process_event("ONOSService")
+        self.assertEqual(self.endpoints.entries, {})
+        self.assertIsNone(self.service_index.services)
+
+    def test_unrelated_model(self):
+        self.endpoints.get(1112, lambda: {"url": "http://onos-url:8181"})
+        self.process_event("BNGPortMapping")
+        self.assertEqual(self.endpoints.entries.keys(), [1112])
+        self.assertEqual(self.service_index.services, {"myonos": [1112]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,10 @@
 # This imports and runs ../../xos-observer.py
 
 import os
+import sys
 from xossynchronizer import Synchronizer
 from xosconfig import Config
+from multistructlog import create_logger
 
 base_config_file = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/config.yaml')
 mounted_config_file = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/mounted_config.yaml')
@@ -28,4 +30,16 @@ if os.path.isfile(mounted_config_file):
 else:
     Config.init(base_config_file, 'synchronizer-config-schema.yaml')
 
+log = create_logger(Config().get('logging'))
+
+# metrics lives in the steps directory, which the synchronizer only adds to sys.path when it loads the steps
+sys.path.append(Config.get('steps_dir'))
+from metrics import start_metrics_exporter  # noqa: E402
+
+try:
+    start_metrics_exporter()
+except Exception as e:
+    # metrics are not worth failing to synchronize for, e.g. when the port is already in use
+    log.exception("Failed to start the metrics exporter", error=str(e))
+
 Synchronizer().run()
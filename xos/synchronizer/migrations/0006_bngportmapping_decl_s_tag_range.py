@@ -0,0 +1,125 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 11:20
+from __future__ import print_function, unicode_literals
+
+from django.db import migrations, models
+
+
+MAX_VLAN = 4095
+
+
+def parse_range(pattern):
+    """ Parse an s_tag pattern into (is_any, merged list of (first, last) intervals), raising ValueError if it is
+        malformed. This is the grammar of BNGPortMapping.parse_range in models/models.py, which a migration cannot
+        import.
+    """
+
+    def parse_vlan(text):
+        vlan = int(text.strip())
+        if (vlan < 0) or (vlan > MAX_VLAN):
+            raise ValueError("Malformed range %s" % pattern)
+        return vlan
+
+    is_any = False
+    intervals = []
+    for this_range in pattern.split(","):
+        this_range = this_range.strip()
+        if "-" in this_range:
+            (first, last) = this_range.split("-", 1)
+            first = parse_vlan(first)
+            last = parse_vlan(last)
+            if first > last:
+                raise ValueError("Malformed range %s" % pattern)
+            intervals.append((first, last))
+        elif this_range.lower() == "any":
+            is_any = True
+        else:
+            vlan = parse_vlan(this_range)
+            intervals.append((vlan, vlan))
+
+    merged = []
+    for (first, last) in sorted(intervals):
+        if merged and (first <= merged[-1][1] + 1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return (is_any, merged)
+
+
+def populate_s_tag_range(apps, schema_editor):
+    """ Compute the s_tag range fields for mappings saved before they existed.
+
+        Mappings whose s_tag was accepted before but is now malformed, such as a reversed range or an s-tag above
+        4095, are left without range fields and reported, since they will fail validation the next time they are
+        saved.
+    """
+    BNGPortMapping = apps.get_model('fabric-crossconnect', 'BNGPortMapping_decl')
+    malformed = []
+    for bng_mapping in BNGPortMapping.objects.all():
+        try:
+            (is_any, intervals) = parse_range(bng_mapping.s_tag)
+        except ValueError:
+            malformed.append(bng_mapping)
+            continue
+
+        if is_any:
+            (kind, s_tag_min, s_tag_max, rank) = ("any", 0, MAX_VLAN, MAX_VLAN + 1)
+        else:
+            if (len(intervals) == 1) and (intervals[0][0] == intervals[0][1]):
+                kind = "single"
+            else:
+                kind = "range"
+            (s_tag_min, s_tag_max) = (intervals[0][0], intervals[-1][1])
+            rank = sum([last - first + 1 for (first, last) in intervals])
+
+        BNGPortMapping.objects.filter(id=bng_mapping.id).update(
+            s_tag_kind=kind, s_tag_min=s_tag_min, s_tag_max=s_tag_max, s_tag_rank=rank)
+
+    for bng_mapping in malformed:
+        print("WARNING: BNGPortMapping %s has malformed s_tag %r and will fail validation when it is next saved"
+              % (bng_mapping.id, bng_mapping.s_tag))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fabric-crossconnect', '0005_bngportmapping_decl_old_s_tag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bngportmapping_decl',
+            name='s_tag_kind',
+            field=models.CharField(blank=True, choices=[(b'single', b'Single'), (b'range', b'Range'), (b'any', b'Any')], help_text=b"Whether s_tag is a single s-tag, a range or list of s-tags, or 'ANY'. Computed on save", max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='bngportmapping_decl',
+            name='s_tag_max',
+            field=models.IntegerField(blank=True, help_text=b'Highest s-tag matched by s_tag. Computed on save', null=True),
+        ),
+        migrations.AddField(
+            model_name='bngportmapping_decl',
+            name='s_tag_min',
+            field=models.IntegerField(blank=True, help_text=b'Lowest s-tag matched by s_tag. Computed on save', null=True),
+        ),
+        migrations.AddField(
+            model_name='bngportmapping_decl',
+            name='s_tag_rank',
+            field=models.IntegerField(blank=True, help_text=b'Number of s-tags matched by s_tag, lower is more specific. Computed on save', null=True),
+        ),
+        migrations.RunPython(populate_s_tag_range, migrations.RunPython.noop),
+    ]
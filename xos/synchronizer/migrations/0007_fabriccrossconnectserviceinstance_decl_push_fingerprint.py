@@ -0,0 +1,34 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 11:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fabric-crossconnect', '0006_bngportmapping_decl_s_tag_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fabriccrossconnectserviceinstance_decl',
+            name='push_fingerprint',
+            field=models.CharField(blank=True, help_text=b'Device, vlan and endpoints of the crossconnect last pushed to ONOS. Set by the synchronizer', max_length=1024, null=True),
+        ),
+    ]
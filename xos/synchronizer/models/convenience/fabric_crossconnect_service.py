@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 
 from xosapi.orm import register_convenience_wrapper
 from xosapi.convenience.service import ORMWrapperService
@@ -32,33 +33,53 @@ class ORMWrapperFabricCrossconnectService(ORMWrapperService):
               1) If there is an eligible provider_service_instance that can be used, then link to it
               2) Otherwise, create a new provider_service_instance and link to it.
         """
-        (s_tag, switch_datapath_id, source_port) = self._get_west_fields(subscriber_service_instance)
+        return self.acquire_service_instances([subscriber_service_instance])[0]
+
+    def acquire_service_instances(self, subscriber_service_instances):
+        """ Batch version of acquire_service_instance(), for onboarding many subscribers at once.
+
+            The subscribers are grouped by (s_tag, switch_datapath_id, source_port), so that each group costs one
+            candidate query and at most one new provider_service_instance, however many subscribers it has. The
+            westbound fields of every subscriber are resolved before anything is written, so a subscriber that is
+            missing one of them fails the batch without leaving it half done.
 
+            Returns the provider_service_instance of each subscriber, in the order the subscribers were given.
+        """
         FabricCrossconnectServiceInstance = self.stub.FabricCrossconnectServiceInstance
         ServiceInstanceLink = self.stub.ServiceInstanceLink
 
-        candidates = FabricCrossconnectServiceInstance.objects.filter(owner_id=self.id,
-                                                                      s_tag=s_tag,
-                                                                      switch_datapath_id=switch_datapath_id,
-                                                                      source_port=source_port)
+        memo = {}
+        groups = OrderedDict()
+        for (index, subscriber_service_instance) in enumerate(subscriber_service_instances):
+            west_fields = self._get_west_fields(subscriber_service_instance, memo)
+            groups.setdefault(west_fields, []).append((index, subscriber_service_instance))
 
-        if candidates:
-            provider_service_instance = candidates[0]
-        else:
-            provider_service_instance = FabricCrossconnectServiceInstance(owner=self,
+        provider_service_instances = [None] * len(subscriber_service_instances)
+        for ((s_tag, switch_datapath_id, source_port), subscribers) in groups.items():
+            candidates = FabricCrossconnectServiceInstance.objects.filter(owner_id=self.id,
                                                                           s_tag=s_tag,
                                                                           switch_datapath_id=switch_datapath_id,
                                                                           source_port=source_port)
-            provider_service_instance.save()
 
-        # NOTE: Lack-of-atomicity vulnerability -- provider_service_instance could be deleted before we created the
-        # link.
+            if candidates:
+                provider_service_instance = candidates[0]
+            else:
+                provider_service_instance = FabricCrossconnectServiceInstance(owner=self,
+                                                                              s_tag=s_tag,
+                                                                              switch_datapath_id=switch_datapath_id,
+                                                                              source_port=source_port)
+                provider_service_instance.save()
+
+            # NOTE: Lack-of-atomicity vulnerability -- provider_service_instance could be deleted before we created
+            # the links.
 
-        link = ServiceInstanceLink(provider_service_instance=provider_service_instance,
-                                   subscriber_service_instance=subscriber_service_instance)
-        link.save()
+            for (index, subscriber_service_instance) in subscribers:
+                link = ServiceInstanceLink(provider_service_instance=provider_service_instance,
+                                           subscriber_service_instance=subscriber_service_instance)
+                link.save()
+                provider_service_instances[index] = provider_service_instance
 
-        return provider_service_instance
+        return provider_service_instances
 
     def validate_links(self, subscriber_service_instance):
         """ Validate existing links between the provider and subscriber service instances. If a valid link exists,
@@ -73,28 +94,88 @@ class ORMWrapperFabricCrossconnectService(ORMWrapperService):
 
         (s_tag, switch_datapath_id, source_port) = self._get_west_fields(subscriber_service_instance)
 
+        # Fetch the links with one query, and the instances of this service with one more, rather than following
+        # provider_service_instance, owner and leaf_model from every link. xosapi has no __in filter, so the links'
+        # providers are looked up among the instances of the service in memory.
+        links = self.stub.ServiceInstanceLink.objects.filter(
+            subscriber_service_instance_id=subscriber_service_instance.id)
+        if not links:
+            return []
+        provider_ids = set([link.provider_service_instance_id for link in links])
+        fcsis = dict([(fcsi.id, fcsi) for fcsi in
+                      self.stub.FabricCrossconnectServiceInstance.objects.filter(owner_id=self.id)
+                      if fcsi.id in provider_ids])
+
         matched = []
-        for link in subscriber_service_instance.subscribed_links.all():
-            if link.provider_service_instance.owner.id == self.id:
-                fcsi = link.provider_service_instance.leaf_model
-                if (fcsi.s_tag == s_tag) and (fcsi.switch_datapath_id == switch_datapath_id) and \
-                        (fcsi.source_port == source_port):
-                    matched.append(fcsi)
-                else:
-                    link.delete()
+        invalid = []
+        for link in links:
+            fcsi = fcsis.get(link.provider_service_instance_id)
+            if fcsi is None:
+                # provided by some other service, or some other FabricCrossconnectService
+                continue
+            if (fcsi.s_tag == s_tag) and (fcsi.switch_datapath_id == switch_datapath_id) and \
+                    (fcsi.source_port == source_port):
+                matched.append(fcsi)
+            else:
+                invalid.append(link)
+
+        for link in invalid:
+            link.delete()
+
         return matched
 
-    def _get_west_fields(self, subscriber_si):
+    def _get_westbound_properties(self, subscriber_si, prop_names, memo=None):
+        """ _get_westbound_properties()
+
+            Return a dict with the values of prop_names, looked up the same way as
+            get_westbound_service_instance_properties(prop, include_self=True) would, but walking the westbound
+            chain only once for all of them. Each step of the chain is kept in memo, so that a caller looking up
+            several subscribers that share part of their chain can pass the same dict to each call.
+        """
+        if memo is None:
+            memo = {}
+
+        values = {}
+        remaining = [prop for prop in prop_names if not hasattr(subscriber_si, prop)]
+        for prop in prop_names:
+            if prop not in remaining:
+                values[prop] = getattr(subscriber_si, prop)
+
+        si = subscriber_si
+        while remaining:
+            if ("westbound", si.id) not in memo:
+                memo[("westbound", si.id)] = si.westbound_service_instances
+            wi = memo[("westbound", si.id)]
+
+            if len(wi) == 0:
+                raise Exception("ServiceInstance with id %s has no westbound service instances, can't find properties "
+                                "%s in the chain" % (si.id, ", ".join(remaining)))
+
+            west_si = wi[0]
+            for prop in list(remaining):
+                if hasattr(west_si, prop):
+                    values[prop] = getattr(west_si, prop)
+                    remaining.remove(prop)
+
+            if remaining:
+                # cast to the ServiceInstance model, and carry on from there
+                if ("service_instance", west_si.id) not in memo:
+                    memo[("service_instance", west_si.id)] = self.stub.ServiceInstance.objects.get(id=west_si.id)
+                si = memo[("service_instance", west_si.id)]
+
+        return values
+
+    def _get_west_fields(self, subscriber_si, memo=None):
         """ _get_west_fields()
 
             Helper function to inspect westbound service instance for fields that will be used inside of
             FabricCrossconnectServiceInstance.
         """
 
-        s_tag = subscriber_si.get_westbound_service_instance_properties("s_tag", include_self=True)
-        switch_datapath_id = subscriber_si.get_westbound_service_instance_properties(
-            "switch_datapath_id", include_self=True)
-        source_port = subscriber_si.get_westbound_service_instance_properties("switch_port", include_self=True)
+        props = self._get_westbound_properties(subscriber_si, ["s_tag", "switch_datapath_id", "switch_port"], memo)
+        s_tag = props["s_tag"]
+        switch_datapath_id = props["switch_datapath_id"]
+        source_port = props["switch_port"]
 
         if (s_tag is None):
             raise Exception("Subscriber ServiceInstance %s s-tag is None" % subscriber_si.id)
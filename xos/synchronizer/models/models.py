@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from django.db import transaction
 from xos.exceptions import XOSValidationError
 
 from models_decl import FabricCrossconnectService_decl, FabricCrossconnectServiceInstance_decl, BNGPortMapping_decl
@@ -31,32 +32,87 @@ class BNGPortMapping(BNGPortMapping_decl):
     class Meta:
         proxy = True
 
-    def validate_range(self, pattern):
+    # The s_tag grammar is shared with steps/s_tag_pattern.py, which the synchronizer uses to match s-tags, and with
+    # migration 0006. Neither can be imported from here, so keep the three in sync; test_models checks that they
+    # agree.
+    MAX_VLAN = 4095
+
+    def parse_range(self, pattern):
+        """ Parse an s_tag pattern into (is_any, merged list of (first, last) intervals) """
+
+        def parse_vlan(text):
+            try:
+                vlan = int(text.strip())
+            except ValueError:
+                raise XOSValidationError("Malformed range %s" % pattern)
+            if (vlan < 0) or (vlan > self.MAX_VLAN):
+                raise XOSValidationError("Malformed range %s" % pattern)
+            return vlan
+
+        is_any = False
+        intervals = []
         for this_range in pattern.split(","):
             this_range = this_range.strip()
             if "-" in this_range:
-                (first, last) = this_range.split("-")
-                try:
-                    int(first.strip())
-                    int(last.strip())
-                except ValueError:
+                (first, last) = this_range.split("-", 1)
+                first = parse_vlan(first)
+                last = parse_vlan(last)
+                if first > last:
                     raise XOSValidationError("Malformed range %s" % pattern)
+                intervals.append((first, last))
             elif this_range.lower() == "any":
-                pass
+                is_any = True
             else:
-                try:
-                    int(this_range)
-                except ValueError:
-                    raise XOSValidationError("Malformed range %s" % pattern)
+                vlan = parse_vlan(this_range)
+                intervals.append((vlan, vlan))
 
-    def save(self, *args, **kwargs):
-        self.validate_range(self.s_tag)
-        #Retrieving old_s_tag when s_tag is changed for a BNG instance.
-        old_bng = BNGPortMapping.objects.filter(id=self.id)
-        if(len(old_bng) > 0):
-            if (old_bng[0].s_tag != self.s_tag):
-                self.old_s_tag = old_bng[0].s_tag
+        merged = []
+        for (first, last) in sorted(intervals):
+            if merged and (first <= merged[-1][1] + 1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+        return (is_any, merged)
+
+    def validate_range(self, pattern):
+        self.parse_range(pattern)
+
+    def update_range_fields(self):
+        """ Store the kind and bounds of s_tag, so that candidate mappings for an s-tag can be filtered by the
+            database instead of by parsing every s_tag.
+        """
+        (is_any, intervals) = self.parse_range(self.s_tag)
+        if is_any:
+            self.s_tag_kind = "any"
+            self.s_tag_min = 0
+            self.s_tag_max = self.MAX_VLAN
+            self.s_tag_rank = self.MAX_VLAN + 1
         else:
-            pass
+            if (len(intervals) == 1) and (intervals[0][0] == intervals[0][1]):
+                self.s_tag_kind = "single"
+            else:
+                self.s_tag_kind = "range"
+            self.s_tag_min = intervals[0][0]
+            self.s_tag_max = intervals[-1][1]
+            self.s_tag_rank = sum([last - first + 1 for (first, last) in intervals])
+
+    def save(self, *args, **kwargs):
+        self.update_range_fields()
+        # Recording old_s_tag when s_tag is changed for a BNG instance. XOSBase keeps the values the instance was
+        # loaded with, so there is no need to query for the previous s_tag.
+        if self.id and self.has_field_changed("s_tag"):
+            self.old_s_tag = self.get_field_diff("s_tag")[0]
 
         super(BNGPortMapping, self).save(*args, **kwargs)
+
+    @classmethod
+    def bulk_save(cls, mappings):
+        """ Create or update many mappings at once. Every mapping is validated before any of them is written, and
+            they are written in a single transaction, so either all of them are saved or none are.
+        """
+        for mapping in mappings:
+            mapping.update_range_fields()
+
+        with transaction.atomic():
+            for mapping in mappings:
+                mapping.save()
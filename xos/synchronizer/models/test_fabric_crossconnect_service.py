@@ -0,0 +1,204 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import sys
+from mock import patch, Mock, PropertyMock
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class FakeServiceInstance(object):
+    """ A ServiceInstance that only has the attributes it is given, so that hasattr() behaves like it does on the
+        ORM wrappers.
+    """
+
+    def __init__(self, id, westbound=None, **kwargs):
+        self.id = id
+        self.westbound = westbound or []
+        self.westbound_walks = 0
+        for (k, v) in kwargs.items():
+            setattr(self, k, v)
+
+    @property
+    def westbound_service_instances(self):
+        self.westbound_walks += 1
+        return self.westbound
+
+
+class TestFabricCrossconnectService(unittest.TestCase):
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        sys.path.append(os.path.join(test_path, "convenience"))
+
+        from xosapi.orm import ORMWrapper
+        from fabric_crossconnect_service import ORMWrapperFabricCrossconnectService
+
+        # build the wrapper without a protobuf message behind it
+        with patch.object(ORMWrapper, "gen_fkmap", return_value={}), \
+                patch.object(ORMWrapper, "gen_reverse_fkmap", return_value={}), \
+                patch.object(ORMWrapper, "_dict", new_callable=PropertyMock, return_value={}):
+            self.stub = Mock()
+            self.service = ORMWrapperFabricCrossconnectService(Mock(id=1), self.stub)
+
+        # subscriber -> rg (switch_datapath_id) -> ServiceInstance -> onu (switch_port)
+        self.onu = FakeServiceInstance(11, switch_port=3)
+        self.si = FakeServiceInstance(12, westbound=[self.onu])
+        self.rg = FakeServiceInstance(12, switch_datapath_id="of:0000000000000201")
+        self.subscriber = FakeServiceInstance(13, westbound=[self.rg], s_tag="111")
+        self.stub.ServiceInstance.objects.get.return_value = self.si
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_get_westbound_properties(self):
+        props = self.service._get_westbound_properties(self.subscriber, ["s_tag", "switch_datapath_id", "switch_port"])
+
+        self.assertEqual(props, {"s_tag": "111", "switch_datapath_id": "of:0000000000000201", "switch_port": 3})
+        # the chain is walked once for all of the properties
+        self.assertEqual((self.subscriber.westbound_walks, self.si.westbound_walks), (1, 1))
+        self.stub.ServiceInstance.objects.get.assert_called_once_with(id=12)
+
+    def test_get_westbound_properties_memo(self):
+        memo = {}
+        other = FakeServiceInstance(14, westbound=[self.rg], s_tag="222")
+
+        self.service._get_westbound_properties(self.subscriber, ["switch_port"], memo)
+        props = self.service._get_westbound_properties(other, ["s_tag", "switch_port"], memo)
+
+        self.assertEqual(props, {"s_tag": "222", "switch_port": 3})
+        # the part of the chain the two subscribers share is only looked up once
+        self.assertEqual(self.stub.ServiceInstance.objects.get.call_count, 1)
+        self.assertEqual(self.si.westbound_walks, 1)
+
+    def test_get_westbound_properties_missing(self):
+        self.onu.westbound = []
+        del self.onu.switch_port
+        self.stub.ServiceInstance.objects.get.side_effect = lambda id: {12: self.si, 11: self.onu}[id]
+
+        with self.assertRaises(Exception) as e:
+            self.service._get_westbound_properties(self.subscriber, ["s_tag", "switch_port"])
+
+        self.assertEqual(e.exception.message, "ServiceInstance with id 11 has no westbound service instances, "
+                                              "can't find properties switch_port in the chain")
+
+    def test_get_west_fields(self):
+        self.assertEqual(self.service._get_west_fields(self.subscriber), (111, "of:0000000000000201", 3))
+
+        self.subscriber.s_tag = None
+        with self.assertRaises(Exception) as e:
+            self.service._get_west_fields(self.subscriber)
+        self.assertEqual(e.exception.message, "Subscriber ServiceInstance 13 s-tag is None")
+
+    def test_acquire_service_instances(self):
+        existing = Mock(id=200)
+        created = []
+
+        def filter(owner_id, s_tag, switch_datapath_id, source_port):
+            return [existing] if s_tag == 111 else []
+
+        def create(**kwargs):
+            created.append(Mock(**kwargs))
+            return created[-1]
+        self.stub.FabricCrossconnectServiceInstance.objects.filter.side_effect = filter
+        self.stub.FabricCrossconnectServiceInstance.side_effect = create
+
+        subscribers = [FakeServiceInstance(20 + i, westbound=[self.rg], s_tag=s_tag)
+                       for (i, s_tag) in enumerate(["111", "222", "111", "222", "333"])]
+        providers = self.service.acquire_service_instances(subscribers)
+
+        # one candidate query per (s_tag, switch_datapath_id, source_port), and one new instance per missing group
+        self.assertEqual(self.stub.FabricCrossconnectServiceInstance.objects.filter.call_count, 3)
+        self.assertEqual([c.s_tag for c in created], [222, 333])
+        self.assertEqual(providers, [existing, created[0], existing, created[0], created[1]])
+        for provider in created:
+            provider.save.assert_called_once_with()
+
+        links = self.stub.ServiceInstanceLink.call_args_list
+        self.assertEqual([(kwargs["subscriber_service_instance"].id, kwargs["provider_service_instance"])
+                          for (args, kwargs) in links],
+                         [(20, existing), (22, existing), (21, created[0]), (23, created[0]), (24, created[1])])
+        self.assertEqual(self.stub.ServiceInstanceLink.return_value.save.call_count, 5)
+        # the chain the subscribers share is only looked up once
+        self.assertEqual(self.stub.ServiceInstance.objects.get.call_count, 1)
+
+    def test_acquire_service_instances_incomplete(self):
+        subscribers = [FakeServiceInstance(20, westbound=[self.rg], s_tag="111"),
+                       FakeServiceInstance(21, westbound=[self.rg], s_tag=None)]
+
+        with self.assertRaises(Exception) as e:
+            self.service.acquire_service_instances(subscribers)
+
+        # nothing is written when one of the subscribers is not ready
+        self.assertEqual(e.exception.message, "Subscriber ServiceInstance 21 s-tag is None")
+        self.stub.FabricCrossconnectServiceInstance.objects.filter.assert_not_called()
+        self.stub.ServiceInstanceLink.assert_not_called()
+
+    def test_acquire_service_instance(self):
+        self.stub.FabricCrossconnectServiceInstance.objects.filter.return_value = []
+
+        provider = self.service.acquire_service_instance(self.subscriber)
+
+        self.assertEqual(provider, self.stub.FabricCrossconnectServiceInstance.return_value)
+        self.stub.FabricCrossconnectServiceInstance.assert_called_once_with(
+            owner=self.service, s_tag=111, switch_datapath_id="of:0000000000000201", source_port=3)
+        self.stub.ServiceInstanceLink.assert_called_once_with(provider_service_instance=provider,
+                                                              subscriber_service_instance=self.subscriber)
+
+    def test_validate_links(self):
+        self.subscriber.subscribed_links = Mock()
+        fcsis = [Mock(id=100, owner_id=1, s_tag=111, switch_datapath_id="of:0000000000000201", source_port=3),
+                 Mock(id=101, owner_id=1, s_tag=222, switch_datapath_id="of:0000000000000201", source_port=3),
+                 Mock(id=102, owner_id=2, s_tag=111, switch_datapath_id="of:0000000000000201", source_port=3)]
+        links = [Mock(provider_service_instance_id=100),
+                 Mock(provider_service_instance_id=101),
+                 Mock(provider_service_instance_id=102),
+                 Mock(provider_service_instance_id=500)]
+        self.stub.ServiceInstanceLink.objects.filter.return_value = links
+        self.stub.FabricCrossconnectServiceInstance.objects.filter.side_effect = \
+            lambda owner_id: [fcsi for fcsi in fcsis if fcsi.owner_id == owner_id]
+
+        matched = self.service.validate_links(self.subscriber)
+
+        self.assertEqual(matched, [fcsis[0]])
+        # the link to fcsis[1] no longer matches, and the links to other services' instances are left alone
+        links[0].delete.assert_not_called()
+        links[1].delete.assert_called_once_with()
+        links[2].delete.assert_not_called()
+        links[3].delete.assert_not_called()
+
+        # one query for the links and one for the instances of the service, rather than one for each provider
+        self.stub.ServiceInstanceLink.objects.filter.assert_called_once_with(subscriber_service_instance_id=13)
+        self.stub.FabricCrossconnectServiceInstance.objects.filter.assert_called_once_with(owner_id=1)
+        self.subscriber.subscribed_links.all.assert_not_called()
+
+    def test_validate_links_none(self):
+        self.subscriber.subscribed_links = Mock()
+        self.subscriber.subscribed_links.exists.return_value = False
+
+        self.assertIsNone(self.service.validate_links(self.subscriber))
+        self.stub.ServiceInstanceLink.objects.filter.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import imp
 import unittest
 import os
 import sys
@@ -45,7 +46,11 @@ class TestFabricCrossconnectModels(unittest.TestCase):
         self.models_decl.BNGPortMapping_decl.objects = Mock()
         self.models_decl.BNGPortMapping_decl.objects.filter.return_value = []
 
+        self.django_db = MagicMock()
+
         modules = {
+            'django': MagicMock(),
+            'django.db': self.django_db,
             'xos': MagicMock(),
             'xos.exceptions': self.xos.exceptions,
             'models_decl': self.models_decl
@@ -56,8 +61,11 @@ class TestFabricCrossconnectModels(unittest.TestCase):
 
         self.volt = Mock()
 
+        import models
+        reload(models)  # bind the mocked modules of this test
         from models import BNGPortMapping
 
+        self.BNGPortMappingClass = BNGPortMapping
         self.BNGPortMapping = BNGPortMapping()
 
     def tearDown(self):
@@ -120,5 +128,159 @@ class TestFabricCrossconnectModels(unittest.TestCase):
         self.assertEqual(e.exception.message, 'Malformed range 123,')
 
 
+    def test_validate_reversed_range(self):
+        bpm = self.BNGPortMapping()
+        with self.assertRaises(Exception) as e:
+            bpm.validate_range("456-123")
+
+        self.assertEqual(e.exception.message, 'Malformed range 456-123')
+
+    def test_validate_out_of_range(self):
+        bpm = self.BNGPortMapping()
+        with self.assertRaises(Exception) as e:
+            bpm.validate_range("100, 4096")
+
+        self.assertEqual(e.exception.message, 'Malformed range 100, 4096')
+
+    def test_parse_range_merges(self):
+        bpm = self.BNGPortMapping()
+        self.assertEqual(bpm.parse_range("300, 100-200, 150-250, 251"), (False, [(100, 251), (300, 300)]))
+        self.assertEqual(bpm.parse_range("ANY"), (True, []))
+
+    def parse_all(self, parse, patterns):
+        results = []
+        for pattern in patterns:
+            try:
+                results.append(parse(pattern))
+            except Exception:
+                results.append(None)
+        return results
+
+    PATTERNS = ["222", "0", "4095", "4096", "-1", "220-225, 230", "300, 100-200, 150-250, 251", "456-123", "1-4096",
+                "ANY", "any, 100", "", "123-", "123,", "badstring", " 7 - 9 "]
+
+    def test_grammar_matches_synchronizer(self):
+        # the synchronizer's copy of the grammar must accept and merge exactly the same patterns
+        s_tag_pattern = imp.load_source("s_tag_pattern_grammar", os.path.join(test_path, "../steps/s_tag_pattern.py"))
+        parse_s_tag_pattern = s_tag_pattern.parse_s_tag_pattern
+
+        def parse(pattern):
+            compiled = parse_s_tag_pattern(pattern)
+            return (compiled.is_any, list(compiled.intervals))
+
+        def parse_range(pattern):
+            # a pattern with "ANY" matches every s-tag, whatever else it lists
+            (is_any, intervals) = bpm.parse_range(pattern)
+            return (is_any, [(0, 4095)] if is_any else intervals)
+
+        bpm = self.BNGPortMapping()
+        self.assertEqual(self.parse_all(parse, self.PATTERNS), self.parse_all(parse_range, self.PATTERNS))
+
+    def load_migration(self):
+        with patch.dict('sys.modules', {'django': MagicMock(), 'django.db': MagicMock()}):
+            return imp.load_source("s_tag_range_migration",
+                                   os.path.join(test_path, "../migrations/0006_bngportmapping_decl_s_tag_range.py"))
+
+    def test_grammar_matches_migration(self):
+        migration = self.load_migration()
+        bpm = self.BNGPortMapping()
+        self.assertEqual(self.parse_all(migration.parse_range, self.PATTERNS),
+                         self.parse_all(bpm.parse_range, self.PATTERNS))
+
+    def test_migration_flags_malformed(self):
+        migration = self.load_migration()
+        mappings = [Mock(id=1, s_tag="100-200"), Mock(id=2, s_tag="456-123"), Mock(id=3, s_tag="5000")]
+        apps = Mock()
+        BNGPortMapping = apps.get_model.return_value
+        BNGPortMapping.objects.all.return_value = mappings
+
+        with patch("sys.stdout") as stdout:
+            migration.populate_s_tag_range(apps, None)
+
+        BNGPortMapping.objects.filter.assert_called_once_with(id=1)
+        BNGPortMapping.objects.filter.return_value.update.assert_called_once_with(
+            s_tag_kind="range", s_tag_min=100, s_tag_max=200, s_tag_rank=101)
+        output = "".join([args[0] for (args, kwargs) in stdout.write.call_args_list])
+        self.assertIn("BNGPortMapping 2 has malformed s_tag '456-123'", output)
+        self.assertIn("BNGPortMapping 3 has malformed s_tag '5000'", output)
+
+    def test_update_range_fields(self):
+        bpm = self.BNGPortMapping()
+        for (s_tag, kind, s_tag_min, s_tag_max, rank) in [("222", "single", 222, 222, 1),
+                                                            ("220-225, 230", "range", 220, 230, 7),
+                                                            ("ANY", "any", 0, 4095, 4096)]:
+            bpm.s_tag = s_tag
+            bpm.update_range_fields()
+            self.assertEqual((bpm.s_tag_kind, bpm.s_tag_min, bpm.s_tag_max, bpm.s_tag_rank),
+                             (kind, s_tag_min, s_tag_max, rank))
+
+    def test_save_old_s_tag(self):
+        bpm = self.BNGPortMapping()
+        bpm.id = 1
+        bpm.old_s_tag = None
+        bpm.s_tag = "200-300"
+        bpm.has_field_changed = Mock(return_value=True)
+        bpm.get_field_diff = Mock(return_value=("100", "200-300"))
+
+        bpm.save()
+
+        self.assertEqual(bpm.old_s_tag, "100")
+        bpm.has_field_changed.assert_called_with("s_tag")
+        # XOSBase knows the previous s_tag, there is no need to ask the database
+        self.models_decl.BNGPortMapping_decl.objects.filter.assert_not_called()
+
+    def test_save_s_tag_unchanged(self):
+        bpm = self.BNGPortMapping()
+        bpm.id = 1
+        bpm.old_s_tag = None
+        bpm.s_tag = "100"
+        bpm.has_field_changed = Mock(return_value=False)
+
+        bpm.save()
+
+        self.assertIsNone(bpm.old_s_tag)
+
+    def test_save_new(self):
+        bpm = self.BNGPortMapping()
+        bpm.id = None
+        bpm.old_s_tag = None
+        bpm.s_tag = "100"
+        bpm.has_field_changed = Mock(return_value=True)
+
+        bpm.save()
+
+        self.assertIsNone(bpm.old_s_tag)
+
+    def test_bulk_save(self):
+        s_tags = ["100", "200-300", "ANY"]
+        mappings = [self.BNGPortMappingClass() for s_tag in s_tags]
+        for (mapping, s_tag) in zip(mappings, s_tags):
+            mapping.id = None
+            mapping.s_tag = s_tag
+
+        with patch.object(self.BNGPortMappingClass, "save") as save:
+            self.BNGPortMappingClass.bulk_save(mappings)
+
+            self.assertEqual(save.call_count, 3)
+        self.django_db.transaction.atomic.assert_called_once_with()
+        self.assertEqual([m.s_tag_kind for m in mappings], ["single", "range", "any"])
+        self.assertEqual([m.s_tag_rank for m in mappings], [1, 101, 4096])
+
+    def test_bulk_save_invalid(self):
+        s_tags = ["100", "bad"]
+        mappings = [self.BNGPortMappingClass() for s_tag in s_tags]
+        for (mapping, s_tag) in zip(mappings, s_tags):
+            mapping.s_tag = s_tag
+
+        with patch.object(self.BNGPortMappingClass, "save") as save:
+            with self.assertRaises(Exception) as e:
+                self.BNGPortMappingClass.bulk_save(mappings)
+
+            # nothing is written if any of the mappings is invalid
+            self.assertEqual(e.exception.message, "Malformed range bad")
+            save.assert_not_called()
+        self.django_db.transaction.atomic.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
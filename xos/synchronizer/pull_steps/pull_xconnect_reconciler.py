@@ -0,0 +1,48 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from xossynchronizer.pull_steps.pullstep import PullStep
+from xosconfig import Config
+from multistructlog import create_logger
+
+# xconnect_reconciler lives in the steps directory, which the synchronizer adds to sys.path when it loads the steps
+from xconnect_reconciler import XconnectReconciler
+
+log = create_logger(Config().get('logging'))
+
+# The pull step engine creates a new instance of the step every five seconds, so the time of the last
+# reconciliation is kept here.
+_last_reconciled = {"time": 0}
+
+
+class XconnectReconcilerPullStep(PullStep):
+    """ Periodically reconciles the xconnects in ONOS with the FabricCrossconnectServiceInstances in XOS """
+
+    interval = 300
+
+    def __init__(self, model_accessor):
+        super(XconnectReconcilerPullStep, self).__init__(model_accessor=model_accessor)
+
+    def pull_records(self):
+        if time.time() - _last_reconciled["time"] < self.interval:
+            return
+        _last_reconciled["time"] = time.time()
+
+        try:
+            stats = XconnectReconciler(self.model_accessor).reconcile()
+            log.info("Reconciled ONOS xconnects", **stats)
+        except Exception as e:
+            log.exception("Failed to reconcile ONOS xconnects", error=str(e))
@@ -0,0 +1,69 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import patch, Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestPullXconnectReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        # the synchronizer puts the steps directory on sys.path before loading the pull steps
+        sys.path.append(os.path.join(test_path, "../steps"))
+
+        import pull_xconnect_reconciler
+        self.module = pull_xconnect_reconciler
+        self.module._last_reconciled["time"] = 0
+
+        self.model_accessor = Mock()
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_pull_records(self):
+        with patch.object(self.module, "XconnectReconciler") as reconciler:
+            reconciler.return_value.reconcile.return_value = {"missing": 1}
+
+            self.module.XconnectReconcilerPullStep(model_accessor=self.model_accessor).pull_records()
+            reconciler.assert_called_with(self.model_accessor)
+            self.assertEqual(reconciler.return_value.reconcile.call_count, 1)
+
+            # the next pull inside the interval does nothing
+            self.module.XconnectReconcilerPullStep(model_accessor=self.model_accessor).pull_records()
+            self.assertEqual(reconciler.return_value.reconcile.call_count, 1)
+
+    def test_pull_records_exception(self):
+        with patch.object(self.module, "XconnectReconciler") as reconciler:
+            reconciler.return_value.reconcile.side_effect = Exception("ONOS is down")
+
+            self.module.XconnectReconcilerPullStep(model_accessor=self.model_accessor).pull_records()
+            self.assertEqual(reconciler.return_value.reconcile.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
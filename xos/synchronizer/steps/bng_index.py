@@ -0,0 +1,164 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from s_tag_pattern import compile_s_tag_pattern, VLAN_COUNT
+from metrics import get_metrics
+
+log = create_logger(Config().get('logging'))
+
+
+KIND_ORDER = {"single": 0, "range": 1, "any": 2}
+
+
+def mapping_precedence(pattern, bng_mapping):
+    """ Sort key that puts the most specific BNGPortMapping first: single s-tags, then ranges from the narrowest to
+        the widest, then "ANY". Ties go to the oldest mapping.
+    """
+    return (pattern.count, KIND_ORDER[pattern.kind], bng_mapping.id)
+
+
+class BNGPortMappingIndex(object):
+    """ In-process index from s-tag to BNGPortMapping.
+
+        All BNGPortMapping rows are expanded once into a table with one slot per VLAN id, so resolving the mapping
+        for an s-tag is a list lookup rather than a walk over every mapping. The table is rebuilt lazily, either
+        after invalidate() has been called or once it is older than max_age seconds.
+
+        When the table has no mapping for an s-tag, the database is asked for the mappings whose s_tag_min and
+        s_tag_max bound it, in case one was created after the table was built. An s-tag the database has no mapping
+        for either is remembered as a miss until the next invalidate() or rebuild.
+
+        The lock only guards swapping the table in and out. Building it and asking the database happen outside of
+        it, so lookups that hit the table don't wait behind them.
+    """
+
+    max_age = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table = None
+        self.any_mapping = None
+        self.built_at = 0
+        self.misses = set()
+        # bumped by invalidate(), so that a table or miss found before it isn't installed after it
+        self.generation = 0
+
+    def invalidate(self):
+        with self.lock:
+            self.table = None
+            self.misses = set()
+            self.generation += 1
+
+    def build(self, model):
+        """ Return (table, any_mapping) for the current BNGPortMapping rows """
+        patterns = []
+        for bng_mapping in model.objects.all():
+            try:
+                patterns.append((compile_s_tag_pattern(bng_mapping.s_tag), bng_mapping))
+            except ValueError:
+                # not MalformedSTagPattern: imp.load_source can load s_tag_pattern twice, each with its own class
+                log.error("Ignoring BNGPortMapping with malformed s_tag", s_tag=bng_mapping.s_tag)
+        patterns.sort(key=lambda item: mapping_precedence(*item))
+
+        table = [None] * VLAN_COUNT
+        any_mapping = None
+        for (pattern, bng_mapping) in patterns:
+            if pattern.is_any and (any_mapping is None):
+                any_mapping = bng_mapping
+            for vlan in pattern.vlans():
+                if table[vlan] is None:
+                    table[vlan] = bng_mapping
+
+        log.info("Built BNGPortMapping index", mappings=len(patterns))
+        get_metrics().bng_index_builds.inc()
+
+        return (table, any_mapping)
+
+    def find_candidates(self, model, s_tag):
+        """ Ask the database for the mappings whose bounds include s_tag, and return the most specific match """
+        if 0 <= s_tag < VLAN_COUNT:
+            bng_mappings = model.objects.filter(s_tag_min__lte=s_tag, s_tag_max__gte=s_tag)
+        else:
+            # only "ANY" covers s-tags outside of the VLAN range, and its bounds are those of the VLAN range
+            bng_mappings = model.objects.filter(s_tag_kind="any")
+        candidates = []
+        for bng_mapping in bng_mappings:
+            try:
+                pattern = compile_s_tag_pattern(bng_mapping.s_tag)
+            except ValueError:
+                continue
+            if pattern.matches(s_tag):
+                candidates.append((pattern, bng_mapping))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda item: mapping_precedence(*item))[1]
+
+    def lookup(self, model, s_tag):
+        """ Return the BNGPortMapping that s_tag resolves to, or None """
+        bng_mapping = self.resolve(model, int(s_tag))
+        get_metrics().bng_lookups.inc(result="hit" if bng_mapping is not None else "miss")
+        return bng_mapping
+
+    def resolve(self, model, s_tag):
+        with self.lock:
+            (table, any_mapping, generation) = (self.table, self.any_mapping, self.generation)
+            stale = (table is None) or (time.time() - self.built_at > self.max_age)
+
+        if stale:
+            (table, any_mapping) = self.build(model)
+            with self.lock:
+                if self.generation == generation:
+                    (self.table, self.any_mapping, self.built_at) = (table, any_mapping, time.time())
+                    self.misses = set()
+
+        # only "ANY" covers s-tags outside of the VLAN range, so they all share one slot
+        in_range = 0 <= s_tag < VLAN_COUNT
+        slot = s_tag if in_range else None
+        bng_mapping = table[s_tag] if in_range else any_mapping
+        if bng_mapping is not None:
+            return bng_mapping
+
+        with self.lock:
+            current = self.generation == generation
+            if current and stale:
+                # the table was just built, so the database has nothing more to say about this s-tag
+                self.misses.add(slot)
+            if current and (slot in self.misses):
+                return None
+
+        bng_mapping = self.find_candidates(model, s_tag)
+        get_metrics().bng_fallback_scans.inc(result="found" if bng_mapping is not None else "not_found")
+        with self.lock:
+            if self.generation == generation:
+                if bng_mapping is None:
+                    self.misses.add(slot)
+                else:
+                    # the table is missing a mapping that was added since it was built
+                    self.table = None
+                    self.misses = set()
+                    self.generation += 1
+        return bng_mapping
+
+
+_bng_index = BNGPortMappingIndex()
+
+
+def get_bng_index():
+    return _bng_index
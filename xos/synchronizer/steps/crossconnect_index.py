@@ -0,0 +1,105 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class CrossconnectIndex(object):
+    """ Reverse index from s-tag to FabricCrossconnectServiceInstance id.
+
+        The index is a pair of parallel integer arrays sorted by (s_tag, id), so a BNGPortMapping pattern can be
+        resolved to the crossconnects it covers with one bisect per interval, and tens of thousands of instances
+        cost a few hundred kilobytes. It is built from the database the first time it is needed and kept current by
+        SyncFabricCrossconnectServiceInstance as instances are synced and deleted. Instances that are created or
+        changed without going through this synchronizer are picked up when it is rebuilt, either after invalidate()
+        has been called or once it is older than max_age seconds.
+    """
+
+    max_age = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.s_tags = None
+        self.ids = None
+        self.built_at = 0
+
+    def invalidate(self):
+        with self.lock:
+            self.s_tags = None
+            self.ids = None
+
+    def build(self, model):
+        entries = sorted([(int(fcsi.s_tag), fcsi.id) for fcsi in model.objects.all() if fcsi.s_tag is not None])
+        self.s_tags = array("i", [s_tag for (s_tag, fcsi_id) in entries])
+        self.ids = array("i", [fcsi_id for (s_tag, fcsi_id) in entries])
+        self.built_at = time.time()
+        log.info("Built crossconnect index", crossconnects=len(entries))
+
+    def _remove(self, fcsi_id):
+        try:
+            pos = self.ids.index(fcsi_id)
+        except ValueError:
+            return
+        del self.s_tags[pos]
+        del self.ids[pos]
+
+    def add(self, fcsi_id, s_tag):
+        """ Record that crossconnect fcsi_id uses s_tag, replacing any previous entry for it """
+        with self.lock:
+            if self.ids is None:
+                # not built yet, the instance will be picked up when it is
+                return
+            self._remove(fcsi_id)
+            s_tag = int(s_tag)
+            lo = bisect_left(self.s_tags, s_tag)
+            hi = bisect_right(self.s_tags, s_tag)
+            pos = lo + bisect_left(self.ids[lo:hi], fcsi_id)
+            self.s_tags.insert(pos, s_tag)
+            self.ids.insert(pos, fcsi_id)
+
+    def remove(self, fcsi_id):
+        with self.lock:
+            if self.ids is not None:
+                self._remove(fcsi_id)
+
+    def find(self, model, pattern):
+        """ Return a list of (s_tag, id) for the crossconnects whose s-tag matches the compiled pattern """
+        with self.lock:
+            if (self.ids is None) or (time.time() - self.built_at > self.max_age):
+                self.build(model)
+
+            if pattern.is_any:
+                return zip(self.s_tags, self.ids)
+
+            matches = []
+            for (first, last) in pattern.intervals:
+                lo = bisect_left(self.s_tags, first)
+                hi = bisect_right(self.s_tags, last)
+                matches.extend(zip(self.s_tags[lo:hi], self.ids[lo:hi]))
+            return matches
+
+
+_crossconnect_index = CrossconnectIndex()
+
+
+def get_crossconnect_index():
+    return _crossconnect_index
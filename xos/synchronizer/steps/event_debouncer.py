@@ -0,0 +1,115 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class EventDebouncer(object):
+    """ Collapses bursts of events into one call per key.
+
+        submit(key, callback) schedules callback to run `delay` seconds later. If another event for the same key
+        arrives before then, the pending callback is replaced by the new one and the timer starts again, so a burst
+        results in a single call once the events have settled. To keep a key that never settles from being
+        starved, the callback runs anyway once `max_delay` seconds have passed since the first event of the burst.
+
+        With a delay of 0 the callback is run straight away, in the caller's thread.
+    """
+
+    delay = 5
+    max_delay = 30
+
+    def __init__(self, delay=None, max_delay=None):
+        if delay is not None:
+            self.delay = delay
+        if max_delay is not None:
+            self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.received = 0
+        self.suppressed = 0
+        self.suppressed_by_key = {}
+
+    def submit(self, key, callback, delay=None):
+        """ Schedule callback for key, returning False if it replaced a callback that was already pending. delay
+            overrides the debouncer's own for this event.
+        """
+        if delay is None:
+            delay = self.delay
+        with self.lock:
+            self.received += 1
+            if delay <= 0:
+                pending = None
+            else:
+                pending = self.pending.get(key)
+                first = time.time()
+                if pending is not None:
+                    (timer, first) = pending
+                    timer.cancel()
+                    self.suppressed += 1
+                    self.suppressed_by_key[key] = self.suppressed_by_key.get(key, 0) + 1
+                    log.info("Suppressing event", key=key, suppressed=self.suppressed_by_key[key])
+
+                timer = threading.Timer(max(0, min(delay, first + self.max_delay - time.time())), self.fire,
+                                        args=(key, callback))
+                timer.daemon = True
+                self.pending[key] = (timer, first)
+                timer.start()
+
+        if delay <= 0:
+            self.call(key, callback)
+        return pending is None
+
+    def fire(self, key, callback):
+        with self.lock:
+            pending = self.pending.get(key)
+            if (pending is None) or (pending[0] is not threading.current_thread()):
+                # replaced by a later event after the timer went off
+                return
+            del self.pending[key]
+        self.call(key, callback)
+
+    def call(self, key, callback):
+        try:
+            callback()
+        except Exception as e:
+            log.exception("Failed to process debounced event", key=key, error=str(e))
+
+    def flush(self):
+        """ Run every pending callback now, rather than when its timer goes off """
+        with self.lock:
+            pending = self.pending.items()
+            self.pending = {}
+        for (key, (timer, first)) in pending:
+            timer.cancel()
+            self.call(key, timer.args[1])
+
+    def stats(self):
+        with self.lock:
+            return {"received": self.received,
+                    "suppressed": self.suppressed,
+                    "pending": len(self.pending),
+                    "suppressed_by_key": dict(self.suppressed_by_key)}
+
+
+_pod_event_debouncer = EventDebouncer()
+
+
+def get_pod_event_debouncer():
+    return _pod_event_debouncer
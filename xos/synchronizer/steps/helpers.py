@@ -16,6 +16,10 @@ from __future__ import absolute_import
 from xosconfig import Config
 from multistructlog import create_logger
 
+from s_tag_pattern import compile_s_tag_pattern
+from onos_client import get_onos_client
+from onos_endpoints import get_onos_endpoints
+
 log = create_logger(Config().get('logging'))
 
 class Helpers():
@@ -28,13 +32,14 @@ class Helpers():
             return 'http://%s' % url
 
     @staticmethod
-    def get_fabric_onos_info(model_accessor, service):
+    def resolve_fabric_onos_info(model_accessor, service):
         fabric_onos = [s.leaf_model for s in service.provider_services if "onos" in s.name.lower()]
         if len(fabric_onos) == 0:
             raise Exception('Cannot find ONOS service in provider_services of Fabric-Crossconnect')
 
         fabric_onos = fabric_onos[0]
         return {
+            'name': fabric_onos.name,
             'url': Helpers.format_url(
                 "%s:%s" %
                 (fabric_onos.rest_hostname,
@@ -42,16 +47,36 @@ class Helpers():
                 'user': fabric_onos.rest_username,
                 'pass': fabric_onos.rest_password}
 
+    @staticmethod
+    def get_fabric_onos_info(model_accessor, service):
+        return get_onos_endpoints().get(service.id, lambda: Helpers.resolve_fabric_onos_info(model_accessor, service))
+
+    @staticmethod
+    def get_fabric_onos_client(model_accessor, service):
+        return get_onos_client(Helpers.get_fabric_onos_info(model_accessor, service))
+
+    @staticmethod
+    def get_instance_onos_client(model_accessor, service_instance):
+        """ Return the ONOS client for the owner of service_instance. The owner is only loaded if its ONOS is not
+            cached already.
+        """
+        info = get_onos_endpoints().get(
+            service_instance.owner_id,
+            lambda: Helpers.resolve_fabric_onos_info(model_accessor, service_instance.owner))
+        return get_onos_client(info)
+
+    @staticmethod
+    def extract_handle(backend_handle):
+        # backend_handle of a FabricCrossconnectServiceInstance is "<s_tag>/<switch_datapath_id>"
+        (s_tag, switch_datapath_id) = backend_handle.split("/", 1)
+        s_tag = int(s_tag)
+        return (s_tag, switch_datapath_id)
+
+    @staticmethod
+    def make_fingerprint(data):
+        # Fingerprint of an xconnect, stored after a successful push so that an identical push can be skipped.
+        return "%s/%d/%s" % (data["deviceId"], data["vlanId"], ",".join([str(port) for port in data["endpoints"]]))
+
     @staticmethod
     def range_matches(value, pattern):
-        value = int(value)
-        for this_range in pattern.split(","):
-            this_range = this_range.strip()
-            if "-" in this_range:
-                (first, last) = this_range.split("-")
-                first = int(first.strip())
-                last = int(last.strip())
-                if (value >= first) and (value <= last):
-                    return True
-            elif this_range.lower() == "any":
-                return False
+        return compile_s_tag_pattern(pattern).matches(value)
@@ -0,0 +1,298 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from xossynchronizer.steps.syncstep import DeferredException
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for (k, v) in labels]
+    return "{%s}" % ",".join(['%s="%s"' % (k, v) for (k, v) in escaped])
+
+
+class Metric(object):
+    """ Base of Counter and Histogram: a named family of series, one per combination of label values """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def key(self, labels):
+        if set(labels.keys()) != set(self.labelnames):
+            raise ValueError("Metric %s takes labels %s, not %s" % (self.name, self.labelnames, sorted(labels.keys())))
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def samples(self):
+        """ Return a list of (suffix, labels, value), labels being a list of (name, value) """
+        raise NotImplementedError
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.type)]
+        for (suffix, labels, value) in self.samples():
+            lines.append("%s%s%s %s" % (self.name, suffix, format_labels(labels), format_value(value)))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.series.get(self.key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [("", zip(self.labelnames, key), value) for (key, value) in sorted(self.series.items())]
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # counts per bucket, not cumulative, then the sum of the values
+                series = self.series[key] = [[0] * len(self.buckets), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        with self.lock:
+            series = self.series.get(self.key(labels))
+            return sum(series[0]) if series else 0
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for (key, (counts, total)) in sorted(self.series.items()):
+                labels = zip(self.labelnames, key)
+                cumulative = 0
+                for (bound, count) in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(("_bucket", labels + [("le", format_value(bound))], cumulative))
+                samples.append(("_sum", labels, total))
+                samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Metrics(object):
+    """ The metrics of the synchronizer, rendered in the Prometheus text format by render().
+
+        onos_request_seconds ...... every request to ONOS, retries included, by method and status code ("error"
+                                    when no response was received)
+        sync_seconds .............. sync_record and delete_record of each sync step, by result
+        xconnect_pushes ........... xconnects pushed by SyncFabricCrossconnectServiceInstance, or skipped because
+                                    ONOS already had them
+        bng_lookups ............... BNGPortMapping index lookups, by whether they resolved to a mapping
+        bng_fallback_scans ........ lookups that missed the index and asked the database instead
+        bng_index_builds .......... rebuilds of the BNGPortMapping index
+        event_seconds ............. processing of events by the event steps, including the resynchronization that
+                                    KubernetesPodDetailsEventStep debounces
+    """
+
+    def __init__(self):
+        self.onos_request_seconds = Histogram("fabric_crossconnect_onos_request_seconds",
+                                              "Time taken by requests to ONOS", ["method", "status"])
+        self.sync_seconds = Histogram("fabric_crossconnect_sync_seconds",
+                                      "Time taken by sync_record and delete_record", ["step", "operation", "result"])
+        self.xconnect_pushes = Counter("fabric_crossconnect_xconnect_pushes_total",
+                                       "Xconnects pushed to ONOS, or skipped as already pushed", ["result"])
+        self.bng_lookups = Counter("fabric_crossconnect_bng_lookups_total",
+                                   "BNGPortMapping lookups by s-tag", ["result"])
+        self.bng_fallback_scans = Counter("fabric_crossconnect_bng_fallback_scans_total",
+                                          "BNGPortMapping lookups that fell back to a database query", ["result"])
+        self.bng_index_builds = Counter("fabric_crossconnect_bng_index_builds_total",
+                                        "Rebuilds of the BNGPortMapping index")
+        self.event_seconds = Histogram("fabric_crossconnect_event_seconds",
+                                       "Time taken to process events", ["step", "operation", "result"])
+
+    def all(self):
+        return [self.onos_request_seconds, self.sync_seconds, self.xconnect_pushes, self.bng_lookups,
+                self.bng_fallback_scans, self.bng_index_builds, self.event_seconds]
+
+    def render(self):
+        return "\n".join([metric.render() for metric in self.all()]) + "\n"
+
+    def reset(self):
+        for metric in self.all():
+            metric.reset()
+
+
+def timed(histogram, operation):
+    """ Decorator that records how long a step method takes in the histogram of get_metrics() named histogram,
+        labelled with the class of the step, the operation and whether the method returned ("success"), deferred
+        ("deferred") or raised ("error").
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(step, *args, **kwargs):
+            start = time.time()
+            result = "error"
+            try:
+                value = f(step, *args, **kwargs)
+                result = "success"
+                return value
+            except DeferredException:
+                result = "deferred"
+                raise
+            finally:
+                getattr(get_metrics(), histogram).observe(time.time() - start, step=type(step).__name__,
+                                                          operation=operation, result=result)
+        return wrapper
+    return decorator
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = get_metrics().render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MetricsExporter(object):
+    """ Exposes the metrics to Prometheus, on http://<host>:<port>/metrics if port is set, and by rewriting path
+        every interval seconds if path is set, for node_exporter's textfile collector.
+
+        The metrics are always read through get_metrics(), since the synchronizer loads this module again along
+        with the sync steps. The defaults come from the METRICS_PORT, METRICS_HOST, METRICS_FILE and
+        METRICS_INTERVAL environment variables, since the synchronizer config does not allow settings of its own.
+        A METRICS_PORT of 0 turns the endpoint off. The endpoint only listens on localhost unless METRICS_HOST says
+        otherwise.
+    """
+
+    port = 9101
+    host = "127.0.0.1"
+    path = None
+    interval = 15
+
+    def __init__(self, port=None, host=None, path=None, interval=None):
+        self.port = int(os.environ.get("METRICS_PORT", self.port)) if port is None else port
+        self.host = os.environ.get("METRICS_HOST", self.host) if host is None else host
+        self.path = os.environ.get("METRICS_FILE", self.path) if path is None else path
+        self.interval = float(os.environ.get("METRICS_INTERVAL", self.interval)) if interval is None else interval
+        self.server = None
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def start(self):
+        if self.port:
+            self.server = MetricsHTTPServer((self.host, self.port), MetricsRequestHandler)
+            self.start_thread(self.server.serve_forever, "metrics-http")
+            log.info("Serving metrics", host=self.host, port=self.server.server_address[1])
+        if self.path:
+            self.start_thread(self.run_file_exporter, "metrics-file")
+            log.info("Writing metrics", path=self.path, interval=self.interval)
+        return self
+
+    def write_file(self):
+        # write then rename, so that the collector never reads a partial file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(get_metrics().render())
+        os.rename(tmp_path, self.path)
+
+    def run_file_exporter(self):
+        while not self.stopped.is_set():
+            try:
+                self.write_file()
+            except Exception as e:
+                log.error("Failed to write metrics", path=self.path, error=str(e))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def start_metrics_exporter(**kwargs):
+    return MetricsExporter(**kwargs).start()
@@ -0,0 +1,127 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from metrics import get_metrics
+
+log = create_logger(Config().get('logging'))
+
+
+class ONOSClient(object):
+    """ REST client for one ONOS endpoint.
+
+        All requests go through a single requests.Session, so connections to ONOS are pooled and kept alive between
+        xconnect operations instead of paying a new TCP handshake each time. Every request has a connect and a read
+        timeout, and requests that fail with a connection error, a timeout or a 502/503/504 are retried with
+        jittered exponential backoff. The segmentrouting xconnect calls are idempotent, so retrying a POST or DELETE
+        is safe.
+
+        The defaults below can be overridden per client through the constructor.
+    """
+
+    connect_timeout = 5
+    read_timeout = 30
+    retries = 3
+    backoff = 0.5
+    max_backoff = 8
+    pool_size = 10
+    retry_status_codes = (502, 503, 504)
+
+    def __init__(self, url, user, password, **kwargs):
+        for (k, v) in kwargs.items():
+            if not hasattr(ONOSClient, k):
+                raise TypeError("Unknown ONOSClient option %s" % k)
+            setattr(self, k, v)
+
+        self.url = url
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request_budget(self):
+        """ The longest request() can take: every attempt timing out, with the longest backoff between them """
+        backoffs = sum([min(self.max_backoff, self.backoff * (2 ** attempt)) for attempt in range(self.retries)])
+        return (self.connect_timeout + self.read_timeout) * (self.retries + 1) + backoffs
+
+    def request(self, method, path, **kwargs):
+        url = self.url + path
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                get_metrics().onos_request_seconds.observe(time.time() - start, method=method, status="error")
+                if attempt >= self.retries:
+                    raise
+                log.warning("ONOS request failed, retrying", method=method, url=url, attempt=attempt, error=str(e))
+            else:
+                get_metrics().onos_request_seconds.observe(time.time() - start, method=method, status=r.status_code)
+                if (r.status_code not in self.retry_status_codes) or (attempt >= self.retries):
+                    return r
+                log.warning("ONOS request failed, retrying", method=method, url=url, attempt=attempt,
+                            status_code=r.status_code)
+            time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_onos_client(onos):
+    """ Return the shared ONOSClient for an onos dict, as returned by Helpers.get_fabric_onos_info """
+    key = (onos['url'], onos['user'], onos['pass'])
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ONOSClient(onos['url'], onos['user'], onos['pass'])
+            _clients[key] = client
+        return client
+
+
+def close_onos_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
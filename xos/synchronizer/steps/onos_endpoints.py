@@ -0,0 +1,114 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class ONOSEndpointCache(object):
+    """ Cache from FabricCrossconnectService id to the connection info of its ONOS.
+
+        Resolving the ONOS of a service walks its provider_services and loads their leaf models, which costs several
+        round trips to the core. The result is kept until invalidate() is called, which ONOSServiceEventStep does when
+        an ONOS service or a service dependency changes, or for at most ttl seconds in case such an event is missed.
+    """
+
+    ttl = 300
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.generation = 0
+
+    def get(self, service_id, resolve):
+        """ Return the cached info for service_id, calling resolve() to compute it if there is none """
+        with self.lock:
+            entry = self.entries.get(service_id)
+            if (entry is not None) and (time.time() - entry[0] <= self.ttl):
+                return entry[1]
+            generation = self.generation
+
+        resolved_at = time.time()
+        info = resolve()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[service_id] = (resolved_at, info)
+        return info
+
+    def invalidate(self, service_id=None):
+        with self.lock:
+            self.generation += 1
+            if service_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(service_id, None)
+
+
+class ONOSServiceIndex(object):
+    """ Index from ONOS service name to the ids of the FabricCrossconnectServices that use it.
+
+        Lets an event about an ONOS service find the services it affects, or return straight away when there are
+        none, without walking every FabricCrossconnectService. It is rebuilt after invalidate(), or once it is older
+        than ttl seconds.
+    """
+
+    ttl = 300
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.services = None
+        self.built_at = 0
+
+    def build(self, model, resolve):
+        services = {}
+        for service in model.objects.all():
+            try:
+                name = resolve(service)['name']
+            except Exception as e:
+                log.warning("Unable to resolve ONOS of FabricCrossconnectService", service=service.id, error=str(e))
+                continue
+            services.setdefault(name.lower(), []).append(service.id)
+        log.info("Built ONOS service index", services=services)
+        return services
+
+    def lookup(self, model, resolve, onos_name):
+        """ Return the ids of the services whose ONOS is named onos_name. resolve(service) returns the ONOS info
+            of a service, as Helpers.get_fabric_onos_info does.
+        """
+        with self.lock:
+            if (self.services is None) or (time.time() - self.built_at > self.ttl):
+                self.services = self.build(model, resolve)
+                self.built_at = time.time()
+            return list(self.services.get(onos_name.lower(), []))
+
+    def invalidate(self):
+        with self.lock:
+            self.services = None
+
+
+_onos_endpoints = ONOSEndpointCache()
+_onos_service_index = ONOSServiceIndex()
+
+
+def get_onos_endpoints():
+    return _onos_endpoints
+
+
+def get_onos_service_index():
+    return _onos_service_index
@@ -0,0 +1,128 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from helpers import Helpers
+from xconnect_queue import get_xconnect_queue
+
+log = create_logger(Config().get('logging'))
+
+
+class OrphanSweeper(object):
+    """ Deletes FabricCrossconnectServiceInstances that no subscriber links to anymore.
+
+        FabricCrossconnectServiceInstancePolicy does the same for one instance at a time when it is updated, which
+        after a mass teardown means thousands of policy runs. The sweeper instead finds every orphan with a single
+        query. The ids of an instance's provided links come with the instance, so telling whether it has any left
+        costs nothing more.
+
+        Orphans are handled `batch_size` at a time. The xconnects of a batch are removed from ONOS together, and
+        only the instances whose xconnect is gone are deleted. Their backend_handle is cleared first, so that the
+        sync step does not try to remove the xconnect a second time. An instance whose xconnect could not be removed
+        is left for the next sweep.
+
+        A subscriber may be linked to an orphan again while it is being swept, so the database is asked for its links
+        once more right before its xconnect is removed and again right before it is deleted. An instance that was
+        relinked is kept, and if its xconnect was already removed, its push_fingerprint is cleared so that the sync
+        step pushes it again.
+    """
+
+    batch_size = 100
+
+    def __init__(self, model_accessor, batch_size=None):
+        self.model_accessor = model_accessor
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def find_orphans(self):
+        FabricCrossconnectServiceInstance = self.model_accessor.FabricCrossconnectServiceInstance
+        return [fcsi for fcsi in FabricCrossconnectServiceInstance.objects.filter(link_deleted_count__gt=0)
+                if not fcsi.provided_links.exists()]
+
+    def is_relinked(self, fcsi):
+        # the links that come with the instance are those it had when it was read, so ask for them again
+        ServiceInstanceLink = self.model_accessor.ServiceInstanceLink
+        if ServiceInstanceLink.objects.filter(provider_service_instance_id=fcsi.id):
+            log.info("Orphaned FabricCrossconnectServiceInstance was relinked, keeping it", fcsi=fcsi.id)
+            return True
+        return False
+
+    def remove_xconnects(self, fcsis):
+        """ Remove the xconnects of fcsis from ONOS, returning the instances whose xconnect is gone """
+        ops = []
+        removed = []
+        for fcsi in fcsis:
+            if not fcsi.backend_handle:
+                # never pushed to ONOS
+                removed.append(fcsi)
+                continue
+            try:
+                onos = Helpers.get_instance_onos_client(self.model_accessor, fcsi)
+                (s_tag, switch_datapath_id) = Helpers.extract_handle(fcsi.backend_handle)
+                data = {"deviceId": switch_datapath_id, "vlanId": s_tag}
+                ops.append((fcsi, data, get_xconnect_queue().delete(onos, data)))
+            except Exception as e:
+                log.error("Failed to remove orphaned fabric crossconnect from ONOS", fcsi=fcsi.id, error=str(e))
+
+        for (fcsi, data, op) in ops:
+            try:
+                r = op.wait()
+                if (r is not None) and (r.status_code != 204):
+                    raise Exception(r.text)
+            except Exception as e:
+                log.error("Failed to remove orphaned fabric crossconnect from ONOS", fcsi=fcsi.id, body=data,
+                          error=str(e))
+                continue
+            removed.append(fcsi)
+
+        return removed
+
+    def sweep(self):
+        """ Delete every orphan, returning a dict of counts """
+        orphans = self.find_orphans()
+        stats = {"orphans": len(orphans), "deleted": 0, "relinked": 0, "failed": 0}
+        if not orphans:
+            return stats
+
+        log.info("Sweeping orphaned FabricCrossconnectServiceInstances", orphans=len(orphans))
+        for i in range(0, len(orphans), self.batch_size):
+            batch = []
+            for fcsi in orphans[i:i + self.batch_size]:
+                if self.is_relinked(fcsi):
+                    stats["relinked"] += 1
+                else:
+                    batch.append(fcsi)
+            for fcsi in self.remove_xconnects(batch):
+                try:
+                    if self.is_relinked(fcsi):
+                        stats["relinked"] += 1
+                        if fcsi.backend_handle:
+                            # the xconnect is gone from ONOS, so it must be pushed again
+                            fcsi.push_fingerprint = None
+                            fcsi.save(update_fields=["push_fingerprint"], always_update_timestamp=True)
+                        continue
+                    if fcsi.backend_handle:
+                        fcsi.backend_handle = ""
+                        fcsi.save(update_fields=["backend_handle"])
+                    fcsi.delete()
+                except Exception as e:
+                    log.error("Failed to delete orphaned FabricCrossconnectServiceInstance", fcsi=fcsi.id,
+                              error=str(e))
+                    continue
+                stats["deleted"] += 1
+
+        stats["failed"] = stats["orphans"] - stats["deleted"] - stats["relinked"]
+        return stats
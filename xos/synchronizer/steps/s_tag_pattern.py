@@ -0,0 +1,183 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Compiler for the s_tag patterns used by BNGPortMapping.
+
+    A pattern is a comma separated list of single s-tags ("222"), inclusive ranges ("220-225") and the keyword
+    "ANY". Patterns are compiled once into a canonical set of merged intervals plus a VLAN bitset, and compiled
+    patterns are kept in a bounded LRU cache keyed by the pattern text.
+
+    NOTE: models/models.py runs inside the XOS core, where this module is not available, and carries its own copy of
+    the grammar in BNGPortMapping.parse_range, as does migration 0006. Keep the three in sync.
+"""
+
+import threading
+from collections import OrderedDict
+
+VLAN_COUNT = 4096
+MAX_VLAN = VLAN_COUNT - 1
+
+
+class MalformedSTagPattern(ValueError):
+    pass
+
+
+class STagPattern(object):
+    """ A compiled s_tag pattern.
+
+        `intervals` is the sorted tuple of merged (first, last) ranges covered by the pattern and `mask` holds the
+        same VLANs as a bitset. A pattern that contains "ANY" matches every s-tag.
+    """
+
+    def __init__(self, is_any, intervals):
+        self.is_any = is_any
+        if is_any:
+            intervals = [(0, MAX_VLAN)]
+        self.intervals = tuple(merge_intervals(intervals))
+
+        mask = 0
+        for (first, last) in self.intervals:
+            mask |= ((1 << (last - first + 1)) - 1) << first
+        self.mask = mask
+
+    def __repr__(self):
+        return "STagPattern(%s)" % str(self)
+
+    def __str__(self):
+        if self.is_any:
+            return "ANY"
+        return ",".join([str(first) if first == last else "%d-%d" % (first, last)
+                         for (first, last) in self.intervals])
+
+    def __eq__(self, other):
+        return isinstance(other, STagPattern) and (self.is_any == other.is_any) and (self.mask == other.mask)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.is_any, self.mask))
+
+    @property
+    def kind(self):
+        if self.is_any:
+            return "any"
+        if (len(self.intervals) == 1) and (self.intervals[0][0] == self.intervals[0][1]):
+            return "single"
+        return "range"
+
+    @property
+    def min(self):
+        return self.intervals[0][0]
+
+    @property
+    def max(self):
+        return self.intervals[-1][1]
+
+    @property
+    def count(self):
+        return sum([last - first + 1 for (first, last) in self.intervals])
+
+    def matches(self, value):
+        value = int(value)
+        if self.is_any:
+            return True
+        if (value < 0) or (value > MAX_VLAN):
+            return False
+        return bool((self.mask >> value) & 1)
+
+    def overlaps(self, other):
+        return bool(self.mask & other.mask)
+
+    def vlans(self):
+        for (first, last) in self.intervals:
+            for vlan in range(first, last + 1):
+                yield vlan
+
+
+def merge_intervals(intervals):
+    merged = []
+    for (first, last) in sorted(intervals):
+        if merged and (first <= merged[-1][1] + 1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_s_tag_pattern(pattern):
+    """ Parse pattern into an STagPattern without consulting the cache """
+
+    def parse_vlan(text):
+        try:
+            vlan = int(text.strip())
+        except ValueError:
+            raise MalformedSTagPattern("Malformed range %s" % pattern)
+        if (vlan < 0) or (vlan > MAX_VLAN):
+            raise MalformedSTagPattern("Malformed range %s" % pattern)
+        return vlan
+
+    is_any = False
+    intervals = []
+    for this_range in pattern.split(","):
+        this_range = this_range.strip()
+        if "-" in this_range:
+            (first, last) = this_range.split("-", 1)
+            first = parse_vlan(first)
+            last = parse_vlan(last)
+            if first > last:
+                raise MalformedSTagPattern("Malformed range %s" % pattern)
+            intervals.append((first, last))
+        elif this_range.lower() == "any":
+            is_any = True
+        else:
+            vlan = parse_vlan(this_range)
+            intervals.append((vlan, vlan))
+    return STagPattern(is_any, intervals)
+
+
+class STagPatternCache(object):
+    """ Bounded LRU cache of compiled patterns, keyed by pattern text """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.patterns = OrderedDict()
+
+    def get(self, pattern):
+        with self.lock:
+            compiled = self.patterns.pop(pattern, None)
+            if compiled is not None:
+                self.patterns[pattern] = compiled
+                return compiled
+
+        compiled = parse_s_tag_pattern(pattern)
+
+        with self.lock:
+            self.patterns[pattern] = compiled
+            while len(self.patterns) > self.max_size:
+                self.patterns.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self.lock:
+            self.patterns.clear()
+
+
+_pattern_cache = STagPatternCache()
+
+
+def compile_s_tag_pattern(pattern):
+    """ Return the compiled STagPattern for pattern, raising MalformedSTagPattern if it does not parse """
+    return _pattern_cache.get(pattern)
@@ -17,15 +17,16 @@ import json
 from xossynchronizer.steps.syncstep import SyncStep, DeferredException
 from xossynchronizer.modelaccessor import model_accessor, FabricCrossconnectServiceInstance, ServiceInstance, BNGPortMapping
 
-import requests
-from requests import ConnectionError
-from requests.auth import HTTPBasicAuth
-from requests.models import InvalidURL
-
 from xosconfig import Config
 from multistructlog import create_logger
 
 from helpers import Helpers
+from bng_index import get_bng_index
+from s_tag_pattern import compile_s_tag_pattern
+from crossconnect_index import get_crossconnect_index
+from xconnect_queue import get_xconnect_queue
+from xconnect_table import get_xconnect_tables
+from metrics import timed
 log = create_logger(Config().get('logging'))
 
 
@@ -33,93 +34,156 @@ class SyncBNGPortMapping(SyncStep):
     provides = [BNGPortMapping]
     observes = BNGPortMapping
 
+    # find_crossconnect fetches each run of consecutive s-tags on its own, up to this many runs
+    max_s_tag_queries = 16
+
     def remove_crossconnect(self, fcsis):
+        # All of the deletes are queued before waiting on any of them, and the queue fans them out to ONOS on a
+        # bounded pool. A failed delete doesn't stop the others, and the crossconnects are only saved, so that
+        # they are pushed again, once every delete has finished.
+        ops = []
         for fcsi in fcsis:
-            onos = Helpers.get_fabric_onos_info(self.model_accessor, fcsi.owner)
+            onos = Helpers.get_instance_onos_client(self.model_accessor, fcsi)
 
-            url = onos['url'] + '/onos/segmentrouting/xconnect'
             data = {"deviceId": fcsi.switch_datapath_id,
                     "vlanId": fcsi.s_tag}
-            log.info("Sending request to ONOS", url=url)
-            r = requests.delete(url, json=data, auth=HTTPBasicAuth(onos['user'], onos['pass']))
-            if r.status_code != 204:
-                raise Exception("Failed to remove fabric crossconnect in ONOS: %s" % r.text)
+            log.info("Sending request to ONOS", url=onos.url + '/onos/segmentrouting/xconnect')
+            ops.append((fcsi, get_xconnect_queue().delete(onos, data)))
+
+        removed = []
+        failures = []
+        for (fcsi, op) in ops:
+            try:
+                r = op.wait()
+                if (r is not None) and (r.status_code != 204):
+                    raise Exception(r.text)
+            except Exception as e:
+                log.error("Failed to remove fabric crossconnect in ONOS", fcsi=fcsi.id, error=str(e))
+                failures.append("%s: %s" % (fcsi.id, e))
+                continue
+            removed.append(fcsi)
+
+        for fcsi in removed:
+            # the xconnect is gone from ONOS, so it must be pushed again
+            fcsi.push_fingerprint = None
             fcsi.save(always_update_timestamp = True)
 
+        if failures:
+            raise Exception("Failed to remove fabric crossconnect in ONOS: %s" % "; ".join(failures))
+
+    def query_s_tags(self, model, first, last):
+        if first == last:
+            return model.objects.filter(s_tag=first)
+        return model.objects.filter(s_tag__gte=first, s_tag__lte=last)
+
+    def s_tag_runs(self, s_tags):
+        """ Group sorted s-tags into (first, last) runs of consecutive s-tags, so that each run is one query """
+        runs = []
+        for s_tag in s_tags:
+            if runs and (s_tag == runs[-1][1] + 1):
+                runs[-1] = (runs[-1][0], s_tag)
+            else:
+                runs.append((s_tag, s_tag))
+        if len(runs) > self.max_s_tag_queries:
+            # a single scan between the lowest and highest s-tag beats a query per run
+            runs = [(runs[0][0], runs[-1][1])]
+        return runs
+
     def find_crossconnect(self, bng_s_tag):
-        if(bng_s_tag.isnumeric()):
-            xconnect_si = self.model_accessor.FabricCrossconnectServiceInstance.objects.filter(s_tag=int(bng_s_tag))
-            if xconnect_si:
-                log.info("Crossconnects belonging having s-tag equal to s-tags: %s" % xconnect_si)
-                return xconnect_si
-        else:
-            [fcsis_range, fcsis_any] = [[], []]
-            for fcsi in self.model_accessor.FabricCrossconnectServiceInstance.objects.all():
-                if Helpers.range_matches(fcsi.s_tag, bng_s_tag):
-                    fcsis_range.append(fcsi)
-                else:
-                    fcsis_any.append(fcsi)
-            if fcsis_range:
-                log.info("Crossconnects belonging to bng range s-tags: %s" % fcsis_range)
-                return fcsis_range
+        # The reverse index gives the s-tags of the crossconnects the pattern covers, and only those s-tags are
+        # fetched from the database. If the database doesn't have every crossconnect the index listed, the index is
+        # out of date and may be missing crossconnects too, so it is invalidated and the bounds of the pattern are
+        # scanned instead.
+        pattern = compile_s_tag_pattern(bng_s_tag)
+        FabricCrossconnectServiceInstance = self.model_accessor.FabricCrossconnectServiceInstance
+        crossconnect_index = get_crossconnect_index()
+        matches = crossconnect_index.find(FabricCrossconnectServiceInstance, pattern)
+        if not matches:
+            log.info("No crossconnects belonging to bng s-tags %s" % bng_s_tag)
+            return []
+
+        candidates = {}
+        for (first, last) in self.s_tag_runs(sorted(set([s_tag for (s_tag, fcsi_id) in matches]))):
+            for fcsi in self.query_s_tags(FabricCrossconnectServiceInstance, first, last):
+                candidates[fcsi.id] = fcsi
+
+        if not all([fcsi_id in candidates for (s_tag, fcsi_id) in matches]):
+            log.info("Crossconnect index is out of date, scanning the database", bng_s_tag=bng_s_tag)
+            crossconnect_index.invalidate()
+            if pattern.is_any:
+                rows = FabricCrossconnectServiceInstance.objects.all()
             else:
-                log.info("Crossconnects belonging to bng any s-tags: %s" % fcsis_any)
-                return fcsis_any
+                rows = self.query_s_tags(FabricCrossconnectServiceInstance, pattern.min, pattern.max)
+            candidates = dict([(fcsi.id, fcsi) for fcsi in rows])
+
+        xconnect_si = [fcsi for fcsi in sorted(candidates.values(), key=lambda fcsi: fcsi.id)
+                       if (fcsi.s_tag is not None) and pattern.matches(int(fcsi.s_tag))]
+        log.info("Crossconnects belonging to bng s-tags %s: %s" % (bng_s_tag, xconnect_si))
+        return xconnect_si
 
-    def check_switch_port_change(self, model):
-        fcsis = self.find_crossconnect(model.s_tag)
-        isChanged = False
-        remove_xconnect = []
+    def resolve_switch_port(self, s_tag):
+        """ Return the switch_port that s_tag resolves to under the current BNGPortMappings, or None.
+
+            The most specific mapping wins: a single s-tag, then the narrowest range, then "ANY".
+        """
+        bng_mapping = get_bng_index().lookup(self.model_accessor.BNGPortMapping, s_tag)
+        if not bng_mapping:
+            return None
+        return bng_mapping.switch_port
+
+    def find_changed_crossconnects(self, s_tags):
+        """ Return the crossconnects covered by any of the patterns in s_tags whose port in ONOS is no longer the
+            one their s-tag resolves to.
+
+            Crossconnects whose effective mapping is unchanged, for example because a more specific mapping still
+            covers them, are left alone.
+        """
+        fcsis = {}
+        for s_tag in s_tags:
+            for fcsi in self.find_crossconnect(s_tag):
+                fcsis[fcsi.id] = fcsi
+
+        changed = []
+        for fcsi in sorted(fcsis.values(), key=lambda fcsi: fcsi.id):
+            switch_port = self.resolve_switch_port(fcsi.s_tag)
+
+            # the xconnect table is fetched once per ONOS and shared, rather than fetched for every crossconnect
+            onos = Helpers.get_instance_onos_client(self.model_accessor, fcsi)
+            endpoints = get_xconnect_tables().get(onos).endpoints(fcsi.switch_datapath_id, fcsi.s_tag)
+            if endpoints is None:
+                continue
+            if (switch_port is None) or (int(switch_port) not in endpoints):
+                log.info("Effective BNG port changed for crossconnect", fcsi=fcsi.id, s_tag=fcsi.s_tag,
+                         switch_port=switch_port, endpoints=endpoints)
+                changed.append(fcsi)
+        return changed
+
+    def check_switch_port_change(self, s_tags):
+        fcsis = self.find_changed_crossconnects(s_tags)
         if fcsis:
-            for fcsi in fcsis:
-                onos = Helpers.get_fabric_onos_info(self.model_accessor, fcsi.owner)
-                log.info("ONOS belonging to fabric crossconnect instance: %s" % onos)
-
-                url = onos['url'] + '/onos/segmentrouting/xconnect'
-                log.info("Sending request to ONOS", url=url)
-                r = requests.get(url, auth=HTTPBasicAuth(onos['user'], onos['pass']))
-                if r.status_code != 200:
-                    log.error(r.text)
-                    raise Exception("Failed to get onos devices")
-                else:
-                    try:
-                        log.info("Get devices response", json=r.json())
-                    except Exception:
-                        log.info("Get devices exception response", text=r.text) 
-                xconnects = r.json()["xconnects"]
-                for xconn in xconnects:
-                    val = xconn['deviceId']
-                    if(str(fcsi.switch_datapath_id) == str(val)):
-                        if model.switch_port not in xconn['endpoints']:
-                            remove_xconnect.append(fcsi)
-            self.remove_crossconnect(remove_xconnect)
-            isChanged = True
+            log.info("Xconnect-instances whose bng port changed : %s" % fcsis)
+            self.remove_crossconnect(fcsis)
+            return True
         else:
-            log.info("No Fabric-xconnect-si found & saving bng instance.")
-        return isChanged
+            log.info("No Fabric-xconnect-si changed & saving bng instance.")
+            return False
 
+    @timed("sync_seconds", "sync_record")
     def sync_record(self, model):
         log.info("Sync started for BNGPortMapping instance: %s" % model.id)
-        log.info('Syncing BNGPortMapping instance', object=str(model), **model.tologdict()) 
-        if model.old_s_tag:
-            if (model.old_s_tag != model.s_tag):
-                fcsis = self.find_crossconnect(model.old_s_tag)
-                if fcsis:
-                    log.info("Xconnect-instance linked to bng : %s" % fcsis)
-                    self.remove_crossconnect(fcsis)
-                else:
-                    log.info("No crossconnect is found for current bng instance")
-            else:
-                self.check_switch_port_change(model)
-        else:
-            if self.check_switch_port_change(model):
-                log.info("Changed bng switch port is repushed to ONOS")
+        get_bng_index().invalidate()
+        log.info('Syncing BNGPortMapping instance', object=str(model), **model.tologdict())
+        s_tags = [model.s_tag]
+        if model.old_s_tag and (model.old_s_tag != model.s_tag):
+            # crossconnects that were covered by the old s_tag may now resolve to another mapping, or to none
+            s_tags.append(model.old_s_tag)
+        if self.check_switch_port_change(s_tags):
+            log.info("Changed bng switch port is repushed to ONOS")
         log.info("Completing Synchronization for BNGPortMapping instance: %s" % model.id)
 
+    @timed("sync_seconds", "delete_record")
     def delete_record(self,model):
-        log.info('Deleting BNGPortMapping instance', object=str(model), **model.tologdict()) 
-        fcsis = self.find_crossconnect(model.s_tag)
-        if fcsis:
-            log.info("Xconnect-instance linked to bng : %s" % fcsis)
-            self.remove_crossconnect(fcsis)
+        log.info('Deleting BNGPortMapping instance', object=str(model), **model.tologdict())
+        get_bng_index().invalidate()
+        self.check_switch_port_change([model.s_tag])
         log.info("Completing deletion of bng instance")
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 from xossynchronizer.steps.syncstep import SyncStep, DeferredException
 from xossynchronizer.modelaccessor import model_accessor, \
     FabricCrossconnectServiceInstance, \
@@ -20,9 +22,26 @@ from xossynchronizer.modelaccessor import model_accessor, \
 
 from xosconfig import Config
 from multistructlog import create_logger
-import requests
-from requests.auth import HTTPBasicAuth
 from helpers import Helpers
+from bng_index import get_bng_index
+from crossconnect_index import get_crossconnect_index
+from xconnect_queue import get_xconnect_queue
+from metrics import get_metrics, timed
+
+# Counts of xconnects pushed to ONOS and of pushes skipped because ONOS already had the same xconnect from us
+_push_stats = {"pushed": 0, "skipped": 0}
+_push_stats_lock = threading.Lock()
+
+
+def count_push(key):
+    with _push_stats_lock:
+        _push_stats[key] += 1
+    get_metrics().xconnect_pushes.inc(result=key)
+
+
+def get_push_stats():
+    with _push_stats_lock:
+        return dict(_push_stats)
 
 
 class SyncFabricCrossconnectServiceInstance(SyncStep):
@@ -38,50 +57,27 @@ class SyncFabricCrossconnectServiceInstance(SyncStep):
         return "%d/%s" % (s_tag, switch_datapath_id)
 
     def extract_handle(self, backend_handle):
-        (s_tag, switch_datapath_id) = backend_handle.split("/", 1)
-        s_tag = int(s_tag)
-        return (s_tag, switch_datapath_id)
+        return Helpers.extract_handle(backend_handle)
+
+    def make_fingerprint(self, data):
+        return Helpers.make_fingerprint(data)
 
     def range_matches(self, value, pattern):
-        value = int(value)
-        for this_range in pattern.split(","):
-            this_range = this_range.strip()
-            if "-" in this_range:
-                (first, last) = this_range.split("-")
-                first = int(first.strip())
-                last = int(last.strip())
-                if (value >= first) and (value <= last):
-                    return True
-            elif this_range.lower() == "any":
-                return True
-            else:
-                if (value == int(this_range)):
-                    return True
-        return False
+        return Helpers.range_matches(value, pattern)
 
     def find_bng(self, s_tag):
-        # See if there's a mapping for our s-tag directly
-        bng_mappings = BNGPortMapping.objects.filter(s_tag=str(s_tag))
-        if bng_mappings:
-            return bng_mappings[0]
-
-        # TODO(smbaker): Examine miss performance, and if necessary set a flag in the save method to allow filtering
-        # of mappings based on whether they are ranges or any.
-
-        # See if there are any ranges or "any" that match
-        for bng_mapping in BNGPortMapping.objects.all():
-            if self.range_matches(s_tag, bng_mapping.s_tag):
-                return bng_mapping
-
-        return None
+        # The index resolves an s-tag with a single table lookup. The most specific mapping wins: an exact mapping
+        # for our s-tag, then the narrowest range that includes it, then "any".
+        return get_bng_index().lookup(BNGPortMapping, s_tag)
 
+    @timed("sync_seconds", "sync_record")
     def sync_record(self, o):
         self.log.info("Sync'ing Fabric Crossconnect Service Instance", service_instance=o)
 
         if (o.policed is None) or (o.policed < o.updated):
             raise DeferredException("Waiting for model_policy to run on fcsi %s" % o.id)
 
-        onos = Helpers.get_fabric_onos_info(self.model_accessor, o.owner)
+        onos = Helpers.get_instance_onos_client(self.model_accessor, o)
 
         ServiceInstance.objects.get(id=o.id)
 
@@ -105,30 +101,54 @@ class SyncFabricCrossconnectServiceInstance(SyncStep):
                 "vlanId": o.s_tag,
                 "endpoints": [int(o.source_port), int(east_port)]}
 
-        url = onos['url'] + '/onos/segmentrouting/xconnect'
+        handle = self.make_handle(o.s_tag, o.switch_datapath_id)
+        fingerprint = self.make_fingerprint(data)
+        if (o.backend_handle == handle) and (o.push_fingerprint == fingerprint):
+            # Nothing that ONOS cares about has changed since our last push, for example only backend_status was
+            # rewritten. Anything that needs the xconnect pushed again, such as an ONOS restart, clears the
+            # fingerprint.
+            self.log.info("Fabric crossconnect already pushed to ONOS", fingerprint=fingerprint)
+            count_push("skipped")
+            get_crossconnect_index().add(o.id, o.s_tag)
+            return
+
+        url = onos.url + '/onos/segmentrouting/xconnect'
 
         self.log.info("Sending request to ONOS", url=url, body=data)
 
-        r = requests.post(url, json=data, auth=HTTPBasicAuth(onos['user'], onos['pass']))
+        r = get_xconnect_queue().post(onos, data).wait()
+
+        if r is None:
+            # A later operation on the same xconnect replaced ours before it was sent, so ONOS may not have it. Try
+            # again later rather than recording a handle for an xconnect we never pushed.
+            self.log.info("ONOS request superseded", url=url, body=data)
+            raise DeferredException("ONOS request for xconnect %s was superseded" % handle)
 
         if r.status_code != 200:
             raise Exception("Failed to create fabric crossconnect in ONOS: %s" % r.text)
+        count_push("pushed")
 
         # TODO(smbaker): If the o.backend_handle changed, then someone must have changed the
         #   FabricCrossconnectServiceInstance. If so, then we potentially need to clean up the old
         #   entry in ONOS. Furthermore, we might want to also save the two port numbers that we used,
         #   to detect someone changing those.
 
-        o.backend_handle = self.make_handle(o.s_tag, o.switch_datapath_id)
+        o.backend_handle = handle
+        o.push_fingerprint = fingerprint
         o.save_changed_fields()
 
+        get_crossconnect_index().add(o.id, o.s_tag)
+
         self.log.info("ONOS response", res=r.text)
 
+    @timed("sync_seconds", "delete_record")
     def delete_record(self, o):
         self.log.info("Deleting Fabric Crossconnect Service Instance", service_instance=o)
 
+        get_crossconnect_index().remove(o.id)
+
         if o.backend_handle:
-            onos = Helpers.get_fabric_onos_info(self.model_accessor, o.owner)
+            onos = Helpers.get_instance_onos_client(self.model_accessor, o)
 
             # backend_handle has everything we need in it to delete this entry.
             (s_tag, switch_datapath_id) = self.extract_handle(o.backend_handle)
@@ -136,9 +156,11 @@ class SyncFabricCrossconnectServiceInstance(SyncStep):
             data = {"deviceId": switch_datapath_id,
                     "vlanId": s_tag}
 
-            url = onos['url'] + '/onos/segmentrouting/xconnect'
+            r = get_xconnect_queue().delete(onos, data).wait()
 
-            r = requests.delete(url, json=data, auth=HTTPBasicAuth(onos['user'], onos['pass']))
+            if r is None:
+                self.log.info("ONOS request superseded", body=data)
+                return
 
             if r.status_code != 204:
                 raise Exception("Failed to remove fabric crossconnect in ONOS: %s" % r.text)
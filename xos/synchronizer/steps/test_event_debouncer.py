@@ -0,0 +1,96 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from mock import Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestEventDebouncer(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from event_debouncer import EventDebouncer
+        self.debouncer_class = EventDebouncer
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_no_delay(self):
+        debouncer = self.debouncer_class(delay=0)
+        callback = Mock()
+
+        self.assertTrue(debouncer.submit("onos", callback))
+        self.assertTrue(debouncer.submit("onos", callback))
+
+        self.assertEqual(callback.call_count, 2)
+        self.assertEqual(debouncer.stats()["suppressed"], 0)
+
+    def test_burst(self):
+        debouncer = self.debouncer_class(delay=0.2)
+        called = threading.Event()
+        callbacks = [Mock(), Mock(side_effect=lambda: called.set())]
+
+        self.assertTrue(debouncer.submit("onos", callbacks[0]))
+        self.assertFalse(debouncer.submit("onos", callbacks[1]))
+
+        self.assertTrue(called.wait(5))
+        # only the latest callback of the burst runs
+        callbacks[0].assert_not_called()
+        self.assertEqual(debouncer.stats(), {"received": 2, "suppressed": 1, "pending": 0,
+                                             "suppressed_by_key": {"onos": 1}})
+
+    def test_max_delay(self):
+        debouncer = self.debouncer_class(delay=60, max_delay=0.2)
+        called = threading.Event()
+
+        start = time.time()
+        debouncer.submit("onos", Mock())
+        debouncer.submit("onos", Mock(side_effect=lambda: called.set()))
+
+        # the burst is not allowed to postpone the callback past max_delay
+        self.assertTrue(called.wait(5))
+        self.assertLess(time.time() - start, 5)
+
+    def test_flush_error(self):
+        debouncer = self.debouncer_class(delay=60)
+        callbacks = [Mock(side_effect=Exception("failed")), Mock()]
+
+        debouncer.submit("onos-1", callbacks[0])
+        debouncer.submit("onos-2", callbacks[1])
+        debouncer.flush()
+
+        # one failing callback does not stop the others
+        callbacks[0].assert_called_once_with()
+        callbacks[1].assert_called_once_with()
+        self.assertEqual(debouncer.stats()["pending"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import socket
+import tempfile
+import unittest
+
+import requests
+from mock import patch
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        import metrics
+        self.module = metrics
+        self.metrics = metrics.get_metrics()
+        self.metrics.reset()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.metrics.reset()
+        shutil.rmtree(self.tmpdir)
+        sys.path = self.sys_path_save
+
+    def test_counter(self):
+        counter = self.module.Counter("test_total", "Things", ["result"])
+        counter.inc(result="hit")
+        counter.inc(2, result="hit")
+        counter.inc(result='say "miss"\n')
+
+        self.assertEqual(counter.get(result="hit"), 3)
+        self.assertEqual(counter.get(result="other"), 0)
+        self.assertEqual(counter.render(), "\n".join(['# HELP test_total Things',
+                                                      '# TYPE test_total counter',
+                                                      'test_total{result="hit"} 3.0',
+                                                      'test_total{result="say \\"miss\\"\\n"} 1.0']))
+
+        with self.assertRaises(ValueError):
+            counter.inc(status="hit")
+
+    def test_histogram(self):
+        histogram = self.module.Histogram("test_seconds", "Durations", ["method"], buckets=[0.1, 1])
+        histogram.observe(0.05, method="GET")
+        histogram.observe(0.1, method="GET")
+        histogram.observe(5, method="GET")
+
+        self.assertEqual(histogram.count(method="GET"), 3)
+        self.assertEqual(histogram.count(method="POST"), 0)
+        self.assertEqual(histogram.render(), "\n".join(['# HELP test_seconds Durations',
+                                                        '# TYPE test_seconds histogram',
+                                                        'test_seconds_bucket{method="GET",le="0.1"} 2.0',
+                                                        'test_seconds_bucket{method="GET",le="1.0"} 2.0',
+                                                        'test_seconds_bucket{method="GET",le="+Inf"} 3.0',
+                                                        'test_seconds_sum{method="GET"} 5.15',
+                                                        'test_seconds_count{method="GET"} 3.0']))
+
+    def test_timed(self):
+        from xossynchronizer.steps.syncstep import DeferredException
+
+        class Step(object):
+            @self.module.timed("sync_seconds", "sync_record")
+            def sync_record(self, o):
+                if o == "defer":
+                    raise DeferredException("later")
+                if o == "fail":
+                    raise Exception("failed")
+                return o
+
+        step = Step()
+        self.assertEqual(step.sync_record("ok"), "ok")
+        with self.assertRaises(DeferredException):
+            step.sync_record("defer")
+        with self.assertRaises(Exception):
+            step.sync_record("fail")
+
+        for result in ["success", "deferred", "error"]:
+            self.assertEqual(self.metrics.sync_seconds.count(step="Step", operation="sync_record", result=result), 1)
+
+    def test_render(self):
+        self.metrics.bng_lookups.inc(result="hit")
+        self.metrics.bng_index_builds.inc()
+
+        text = self.metrics.render()
+        self.assertIn('fabric_crossconnect_bng_lookups_total{result="hit"} 1.0\n', text)
+        self.assertIn('fabric_crossconnect_bng_index_builds_total 1.0\n', text)
+        self.assertIn('# TYPE fabric_crossconnect_onos_request_seconds histogram\n', text)
+
+    def test_exporter(self):
+        # find a free port for the endpoint
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+        s.close()
+
+        path = os.path.join(self.tmpdir, "fabric_crossconnect.prom")
+        self.metrics.xconnect_pushes.inc(result="pushed")
+
+        exporter = self.module.start_metrics_exporter(port=port, host="127.0.0.1", path=path, interval=60)
+        try:
+            r = requests.get("http://127.0.0.1:%d/metrics" % port)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.headers["Content-Type"], self.module.CONTENT_TYPE)
+            self.assertIn('fabric_crossconnect_xconnect_pushes_total{result="pushed"} 1.0', r.text)
+
+            self.assertEqual(requests.get("http://127.0.0.1:%d/other" % port).status_code, 404)
+        finally:
+            exporter.stop()
+
+        with open(path) as f:
+            self.assertIn('fabric_crossconnect_xconnect_pushes_total{result="pushed"} 1.0', f.read())
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_exporter_defaults(self):
+        with patch.dict(os.environ, {"METRICS_PORT": "9102"}):
+            os.environ.pop("METRICS_HOST", None)
+            exporter = self.module.MetricsExporter()
+        self.assertEqual((exporter.host, exporter.port), ("127.0.0.1", 9102))
+
+    def test_exporter_disabled(self):
+        exporter = self.module.start_metrics_exporter(port=0, path="")
+        self.assertIsNone(exporter.server)
+        self.assertEqual(exporter.threads, [])
+        exporter.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
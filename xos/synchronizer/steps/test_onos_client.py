@@ -0,0 +1,130 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch
+import requests
+import requests_mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestONOSClient(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from onos_client import ONOSClient, get_onos_client, close_onos_clients
+        self.ONOSClient = ONOSClient
+        self.get_onos_client = get_onos_client
+        close_onos_clients()
+
+        self.onos = {"url": "http://onos-fabric:8181", "user": "onos", "pass": "rocks"}
+        self.url = "http://onos-fabric:8181/onos/segmentrouting/xconnect"
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_shared_client(self):
+        client = self.get_onos_client(self.onos)
+        self.assertIs(self.get_onos_client(dict(self.onos)), client)
+        self.assertIsNot(self.get_onos_client(dict(self.onos, url="http://other:8181")), client)
+
+    @requests_mock.Mocker()
+    def test_request(self, m):
+        m.post(self.url, status_code=200)
+
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", connect_timeout=1, read_timeout=2)
+        with patch.object(client.session, "request", wraps=client.session.request) as session_request:
+            r = client.post("/onos/segmentrouting/xconnect", json={"vlanId": 222})
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(m.request_history[0].json(), {"vlanId": 222})
+        self.assertEqual(m.request_history[0].headers["Authorization"], "Basic b25vczpyb2Nrcw==")
+        self.assertEqual(session_request.call_args[1]["timeout"], (1, 2))
+
+    def test_unknown_option(self):
+        with self.assertRaises(TypeError):
+            self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", read_timeot=2)
+
+    @requests_mock.Mocker()
+    def test_retry_status(self, m):
+        m.get(self.url, [{"status_code": 503}, {"status_code": 502}, {"status_code": 200, "json": {"xconnects": []}}])
+
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks")
+        with patch("time.sleep") as sleep:
+            r = client.get("/onos/segmentrouting/xconnect")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(m.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_retry_exhausted(self, m):
+        m.delete(self.url, status_code=503)
+
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", retries=2)
+        with patch("time.sleep"):
+            r = client.delete("/onos/segmentrouting/xconnect")
+
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(m.call_count, 3)
+
+    @requests_mock.Mocker()
+    def test_retry_connection_error(self, m):
+        m.get(self.url, exc=requests.ConnectionError)
+
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", retries=1)
+        with patch("time.sleep"):
+            with self.assertRaises(requests.ConnectionError):
+                client.get("/onos/segmentrouting/xconnect")
+
+        self.assertEqual(m.call_count, 2)
+
+    def test_backoff_delay(self):
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", backoff=1, max_backoff=3)
+        for attempt in range(5):
+            delay = client.backoff_delay(attempt)
+            self.assertTrue(0 <= delay <= min(3, 2 ** attempt))
+
+    def test_request_budget(self):
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks", connect_timeout=1, read_timeout=2,
+                                 retries=3, backoff=1, max_backoff=3)
+        # four attempts of up to 3 seconds each, with up to 1, 2 and 3 seconds of backoff between them
+        self.assertEqual(client.request_budget(), 18)
+
+    @requests_mock.Mocker()
+    def test_no_retry_client_error(self, m):
+        m.post(self.url, status_code=400, text="bad request")
+
+        client = self.ONOSClient("http://onos-fabric:8181", "onos", "rocks")
+        r = client.post("/onos/segmentrouting/xconnect", json={})
+
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(m.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch, Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestONOSEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from onos_endpoints import ONOSEndpointCache
+        self.cache = ONOSEndpointCache()
+        self.resolve = Mock(side_effect=lambda: {"url": "http://onos-fabric:8181"})
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_cached(self):
+        self.assertEqual(self.cache.get(1, self.resolve), {"url": "http://onos-fabric:8181"})
+        self.assertEqual(self.cache.get(1, self.resolve), {"url": "http://onos-fabric:8181"})
+        self.cache.get(2, self.resolve)
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_ttl(self):
+        self.cache.get(1, self.resolve)
+        with patch("time.time") as now:
+            now.return_value = self.cache.entries[1][0] + self.cache.ttl + 1
+            self.cache.get(1, self.resolve)
+        self.assertEqual(self.resolve.call_count, 2)
+
+    def test_invalidate(self):
+        self.cache.get(1, self.resolve)
+        self.cache.get(2, self.resolve)
+
+        self.cache.invalidate(1)
+        self.cache.get(1, self.resolve)
+        self.cache.get(2, self.resolve)
+        self.assertEqual(self.resolve.call_count, 3)
+
+        self.cache.invalidate()
+        self.assertEqual(self.cache.entries, {})
+
+    def test_invalidate_during_resolve(self):
+        def resolve():
+            self.cache.invalidate()
+            return {"url": "http://onos-fabric:8181"}
+
+        self.cache.get(1, resolve)
+        self.assertEqual(self.cache.entries, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch, Mock
+import requests_mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestOrphanSweeper(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xossynchronizer.mock_modelaccessor_build import mock_modelaccessor_config
+        mock_modelaccessor_config(test_path, [("fabric-crossconnect", "fabric-crossconnect.xproto"), ])
+
+        import xossynchronizer.modelaccessor
+        import mock_modelaccessor
+        reload(mock_modelaccessor)  # in case nose2 loaded it in a previous test
+        reload(xossynchronizer.modelaccessor)      # in case nose2 loaded it in a previous test
+
+        from xossynchronizer.modelaccessor import model_accessor
+        self.model_accessor = model_accessor
+
+        from orphan_sweeper import OrphanSweeper
+        self.sweeper = OrphanSweeper
+
+        from onos_endpoints import get_onos_endpoints
+        get_onos_endpoints().invalidate()
+
+        # import all class names to globals
+        for (k, v) in model_accessor.all_model_classes.items():
+            globals()[k] = v
+
+        # mock onos-fabric
+        self.onos_fabric = Service(name="onos-fabric",
+                                   rest_hostname="onos-fabric",
+                                   rest_port="8181",
+                                   rest_username="onos",
+                                   rest_password="rocks")
+
+        self.service = FabricCrossconnectService(id=1, name="fcservice", provider_services=[self.onos_fabric])
+
+        self.device = "of:0000000000000201"
+        self.fcsis = []
+        for (s_tag, link_deleted_count, links) in [(100, 1, 0), (150, 1, 1), (222, 0, 0), (300, 2, 0), (400, 1, 0)]:
+            fcsi = FabricCrossconnectServiceInstance(id=7000 + s_tag, owner=self.service, owner_id=1, s_tag=s_tag,
+                                                     source_port=3, switch_datapath_id=self.device,
+                                                     link_deleted_count=link_deleted_count,
+                                                     backend_handle="%d/%s" % (s_tag, self.device))
+            fcsi.provided_links = Mock()
+            fcsi.provided_links.exists.return_value = (links > 0)
+            self.fcsis.append(fcsi)
+        # never pushed to ONOS
+        self.fcsis[4].backend_handle = None
+
+        self.url = "http://onos-fabric:8181/onos/segmentrouting/xconnect"
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def filter(self, link_deleted_count__gt):
+        return [fcsi for fcsi in self.fcsis if fcsi.link_deleted_count > link_deleted_count__gt]
+
+    def link_filter(self, provider_service_instance_id):
+        # relinks maps an instance id to the number of lookups after which it has a link again
+        self.link_lookups[provider_service_instance_id] = self.link_lookups.get(provider_service_instance_id, 0) + 1
+        relinked_after = self.relinks.get(provider_service_instance_id)
+        if (relinked_after is not None) and (self.link_lookups[provider_service_instance_id] > relinked_after):
+            return [Mock(provider_service_instance_id=provider_service_instance_id)]
+        return []
+
+    def sweep(self, relinks=None, **kwargs):
+        self.relinks = relinks or {}
+        self.link_lookups = {}
+        with patch.object(FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter, \
+                patch.object(ServiceInstanceLink.objects, "filter") as link_filter, \
+                patch.object(type(self.fcsis[0]), "save") as fcsi_save, \
+                patch.object(type(self.fcsis[0]), "delete", autospec=True) as fcsi_delete:
+            fcsi_filter.side_effect = self.filter
+            link_filter.side_effect = self.link_filter
+
+            stats = self.sweeper(self.model_accessor, **kwargs).sweep()
+
+            self.assertEqual(fcsi_filter.call_count, 1)
+            return (stats, fcsi_save, [args[0] for (args, kwargs) in fcsi_delete.call_args_list])
+
+    def vlans(self, m):
+        return [(r.method, r.json()["vlanId"]) for r in m.request_history]
+
+    @requests_mock.Mocker()
+    def test_sweep(self, m):
+        m.delete(self.url, status_code=204)
+
+        (stats, fcsi_save, deleted) = self.sweep(batch_size=2)
+
+        self.assertEqual(stats, {"orphans": 3, "deleted": 3, "relinked": 0, "failed": 0})
+        self.assertEqual(sorted(self.vlans(m)), [("DELETE", 100), ("DELETE", 300)])
+        self.assertEqual(deleted, [self.fcsis[0], self.fcsis[3], self.fcsis[4]])
+        # the handle is cleared so that the sync step does not remove the xconnect again
+        self.assertEqual(fcsi_save.call_count, 2)
+        self.assertEqual(self.fcsis[0].backend_handle, "")
+
+    @requests_mock.Mocker()
+    def test_sweep_onos_failure(self, m):
+        m.delete(self.url, [{"status_code": 500, "text": "error"}, {"status_code": 204}])
+
+        (stats, fcsi_save, deleted) = self.sweep()
+
+        # the instance whose xconnect is still in ONOS is left for the next sweep
+        self.assertEqual(stats, {"orphans": 3, "deleted": 2, "relinked": 0, "failed": 1})
+        self.assertEqual(len(deleted), 2)
+        self.assertEqual(len([fcsi for fcsi in self.fcsis if fcsi.backend_handle]), 3)
+
+    @requests_mock.Mocker()
+    def test_sweep_relinked(self, m):
+        m.delete(self.url, status_code=204)
+
+        # 7100 is relinked before its xconnect is removed, 7300 after its xconnect is removed
+        (stats, fcsi_save, deleted) = self.sweep(relinks={7100: 0, 7300: 1})
+
+        self.assertEqual(stats, {"orphans": 3, "deleted": 1, "relinked": 2, "failed": 0})
+        self.assertEqual(self.vlans(m), [("DELETE", 300)])
+        self.assertEqual(deleted, [self.fcsis[4]])
+        # the xconnect of 7300 is gone from ONOS, so it is pushed again
+        self.assertIsNone(self.fcsis[3].push_fingerprint)
+        self.assertEqual(self.fcsis[3].backend_handle, "300/of:0000000000000201")
+        self.assertEqual(self.fcsis[0].backend_handle, "100/of:0000000000000201")
+        fcsi_save.assert_called_once_with(update_fields=["push_fingerprint"], always_update_timestamp=True)
+
+    def test_sweep_nothing(self):
+        for fcsi in self.fcsis:
+            fcsi.provided_links.exists.return_value = True
+
+        (stats, fcsi_save, deleted) = self.sweep()
+
+        self.assertEqual(stats, {"orphans": 0, "deleted": 0, "relinked": 0, "failed": 0})
+        self.assertEqual(deleted, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
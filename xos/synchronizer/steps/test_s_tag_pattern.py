@@ -0,0 +1,73 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from s_tag_pattern import compile_s_tag_pattern, parse_s_tag_pattern, MalformedSTagPattern, STagPatternCache
+
+
+class TestSTagPattern(unittest.TestCase):
+
+    def test_single(self):
+        pattern = compile_s_tag_pattern("123")
+        self.assertEqual(pattern.kind, "single")
+        self.assertTrue(pattern.matches(123))
+        self.assertTrue(pattern.matches("123"))
+        self.assertFalse(pattern.matches(124))
+
+    def test_range_canonical(self):
+        pattern = compile_s_tag_pattern("300, 100-200,150 - 250, 251")
+        self.assertEqual(pattern.kind, "range")
+        self.assertEqual(pattern.intervals, ((100, 251), (300, 300)))
+        self.assertEqual(str(pattern), "100-251,300")
+        self.assertEqual((pattern.min, pattern.max, pattern.count), (100, 300, 153))
+        self.assertTrue(pattern.matches(251))
+        self.assertFalse(pattern.matches(252))
+        self.assertFalse(pattern.matches(5000))
+
+    def test_any(self):
+        pattern = compile_s_tag_pattern("any")
+        self.assertEqual(pattern.kind, "any")
+        self.assertEqual(str(pattern), "ANY")
+        self.assertTrue(pattern.matches(0))
+        self.assertTrue(pattern.matches(4095))
+        self.assertEqual(pattern.count, 4096)
+
+    def test_overlaps(self):
+        self.assertTrue(compile_s_tag_pattern("100-200").overlaps(compile_s_tag_pattern("200, 300")))
+        self.assertFalse(compile_s_tag_pattern("100-200").overlaps(compile_s_tag_pattern("201-300")))
+        self.assertTrue(compile_s_tag_pattern("ANY").overlaps(compile_s_tag_pattern("4000")))
+
+    def test_equal_patterns(self):
+        self.assertEqual(compile_s_tag_pattern("1,2,3"), compile_s_tag_pattern("1-3"))
+
+    def test_malformed(self):
+        for pattern in ["", "badstring", "123-", "123,", "200-100", "4096", "-5", "1-2-3"]:
+            with self.assertRaises(MalformedSTagPattern) as e:
+                compile_s_tag_pattern(pattern)
+            self.assertEqual(e.exception.message, "Malformed range %s" % pattern)
+
+    def test_cache_is_bounded(self):
+        cache = STagPatternCache(max_size=2)
+        first = cache.get("1")
+        self.assertIs(cache.get("1"), first)
+        cache.get("2")
+        cache.get("3")
+        self.assertEqual(list(cache.patterns.keys()), ["2", "3"])
+        self.assertIsNot(cache.get("1"), first)
+        self.assertEqual(cache.get("1"), parse_s_tag_pattern("1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import call, patch, Mock
+import requests_mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestSyncBNGPortMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xossynchronizer.mock_modelaccessor_build import mock_modelaccessor_config
+        mock_modelaccessor_config(test_path, [("fabric-crossconnect", "fabric-crossconnect.xproto"), ])
+
+        import xossynchronizer.modelaccessor
+        import mock_modelaccessor
+        reload(mock_modelaccessor)  # in case nose2 loaded it in a previous test
+        reload(xossynchronizer.modelaccessor)      # in case nose2 loaded it in a previous test
+
+        from sync_bng_port_mapping import SyncBNGPortMapping, model_accessor
+        self.model_accessor = model_accessor
+
+        from bng_index import get_bng_index
+        get_bng_index().invalidate()
+
+        from onos_endpoints import get_onos_endpoints
+        get_onos_endpoints().invalidate()
+
+        from crossconnect_index import get_crossconnect_index
+        self.crossconnect_index = get_crossconnect_index()
+        self.crossconnect_index.invalidate()
+
+        from xconnect_table import get_xconnect_tables
+        get_xconnect_tables().invalidate()
+
+        from s_tag_pattern import compile_s_tag_pattern
+        self.compile = compile_s_tag_pattern
+
+        # import all class names to globals
+        for (k, v) in model_accessor.all_model_classes.items():
+            globals()[k] = v
+
+        self.sync_step = SyncBNGPortMapping
+
+        # mock onos-fabric
+        self.onos_fabric = Service(name="onos-fabric",
+                                   rest_hostname="onos-fabric",
+                                   rest_port="8181",
+                                   rest_username="onos",
+                                   rest_password="rocks")
+
+        self.service = FabricCrossconnectService(name="fcservice",
+                                                 provider_services=[self.onos_fabric])
+
+        self.fcsis = [FabricCrossconnectServiceInstance(id=7000 + s_tag, owner=self.service, s_tag=s_tag,
+                                                        source_port=3, switch_datapath_id="of:0000000000000201")
+                      for s_tag in [100, 150, 222, 300]]
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_find_crossconnect_single(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects:
+            fcsi_objects.return_value = self.fcsis
+
+            fcsis = self.sync_step(model_accessor=self.model_accessor).find_crossconnect("222")
+            self.assertEqual([fcsi.s_tag for fcsi in fcsis], [222])
+
+    def filter_fcsis(self, fcsis):
+        # the mock object manager only supports equality, and find_crossconnect also filters by s-tag range
+        def filter(**kwargs):
+            first = kwargs.get("s_tag__gte", kwargs.get("s_tag"))
+            last = kwargs.get("s_tag__lte", kwargs.get("s_tag"))
+            return [fcsi for fcsi in fcsis if first <= fcsi.s_tag <= last]
+        return filter
+
+    def test_find_crossconnect_range(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter:
+            fcsi_objects.return_value = self.fcsis
+            fcsi_filter.side_effect = self.filter_fcsis(self.fcsis)
+
+            fcsis = self.sync_step(model_accessor=self.model_accessor).find_crossconnect("100-120, 200-250")
+            self.assertEqual([fcsi.s_tag for fcsi in fcsis], [100, 222])
+            # only the s-tags the index found are fetched, not the whole of 100-250
+            self.assertEqual(fcsi_filter.call_args_list, [call(s_tag=100), call(s_tag=222)])
+
+    def test_find_crossconnect_runs(self):
+        fcsis = self.fcsis + [FabricCrossconnectServiceInstance(id=7101, owner=self.service, s_tag=101, source_port=3,
+                                                                switch_datapath_id="of:0000000000000201")]
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter:
+            fcsi_objects.return_value = fcsis
+            fcsi_filter.side_effect = self.filter_fcsis(fcsis)
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+
+            # consecutive s-tags are fetched together
+            self.assertEqual([fcsi.id for fcsi in sync_step.find_crossconnect("100-200")], [7100, 7101, 7150])
+            self.assertEqual(fcsi_filter.call_args_list, [call(s_tag__gte=100, s_tag__lte=101), call(s_tag=150)])
+
+            # and too many runs are fetched in one scan between the lowest and highest s-tag
+            fcsi_filter.reset_mock()
+            sync_step.max_s_tag_queries = 2
+            self.assertEqual(len(sync_step.find_crossconnect("ANY")), 5)
+            self.assertEqual(fcsi_filter.call_args_list, [call(s_tag__gte=100, s_tag__lte=300)])
+
+    def test_find_crossconnect_not_indexed(self):
+        # the index still lists 7100, which has since been deleted, and doesn't know of 8000, which has been created
+        new_fcsi = FabricCrossconnectServiceInstance(id=8000, owner=self.service, s_tag=120, source_port=3,
+                                                     switch_datapath_id="of:0000000000000201")
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter:
+            fcsi_objects.return_value = self.fcsis
+            self.crossconnect_index.find(self.model_accessor.FabricCrossconnectServiceInstance, self.compile("ANY"))
+            fcsi_filter.side_effect = self.filter_fcsis(self.fcsis[1:] + [new_fcsi])
+
+            fcsis = self.sync_step(model_accessor=self.model_accessor).find_crossconnect("100-120")
+            # the index is out of date, so the bounds of the pattern are scanned
+            self.assertEqual([fcsi.id for fcsi in fcsis], [8000])
+            fcsi_filter.assert_called_with(s_tag__gte=100, s_tag__lte=120)
+            self.assertIsNone(self.crossconnect_index.ids)
+
+    def test_find_crossconnect_range_no_match(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter:
+            fcsi_objects.return_value = self.fcsis
+
+            fcsis = self.sync_step(model_accessor=self.model_accessor).find_crossconnect("400-500")
+            self.assertEqual(fcsis, [])
+            fcsi_filter.assert_not_called()
+
+    def test_find_crossconnect_any(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects:
+            fcsi_objects.return_value = self.fcsis
+
+            fcsis = self.sync_step(model_accessor=self.model_accessor).find_crossconnect("ANY")
+            self.assertEqual([fcsi.s_tag for fcsi in fcsis], [100, 150, 222, 300])
+
+
+    def test_crossconnect_index(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects:
+            fcsi_objects.return_value = self.fcsis
+            model = self.model_accessor.FabricCrossconnectServiceInstance
+
+            self.assertEqual(self.crossconnect_index.find(model, self.compile("100-200")), [(100, 7100), (150, 7150)])
+
+            self.crossconnect_index.add(8000, 120)
+            self.crossconnect_index.add(7150, 400)
+            self.crossconnect_index.remove(7100)
+            self.assertEqual(self.crossconnect_index.find(model, self.compile("100-200")), [(120, 8000)])
+            self.assertEqual(self.crossconnect_index.find(model, self.compile("222, 400")), [(222, 7222), (400, 7150)])
+            self.assertEqual(len(self.crossconnect_index.find(model, self.compile("ANY"))), 4)
+            self.assertEqual(fcsi_objects.call_count, 1)
+
+    def test_crossconnect_index_max_age(self):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects:
+            fcsi_objects.return_value = self.fcsis[:1]
+            model = self.model_accessor.FabricCrossconnectServiceInstance
+
+            self.assertEqual(self.crossconnect_index.find(model, self.compile("ANY")), [(100, 7100)])
+
+            # instances created elsewhere are picked up once the index is older than max_age
+            fcsi_objects.return_value = self.fcsis
+            self.assertEqual(len(self.crossconnect_index.find(model, self.compile("ANY"))), 1)
+            self.crossconnect_index.built_at -= self.crossconnect_index.max_age + 1
+            self.assertEqual(len(self.crossconnect_index.find(model, self.compile("ANY"))), 4)
+
+    @requests_mock.Mocker()
+    def test_remove_crossconnect_failures(self, m):
+        def delete(request, context):
+            context.status_code = 500 if request.json()["vlanId"] == 150 else 204
+            return "error"
+        m.delete("http://onos-fabric:8181/onos/segmentrouting/xconnect", text=delete)
+
+        saved = []
+        def save(fcsi, always_update_timestamp=False):
+            # every delete has been sent by the time anything is saved
+            self.assertEqual(m.call_count, 4)
+            saved.append(fcsi.s_tag)
+
+        with patch.object(type(self.fcsis[0]), "save", autospec=True) as fcsi_save:
+            fcsi_save.side_effect = save
+            with self.assertRaises(Exception) as e:
+                self.sync_step(model_accessor=self.model_accessor).remove_crossconnect(self.fcsis)
+
+        self.assertEqual(e.exception.message, "Failed to remove fabric crossconnect in ONOS: 7150: error")
+        self.assertEqual(saved, [100, 222, 300])
+
+    def mock_xconnects(self, m, ports):
+        """ Make ONOS report a crossconnect for each fcsi, ending at ports[s_tag] """
+        m.get("http://onos-fabric:8181/onos/segmentrouting/xconnect",
+              status_code=200,
+              json={"xconnects": [{"deviceId": fcsi.switch_datapath_id,
+                                   "vlanId": fcsi.s_tag,
+                                   "endpoints": [fcsi.source_port, ports[fcsi.s_tag]]} for fcsi in self.fcsis]})
+
+    def run_resolver(self, bng_mappings, method, model):
+        with patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(self.model_accessor.BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(self.model_accessor.FabricCrossconnectServiceInstance.objects, "filter") as fcsi_filter, \
+                patch.object(self.sync_step, "remove_crossconnect") as remove_crossconnect:
+            fcsi_objects.return_value = self.fcsis
+            fcsi_filter.side_effect = lambda s_tag=None, s_tag__gte=None, s_tag__lte=None: \
+                [fcsi for fcsi in self.fcsis if (fcsi.s_tag == s_tag) or (s_tag__gte <= fcsi.s_tag <= s_tag__lte)]
+            bng_objects.return_value = bng_mappings
+
+            getattr(self.sync_step(model_accessor=self.model_accessor), method)(model)
+
+            if not remove_crossconnect.called:
+                return []
+            return sorted([fcsi.s_tag for fcsi in remove_crossconnect.call_args[0][0]])
+
+    @requests_mock.Mocker()
+    def test_sync_any_port_change_skips_specific(self, m):
+        self.mock_xconnects(m, {100: 1, 150: 1, 222: 2, 300: 1})
+        any_mapping = BNGPortMapping(id=1, s_tag="ANY", switch_port=5)
+        single_mapping = BNGPortMapping(id=2, s_tag="222", switch_port=2)
+
+        removed = self.run_resolver([any_mapping, single_mapping], "sync_record", any_mapping)
+        self.assertEqual(removed, [100, 150, 300])
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_sync_unchanged_port(self, m):
+        self.mock_xconnects(m, {100: 1, 150: 1, 222: 1, 300: 1})
+        any_mapping = BNGPortMapping(id=1, s_tag="ANY", switch_port=1)
+        range_mapping = BNGPortMapping(id=2, s_tag="200-300", switch_port=1)
+
+        removed = self.run_resolver([any_mapping, range_mapping], "sync_record", range_mapping)
+        self.assertEqual(removed, [])
+
+    @requests_mock.Mocker()
+    def test_sync_s_tag_change(self, m):
+        self.mock_xconnects(m, {100: 1, 150: 1, 222: 2, 300: 1})
+        any_mapping = BNGPortMapping(id=1, s_tag="ANY", switch_port=1)
+        single_mapping = BNGPortMapping(id=2, s_tag="150", old_s_tag="222", switch_port=2)
+
+        removed = self.run_resolver([any_mapping, single_mapping], "sync_record", single_mapping)
+        self.assertEqual(removed, [150, 222])
+
+    @requests_mock.Mocker()
+    def test_delete_falls_back_to_any(self, m):
+        self.mock_xconnects(m, {100: 1, 150: 1, 222: 2, 300: 1})
+        any_mapping = BNGPortMapping(id=1, s_tag="ANY", switch_port=1)
+        range_mapping = BNGPortMapping(id=2, s_tag="200-300", switch_port=1)
+        single_mapping = BNGPortMapping(id=3, s_tag="222", switch_port=2)
+
+        removed = self.run_resolver([any_mapping, range_mapping], "delete_record", single_mapping)
+        self.assertEqual(removed, [222])
+
+    @requests_mock.Mocker()
+    def test_delete_last_mapping(self, m):
+        self.mock_xconnects(m, {100: 1, 150: 1, 222: 1, 300: 1})
+        range_mapping = BNGPortMapping(id=2, s_tag="100-200", switch_port=1)
+
+        removed = self.run_resolver([], "delete_record", range_mapping)
+        self.assertEqual(removed, [100, 150])
+
+
+if __name__ == '__main__':
+    unittest.main()
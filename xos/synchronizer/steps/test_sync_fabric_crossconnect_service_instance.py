@@ -12,9 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import absolute_import
 import unittest
 
 import functools
+import imp
 from mock import patch, Mock
 import requests_mock
 
@@ -66,6 +68,17 @@ class TestSyncFabricCrossconnectServiceInstance(unittest.TestCase):
         from helpers import Helpers
         self.helpers = Helpers
 
+        from bng_index import get_bng_index
+        self.bng_index = get_bng_index()
+        self.bng_index.invalidate()
+
+        from onos_endpoints import get_onos_endpoints
+        get_onos_endpoints().invalidate()
+
+        from metrics import get_metrics
+        self.metrics = get_metrics()
+        self.metrics.reset()
+
         # import all class names to globals
         for (k, v) in model_accessor.all_model_classes.items():
             globals()[k] = v
@@ -116,6 +129,17 @@ class TestSyncFabricCrossconnectServiceInstance(unittest.TestCase):
         self.assertEqual(d["user"], "onos")
         self.assertEqual(d["pass"], "rocks")
 
+    def test_get_instance_onos_client_cached(self):
+        fsi = FabricCrossconnectServiceInstance(id=7777, owner=self.service, owner_id=self.service.id)
+
+        with patch.object(self.helpers, "resolve_fabric_onos_info", wraps=self.helpers.resolve_fabric_onos_info) \
+                as resolve:
+            client = self.helpers.get_instance_onos_client(self.model_accessor, fsi)
+            self.assertIs(self.helpers.get_instance_onos_client(self.model_accessor, fsi), client)
+            self.assertEqual(resolve.call_count, 1)
+
+        self.assertEqual(client.url, "http://onos-fabric:8181")
+
     def test_range_matches_single(self):
         self.assertTrue(self.sync_step(model_accessor=self.model_accessor).range_matches(123, "123"))
 
@@ -165,6 +189,144 @@ class TestSyncFabricCrossconnectServiceInstance(unittest.TestCase):
             self.assertTrue(found_bng)
             self.assertEqual(found_bng.switch_port, 4)
 
+    def test_find_bng_single_over_range(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            bng_objects.return_value = [BNGPortMapping(s_tag="ANY", switch_port=4),
+                                        BNGPortMapping(s_tag="100-200", switch_port=5),
+                                        BNGPortMapping(s_tag="111", switch_port=6)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(111).switch_port, 6)
+            self.assertEqual(sync_step.find_bng(112).switch_port, 5)
+            self.assertEqual(sync_step.find_bng(300).switch_port, 4)
+            self.assertEqual(sync_step.find_bng(5000).switch_port, 4)
+
+    def test_find_bng_narrowest_range(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            bng_objects.return_value = [BNGPortMapping(id=1, s_tag="100-200", switch_port=4),
+                                        BNGPortMapping(id=2, s_tag="110-120", switch_port=5)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(111).switch_port, 5)
+            self.assertEqual(sync_step.find_bng(121).switch_port, 4)
+
+    def test_find_bng_index_reused(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            bng_objects.return_value = [BNGPortMapping(s_tag="100-200, 300", switch_port=4)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+            self.assertEqual(sync_step.find_bng(300).switch_port, 4)
+            with patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+                bng_filter.return_value = []
+                self.assertEqual(sync_step.find_bng(250), None)
+                bng_filter.assert_called_with(s_tag_min__lte=250, s_tag_max__gte=250)
+            self.assertEqual(bng_objects.call_count, 1)
+
+            # a changed mapping is picked up once the index is invalidated
+            bng_objects.return_value = [BNGPortMapping(s_tag="250", switch_port=5)]
+            self.bng_index.invalidate()
+            self.assertEqual(sync_step.find_bng(250).switch_port, 5)
+            with patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+                bng_filter.return_value = []
+                self.assertEqual(sync_step.find_bng(150), None)
+
+    def test_find_bng_malformed_other_copy(self):
+        # a second copy of s_tag_pattern, as imp.load_source makes, raises its own MalformedSTagPattern class
+        s_tag_pattern = imp.load_source("s_tag_pattern_copy", os.path.join(test_path, "s_tag_pattern.py"))
+        bng_index_module = sys.modules[type(self.bng_index).__module__]
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(BNGPortMapping.objects, "filter") as bng_filter, \
+                patch.object(bng_index_module, "compile_s_tag_pattern", s_tag_pattern.compile_s_tag_pattern):
+            bng_objects.return_value = [BNGPortMapping(s_tag="100-200", switch_port=4),
+                                        BNGPortMapping(s_tag="200-100", switch_port=5)]
+            bng_filter.return_value = [BNGPortMapping(s_tag="200-100", switch_port=5)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+            self.assertEqual(sync_step.find_bng(250), None)
+
+    def test_find_bng_index_miss_any(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+            bng_objects.return_value = [BNGPortMapping(s_tag="100-200", switch_port=4)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+
+            # an "ANY" mapping created after the index was built also covers s-tags outside of the VLAN range
+            bng_filter.return_value = [BNGPortMapping(s_tag="ANY", switch_port=5)]
+            self.assertEqual(sync_step.find_bng(5000).switch_port, 5)
+            bng_filter.assert_called_with(s_tag_kind="any")
+
+    def test_find_bng_index_miss_queries_database(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+            bng_objects.return_value = [BNGPortMapping(s_tag="100-200", switch_port=4)]
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+
+            # a mapping created after the index was built is found through its s_tag bounds
+            bng_filter.return_value = [BNGPortMapping(s_tag="250, 260", switch_port=5)]
+            self.assertEqual(sync_step.find_bng(260).switch_port, 5)
+            self.assertEqual(sync_step.find_bng(255), None)
+
+            self.assertEqual(self.metrics.bng_lookups.get(result="hit"), 2)
+            self.assertEqual(self.metrics.bng_lookups.get(result="miss"), 1)
+            # finding 260 in the database invalidated the index, so 255 was looked up in a rebuilt one
+            self.assertEqual(self.metrics.bng_fallback_scans.get(result="found"), 1)
+            self.assertEqual(self.metrics.bng_fallback_scans.get(result="not_found"), 0)
+            self.assertEqual(self.metrics.bng_index_builds.get(), 2)
+
+    def test_find_bng_index_miss_cached(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+            bng_objects.return_value = [BNGPortMapping(s_tag="100-200", switch_port=4)]
+            bng_filter.return_value = []
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            # a miss in a freshly built table is not asked for again
+            self.assertEqual(sync_step.find_bng(250), None)
+            self.assertEqual(sync_step.find_bng(250), None)
+            bng_filter.assert_not_called()
+
+            self.bng_index.built_at -= self.bng_index.max_age + 1
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+            self.bng_index.misses.clear()
+            # the database is asked once for a miss, until the index is invalidated
+            self.assertEqual(sync_step.find_bng(260), None)
+            self.assertEqual(sync_step.find_bng(260), None)
+            self.assertEqual(sync_step.find_bng(5000), None)
+            self.assertEqual(sync_step.find_bng(6000), None)
+            self.assertEqual(bng_filter.call_count, 2)
+
+            # a mapping created since is picked up once the index is invalidated
+            bng_objects.return_value.append(BNGPortMapping(s_tag="250, 260", switch_port=5))
+            self.bng_index.invalidate()
+            self.assertEqual(sync_step.find_bng(260).switch_port, 5)
+            self.assertEqual(bng_objects.call_count, 3)
+
+    def test_find_bng_index_built_unlocked(self):
+        def get_items():
+            # lookups that hit the table can go ahead while it is rebuilt
+            self.assertTrue(self.bng_index.lock.acquire(False))
+            self.bng_index.lock.release()
+            return [BNGPortMapping(s_tag="100-200", switch_port=4)]
+
+        with patch.object(BNGPortMapping.objects, "get_items", side_effect=get_items), \
+                patch.object(BNGPortMapping.objects, "filter") as bng_filter:
+            def find_candidates(**kwargs):
+                self.assertTrue(self.bng_index.lock.acquire(False))
+                self.bng_index.lock.release()
+                return []
+            bng_filter.side_effect = find_candidates
+
+            sync_step = self.sync_step(model_accessor=self.model_accessor)
+            self.assertEqual(sync_step.find_bng(150).switch_port, 4)
+            self.assertEqual(sync_step.find_bng(5000), None)
+            bng_filter.assert_called_once_with(s_tag_kind="any")
+
     @requests_mock.Mocker()
     def test_sync(self, m):
         with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
@@ -191,8 +353,87 @@ class TestSyncFabricCrossconnectServiceInstance(unittest.TestCase):
             self.assertTrue(m.called)
 
             self.assertEqual(fsi.backend_handle, "111/of:0000000000000201")
+            self.assertEqual(fsi.push_fingerprint, "of:0000000000000201/111/3,4")
             fcsi_save.assert_called()
 
+            self.assertEqual(self.metrics.sync_seconds.count(step="SyncFabricCrossconnectServiceInstance",
+                                                             operation="sync_record", result="success"), 1)
+            self.assertEqual(self.metrics.onos_request_seconds.count(method="POST", status="200"), 1)
+            self.assertEqual(self.metrics.xconnect_pushes.get(result="pushed"), 1)
+
+    @requests_mock.Mocker()
+    def test_sync_already_pushed(self, m):
+        with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save") as fcsi_save:
+
+            fsi = FabricCrossconnectServiceInstance(id=7777, owner=self.service, s_tag=111, source_port=3,
+                                                    switch_datapath_id="of:0000000000000201", updated=1, policed=2,
+                                                    backend_handle="111/of:0000000000000201",
+                                                    push_fingerprint="of:0000000000000201/111/3,4")
+
+            serviceinstance_objects.return_value = [fsi]
+
+            bngmapping = BNGPortMapping(s_tag="111", switch_port=4)
+            bng_objects.return_value = [bngmapping]
+
+            m.post("http://onos-fabric:8181/onos/segmentrouting/xconnect", status_code=200)
+
+            from sync_fabric_crossconnect_service_instance import get_push_stats
+            skipped = get_push_stats()["skipped"]
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(fsi)
+            self.assertFalse(m.called)
+            fcsi_save.assert_not_called()
+            self.assertEqual(get_push_stats()["skipped"], skipped + 1)
+
+    @requests_mock.Mocker()
+    def test_sync_fingerprint_changed(self, m):
+        with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save") as fcsi_save:
+
+            fsi = FabricCrossconnectServiceInstance(id=7777, owner=self.service, s_tag=111, source_port=3,
+                                                    switch_datapath_id="of:0000000000000201", updated=1, policed=2,
+                                                    backend_handle="111/of:0000000000000201",
+                                                    push_fingerprint="of:0000000000000201/111/3,5")
+
+            serviceinstance_objects.return_value = [fsi]
+
+            bngmapping = BNGPortMapping(s_tag="111", switch_port=4)
+            bng_objects.return_value = [bngmapping]
+
+            m.post("http://onos-fabric:8181/onos/segmentrouting/xconnect", status_code=200)
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(fsi)
+            self.assertTrue(m.called)
+            self.assertEqual(fsi.push_fingerprint, "of:0000000000000201/111/3,4")
+
+    @requests_mock.Mocker()
+    def test_sync_superseded(self, m):
+        from xconnect_queue import get_xconnect_queue
+        with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(FabricCrossconnectServiceInstance, "save") as fcsi_save, \
+                patch.object(get_xconnect_queue(), "post") as queue_post:
+
+            fsi = FabricCrossconnectServiceInstance(id=7777, owner=self.service, s_tag=111, source_port=3,
+                                                    switch_datapath_id="of:0000000000000201", updated=1, policed=2)
+
+            serviceinstance_objects.return_value = [fsi]
+
+            bngmapping = BNGPortMapping(s_tag="111", switch_port=4)
+            bng_objects.return_value = [bngmapping]
+
+            queue_post.return_value.wait.return_value = None
+
+            with self.assertRaises(DeferredException):
+                self.sync_step(model_accessor=self.model_accessor).sync_record(fsi)
+
+            self.assertIsNone(fsi.backend_handle)
+            self.assertIsNone(fsi.push_fingerprint)
+            fcsi_save.assert_not_called()
+
     def test_sync_no_bng_mapping(self):
         with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects:
 
@@ -218,6 +459,8 @@ class TestSyncFabricCrossconnectServiceInstance(unittest.TestCase):
                 self.sync_step(model_accessor=self.model_accessor).sync_record(fsi)
 
             self.assertEqual(e.exception.message, "Waiting for model_policy to run on fcsi 7777")
+            self.assertEqual(self.metrics.sync_seconds.count(step="SyncFabricCrossconnectServiceInstance",
+                                                             operation="sync_record", result="deferred"), 1)
 
     def test_sync_no_s_tag(self):
         with patch.object(ServiceInstance.objects, "get_items") as serviceinstance_objects:
@@ -0,0 +1,202 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from mock import patch, Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestXconnectQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xconnect_queue import XconnectQueue
+        self.queue = XconnectQueue(window=0)
+
+        self.client = Mock(url="http://onos-fabric:8181")
+        self.client.request_budget.return_value = 10
+        self.client.request.side_effect = lambda method, path, json: Mock(status_code=200, method=method, data=json)
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def data(self, vlan, device="of:0000000000000201"):
+        return {"deviceId": device, "vlanId": vlan}
+
+    def sent(self):
+        return [(args[0], kwargs["json"]["deviceId"], kwargs["json"]["vlanId"])
+                for (args, kwargs) in self.client.request.call_args_list]
+
+    def test_delete_then_post(self):
+        with patch.object(self.queue, "start"):
+            delete = self.queue.delete(self.client, self.data(222))
+            post = self.queue.post(self.client, self.data(222))
+            self.queue.flush(self.queue.take())
+
+        self.assertEqual(self.sent(), [("POST", "of:0000000000000201", 222)])
+        self.assertIsNone(delete.wait())
+        self.assertEqual(post.wait().method, "POST")
+        self.assertEqual(self.queue.coalesced, 1)
+
+    def test_post_then_delete(self):
+        with patch.object(self.queue, "start"):
+            post = self.queue.post(self.client, self.data(222))
+            delete = self.queue.delete(self.client, self.data(222))
+            self.queue.flush(self.queue.take())
+
+        self.assertEqual(self.sent(), [("DELETE", "of:0000000000000201", 222)])
+        self.assertIsNone(post.wait())
+        self.assertEqual(delete.wait().method, "DELETE")
+
+    def test_lanes(self):
+        with patch.object(self.queue, "start"):
+            self.queue.post(self.client, self.data(100))
+            self.queue.post(self.client, self.data(100, device="of:0000000000000202"))
+            self.queue.delete(self.client, self.data(200))
+            self.queue.post(self.client, self.data("100"))
+            self.queue.flush(self.queue.take())
+
+        # lanes are flushed concurrently, so only the order within a device is fixed
+        self.assertEqual(sorted(self.sent(), key=lambda sent: sent[1]), [("DELETE", "of:0000000000000201", 200),
+                                                                       ("POST", "of:0000000000000201", "100"),
+                                                                       ("POST", "of:0000000000000202", 100)])
+        self.assertEqual((self.queue.submitted, self.queue.coalesced), (4, 1))
+
+    def test_error(self):
+        self.client.request.side_effect = Exception("connection refused")
+        with patch.object(self.queue, "start"):
+            post = self.queue.post(self.client, self.data(222))
+            self.queue.flush(self.queue.take())
+
+        with self.assertRaises(Exception) as e:
+            post.wait()
+        self.assertEqual(e.exception.message, "connection refused")
+
+    def test_wait_timeout(self):
+        self.client.request_budget.return_value = 0.01
+        with patch.object(self.queue, "start"):
+            first = self.queue.post(self.client, self.data(100))
+            second = self.queue.post(self.client, self.data(200))
+
+        # the default timeout allows for every operation up to this one in the lane to use its whole budget
+        self.assertEqual(first.default_timeout(), 0.01)
+        self.assertEqual(second.default_timeout(), 0.02)
+        with self.assertRaises(Exception) as e:
+            second.wait()
+        self.assertIn("Timed out", e.exception.message)
+
+        # an operation its caller gave up on is never sent
+        self.queue.flush(self.queue.take())
+        self.assertEqual(self.sent(), [("POST", "of:0000000000000201", 100)])
+        self.assertEqual(first.wait().status_code, 200)
+        self.assertTrue(second.cancelled)
+
+    def test_wait_timeout_in_flight(self):
+        self.client.request_budget.return_value = 5
+        sending = threading.Event()
+        proceed = threading.Event()
+
+        def request(method, path, json):
+            sending.set()
+            proceed.wait(5)
+            return Mock(status_code=200)
+        self.client.request.side_effect = request
+
+        with patch.object(self.queue, "start"):
+            post = self.queue.post(self.client, self.data(100))
+        flusher = threading.Thread(target=self.queue.flush, args=(self.queue.take(),))
+        flusher.start()
+        sending.wait(5)
+
+        # the operation is already being sent, so it can't be cancelled and its response is waited for
+        threading.Timer(0.05, proceed.set).start()
+        self.assertEqual(post.wait(timeout=0.01).status_code, 200)
+        self.assertFalse(post.cancelled)
+        flusher.join()
+
+    def test_lanes_concurrent(self):
+        # the request for the first device only completes once the second device's request has started
+        started = threading.Event()
+
+        def request(method, path, json):
+            if json["deviceId"] == "of:0000000000000202":
+                started.set()
+            elif not started.wait(5):
+                raise Exception("lanes were flushed serially")
+            return Mock(status_code=200, data=json)
+        self.client.request.side_effect = request
+
+        with patch.object(self.queue, "start"):
+            ops = [self.queue.post(self.client, self.data(vlan, device=device))
+                   for device in ["of:0000000000000201", "of:0000000000000202"] for vlan in range(5)]
+            self.queue.flush(self.queue.take())
+
+        for op in ops:
+            self.assertEqual(op.wait().status_code, 200)
+
+        # each device's operations are sent in the order they were submitted
+        for device in ["of:0000000000000201", "of:0000000000000202"]:
+            self.assertEqual([vlan for (method, d, vlan) in self.sent() if d == device], range(5))
+
+    def test_onos_concurrency(self):
+        from xconnect_queue import XconnectQueue
+        queue = XconnectQueue(window=0, onos_concurrency=1)
+
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def request(client, method, path, json):
+            with lock:
+                active[client.url] = active.get(client.url, 0) + 1
+                peak[client.url] = max(peak.get(client.url, 0), active[client.url])
+            time.sleep(0.05)
+            with lock:
+                active[client.url] -= 1
+            return Mock(status_code=200)
+
+        clients = [Mock(url="http://onos-%d:8181" % i) for i in range(2)]
+        for client in clients:
+            client.request.side_effect = lambda method, path, json, client=client: request(client, method, path, json)
+
+        with patch.object(queue, "start"):
+            for client in clients:
+                for device in ["of:0000000000000201", "of:0000000000000202", "of:0000000000000203"]:
+                    queue.post(client, self.data(100, device=device))
+            queue.flush(queue.take())
+
+        self.assertEqual(peak, {"http://onos-0:8181": 1, "http://onos-1:8181": 1})
+
+    def test_flusher_thread(self):
+        ops = [self.queue.post(self.client, self.data(vlan)) for vlan in range(10)]
+        self.assertEqual([op.wait(timeout=10).data["vlanId"] for op in ops], range(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
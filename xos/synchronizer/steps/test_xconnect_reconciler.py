@@ -0,0 +1,293 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch, Mock
+import requests_mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestXconnectReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xossynchronizer.mock_modelaccessor_build import mock_modelaccessor_config
+        mock_modelaccessor_config(test_path, [("fabric-crossconnect", "fabric-crossconnect.xproto"), ])
+
+        import xossynchronizer.modelaccessor
+        import mock_modelaccessor
+        reload(mock_modelaccessor)  # in case nose2 loaded it in a previous test
+        reload(xossynchronizer.modelaccessor)      # in case nose2 loaded it in a previous test
+
+        from xossynchronizer.modelaccessor import model_accessor
+        self.model_accessor = model_accessor
+
+        from xconnect_reconciler import XconnectReconciler
+        self.reconciler = XconnectReconciler
+
+        from bng_index import get_bng_index
+        get_bng_index().invalidate()
+
+        from onos_endpoints import get_onos_endpoints
+        get_onos_endpoints().invalidate()
+
+        from xconnect_table import get_xconnect_tables
+        get_xconnect_tables().invalidate()
+
+        # import all class names to globals
+        for (k, v) in model_accessor.all_model_classes.items():
+            globals()[k] = v
+
+        # mock onos-fabric
+        self.onos_fabric = Service(name="onos-fabric",
+                                   rest_hostname="onos-fabric",
+                                   rest_port="8181",
+                                   rest_username="onos",
+                                   rest_password="rocks")
+
+        self.service = FabricCrossconnectService(id=1, name="fcservice", provider_services=[self.onos_fabric])
+
+        self.device = "of:0000000000000201"
+        self.fcsis = [FabricCrossconnectServiceInstance(id=7000 + s_tag, owner=self.service, owner_id=1, s_tag=s_tag,
+                                                        source_port=3, switch_datapath_id=self.device,
+                                                        backend_handle="%d/%s" % (s_tag, self.device))
+                      for s_tag in [100, 150, 222, 300]]
+        self.fcsis[3].backend_handle = None
+
+        self.bng_mappings = [BNGPortMapping(id=1, s_tag="ANY", switch_port=4)]
+
+        self.url = "http://onos-fabric:8181/onos/segmentrouting/xconnect"
+        self.xconnects = [{"deviceId": self.device, "vlanId": 100, "endpoints": [4, 3]},
+                          {"deviceId": self.device, "vlanId": 222, "endpoints": [3, 5]},
+                          {"deviceId": self.device, "vlanId": 999, "endpoints": [3, 4]},
+                          {"deviceId": "of:0000000000000202", "vlanId": 500, "endpoints": [3, 4]}]
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def reconcile(self, **kwargs):
+        with patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            fcsi_objects.return_value = self.fcsis
+            bng_objects.return_value = self.bng_mappings
+
+            return self.reconciler(self.model_accessor, **kwargs).reconcile()
+
+    def writes(self, m):
+        return sorted([(r.method, r.json()["vlanId"], r.json().get("endpoints")) for r in m.request_history
+                       if r.method != "GET"])
+
+    def test_desired_state(self):
+        with patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            fcsi_objects.return_value = self.fcsis
+            bng_objects.return_value = self.bng_mappings
+
+            desired = self.reconciler(self.model_accessor).desired_state()
+
+        self.assertEqual(desired.keys(), ["http://onos-fabric:8181"])
+        self.assertEqual(desired["http://onos-fabric:8181"][1], {(self.device, 100): [3, 4],
+                                                                 (self.device, 150): [3, 4],
+                                                                 (self.device, 222): [3, 4]})
+
+    @requests_mock.Mocker()
+    def test_reconcile(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": self.xconnects})
+        m.post(self.url, status_code=200)
+        m.delete(self.url, status_code=204)
+
+        stats = self.reconcile()
+
+        self.assertEqual(stats, {"missing": 1, "changed": 1, "extra": 1, "failed": 0})
+        self.assertEqual(len([r for r in m.request_history if r.method == "GET"]), 1)
+        self.assertEqual(self.writes(m), [("DELETE", 999, None), ("POST", 150, [3, 4]), ("POST", 222, [3, 4])])
+
+    @requests_mock.Mocker()
+    def test_reconcile_no_prune(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": self.xconnects})
+        m.post(self.url, status_code=200)
+
+        stats = self.reconcile(prune=False)
+
+        self.assertEqual(stats, {"missing": 1, "changed": 1, "extra": 0, "failed": 0})
+        self.assertEqual(self.writes(m), [("POST", 150, [3, 4]), ("POST", 222, [3, 4])])
+
+    @requests_mock.Mocker()
+    def test_reconcile_keeps_claimed(self, m):
+        # 222 no longer resolves to a BNG port, 300 has been pushed by the sync step but not saved yet, and 400 is
+        # the xconnect 150 had before its s_tag changed
+        self.bng_mappings = [BNGPortMapping(id=1, s_tag="100-200", switch_port=4)]
+        self.fcsis[1].backend_handle = "400/%s" % self.device
+        m.get(self.url, status_code=200, json={"xconnects": self.xconnects + [
+            {"deviceId": self.device, "vlanId": s_tag, "endpoints": [3, 4]} for s_tag in [300, 400]]})
+        m.post(self.url, status_code=200)
+        m.delete(self.url, status_code=204)
+
+        with patch.object(BNGPortMapping.objects, "filter", return_value=[]):
+            stats = self.reconcile()
+
+        self.assertEqual(stats, {"missing": 1, "changed": 0, "extra": 1, "failed": 0})
+        self.assertEqual(self.writes(m), [("DELETE", 999, None), ("POST", 150, [3, 4])])
+
+    def new_fcsi(self, s_tag):
+        return FabricCrossconnectServiceInstance(id=7000 + s_tag, owner=self.service, owner_id=1, s_tag=s_tag,
+                                                 source_port=3, switch_datapath_id=self.device,
+                                                 backend_handle="%d/%s" % (s_tag, self.device),
+                                                 push_fingerprint="%s/%d/3,4" % (self.device, s_tag))
+
+    @requests_mock.Mocker()
+    def test_reconcile_created_during_read(self, m):
+        # 999 is created and pushed by the sync step while ONOS is being read
+        def get(request, context):
+            self.fcsis.append(self.new_fcsi(999))
+            return {"xconnects": self.xconnects}
+        m.get(self.url, status_code=200, json=get)
+        m.post(self.url, status_code=200)
+        m.delete(self.url, status_code=204)
+
+        stats = self.reconcile()
+
+        self.assertEqual(stats, {"missing": 1, "changed": 1, "extra": 0, "failed": 0})
+        self.assertEqual(self.writes(m), [("POST", 150, [3, 4]), ("POST", 222, [3, 4])])
+
+    @requests_mock.Mocker()
+    def test_reconcile_created_before_delete(self, m):
+        # 999 is created after the instances were read, but before its xconnect is deleted
+        m.get(self.url, status_code=200, json={"xconnects": self.xconnects})
+        m.post(self.url, status_code=200)
+        m.delete(self.url, status_code=204)
+
+        reads = []
+
+        def get_items():
+            reads.append(True)
+            return self.fcsis + ([self.new_fcsi(999)] if len(reads) > 2 else [])
+
+        with patch.object(FabricCrossconnectServiceInstance.objects, "get_items") as fcsi_objects, \
+                patch.object(BNGPortMapping.objects, "get_items") as bng_objects:
+            fcsi_objects.side_effect = get_items
+            bng_objects.return_value = self.bng_mappings
+
+            stats = self.reconciler(self.model_accessor).reconcile()
+
+        self.assertEqual(stats, {"missing": 1, "changed": 1, "extra": 0, "failed": 0})
+        self.assertEqual(self.writes(m), [("POST", 150, [3, 4]), ("POST", 222, [3, 4])])
+
+    @requests_mock.Mocker()
+    def test_reconcile_in_sync(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": [
+            {"deviceId": self.device, "vlanId": s_tag, "endpoints": [3, 4]} for s_tag in [100, 150, 222]]})
+
+        stats = self.reconcile()
+
+        self.assertEqual(stats, {"missing": 0, "changed": 0, "extra": 0, "failed": 0})
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_reconcile_failure(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": self.xconnects})
+        m.post(self.url, status_code=500, text="error")
+        m.delete(self.url, status_code=204)
+
+        stats = self.reconcile()
+
+        self.assertEqual(stats["failed"], 2)
+
+    def replay(self):
+        with patch.object(BNGPortMapping.objects, "get_items") as bng_objects, \
+                patch.object(type(self.fcsis[0]), "save") as fcsi_save:
+            bng_objects.return_value = self.bng_mappings
+
+            remaining = self.reconciler(self.model_accessor).replay(self.fcsis)
+            return (remaining, fcsi_save)
+
+    @requests_mock.Mocker()
+    def test_replay(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": []})
+        m.post(self.url, status_code=200)
+        self.fcsis[0].push_fingerprint = "%s/100/3,4" % self.device
+
+        (remaining, fcsi_save) = self.replay()
+
+        # every synchronized instance is pushed without reading ONOS first
+        self.assertEqual(self.writes(m), [("POST", 100, [3, 4]), ("POST", 150, [3, 4]), ("POST", 222, [3, 4])])
+        self.assertEqual(remaining, [self.fcsis[3]])
+        self.assertEqual(self.fcsis[1].push_fingerprint, "%s/150/3,4" % self.device)
+        # the fingerprint of fcsis[0] was already up to date
+        self.assertEqual(fcsi_save.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_replay_failure(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": []})
+        m.post(self.url, status_code=500, text="error")
+
+        (remaining, fcsi_save) = self.replay()
+
+        self.assertEqual(remaining, self.fcsis)
+        fcsi_save.assert_not_called()
+
+    @requests_mock.Mocker()
+    def test_replay_waits_for_onos(self, m):
+        m.get(self.url, [{"status_code": 404, "text": "not yet"}, {"status_code": 200, "json": {"xconnects": []}}])
+        m.post(self.url, status_code=200)
+
+        with patch.object(self.reconciler, "ready_interval", 0):
+            (remaining, fcsi_save) = self.replay()
+
+        self.assertEqual(len([r for r in m.request_history if r.method == "GET"]), 2)
+        self.assertEqual(remaining, [self.fcsis[3]])
+
+    @requests_mock.Mocker()
+    def test_replay_onos_not_ready(self, m):
+        m.get(self.url, status_code=404, text="not yet")
+
+        with patch.object(self.reconciler, "ready_timeout", 0):
+            (remaining, fcsi_save) = self.replay()
+
+        self.assertEqual(self.writes(m), [])
+        self.assertEqual(remaining, self.fcsis)
+        fcsi_save.assert_not_called()
+
+    @requests_mock.Mocker()
+    def test_replay_superseded(self, m):
+        m.get(self.url, status_code=200, json={"xconnects": []})
+        self.fcsis[0].push_fingerprint = None
+
+        from xconnect_queue import get_xconnect_queue
+        superseded = Mock()
+        superseded.wait.return_value = None
+        with patch.object(get_xconnect_queue(), "post", return_value=superseded):
+            (remaining, fcsi_save) = self.replay()
+
+        # ONOS may not have the xconnects, so they are left to the sync step
+        self.assertEqual(remaining, self.fcsis)
+        self.assertIsNone(self.fcsis[0].push_fingerprint)
+        fcsi_save.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
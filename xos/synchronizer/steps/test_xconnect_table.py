@@ -0,0 +1,94 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch, Mock
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestXconnectTable(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "../test_fabric_crossconnect_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xconnect_table import XconnectTableCache
+        self.cache = XconnectTableCache()
+
+        self.xconnects = [{"deviceId": "of:0000000000000201", "vlanId": 222, "endpoints": [3, "4"]},
+                          {"deviceId": "of:0000000000000201", "vlanId": "333", "endpoints": [3, 5]}]
+        self.client = Mock(url="http://onos-fabric:8181")
+        self.client.get.side_effect = lambda path: Mock(status_code=200, json=lambda: {"xconnects": self.xconnects})
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+
+    def test_table(self):
+        table = self.cache.get(self.client)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.endpoints("of:0000000000000201", "222"), [3, 4])
+        self.assertEqual(table.endpoints("of:0000000000000201", 333), [3, 5])
+        self.assertIsNone(table.endpoints("of:0000000000000202", 222))
+        self.client.get.assert_called_once_with("/onos/segmentrouting/xconnect")
+
+    def test_reused_until_ttl(self):
+        table = self.cache.get(self.client)
+        self.assertIs(self.cache.get(self.client), table)
+        self.assertEqual(self.client.get.call_count, 1)
+
+        with patch("time.time") as now:
+            now.return_value = self.cache.tables[self.client.url][0] + self.cache.ttl + 1
+            self.assertIsNot(self.cache.get(self.client), table)
+        self.assertEqual(self.client.get.call_count, 2)
+
+    def test_invalidate(self):
+        other = Mock(url="http://other:8181")
+        other.get.side_effect = self.client.get.side_effect
+        self.cache.get(self.client)
+        self.cache.get(other)
+
+        self.cache.invalidate(self.client.url)
+        self.cache.get(self.client)
+        self.cache.get(other)
+        self.assertEqual((self.client.get.call_count, other.get.call_count), (2, 1))
+
+    def test_invalidate_during_fetch(self):
+        def get(path):
+            self.cache.invalidate(self.client.url)
+            return Mock(status_code=200, json=lambda: {"xconnects": self.xconnects})
+        self.client.get.side_effect = get
+
+        self.cache.get(self.client)
+        self.assertNotIn(self.client.url, self.cache.tables)
+
+    def test_fetch_error(self):
+        self.client.get.side_effect = lambda path: Mock(status_code=500, text="error")
+        with self.assertRaises(Exception) as e:
+            self.cache.get(self.client)
+        self.assertEqual(e.exception.message, "Failed to get onos devices")
+
+
+if __name__ == '__main__':
+    unittest.main()
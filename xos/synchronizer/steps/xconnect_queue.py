@@ -0,0 +1,218 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from xconnect_table import get_xconnect_tables, XCONNECT_PATH
+
+log = create_logger(Config().get('logging'))
+
+
+class XconnectOp(object):
+    """ A pending POST or DELETE of one xconnect.
+
+        wait() returns the ONOS response once the operation has been sent, or None if a later operation on the same
+        (deviceId, vlanId) superseded it before it was sent. It raises if the operation hasn't finished within
+        timeout seconds, which defaults to the time the operations up to this one in its lane could take with all
+        of their retries. The timeout doesn't allow for time spent waiting behind other lanes or batches, so an
+        operation that hasn't been sent when it expires is cancelled rather than sent after its caller gave up. One
+        that is already being sent is waited for, since its request is bounded by its own budget.
+    """
+
+    def __init__(self, client, method, data, position=1, window=0):
+        self.client = client
+        self.method = method
+        self.data = data
+        self.position = position
+        self.window = window
+        self.response = None
+        self.error = None
+        self.superseded = False
+        self.cancelled = False
+        self.started = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    @property
+    def vlan(self):
+        return int(self.data["vlanId"])
+
+    def finish(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.done.set()
+
+    def supersede(self):
+        self.superseded = True
+        self.done.set()
+
+    def start(self):
+        """ Mark the operation as being sent. Returns False if it was cancelled, and must not be sent. """
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.started = True
+            return True
+
+    def cancel(self):
+        """ Cancel the operation unless it is already being sent. Returns True if it was cancelled. """
+        with self.lock:
+            if self.started:
+                return False
+            self.cancelled = True
+        self.done.set()
+        return True
+
+    def default_timeout(self):
+        return self.window + self.client.request_budget() * self.position
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout()
+        if not self.done.wait(timeout):
+            if self.cancel():
+                raise Exception("Timed out waiting for ONOS to %s xconnect %s, it was not sent"
+                                % (self.method, self.data))
+            if not self.done.wait(self.client.request_budget()):
+                raise Exception("Timed out waiting for ONOS to %s xconnect %s" % (self.method, self.data))
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class XconnectQueue(object):
+    """ Coalesces xconnect operations on their way to ONOS.
+
+        Operations are collected for `window` seconds in lanes keyed by (ONOS, deviceId). Within a lane only the
+        last operation for each vlanId is kept: a DELETE followed by a POST becomes the POST, since ONOS replaces
+        an existing xconnect on POST, and a POST followed by a DELETE becomes the DELETE.
+
+        The lanes left over are then flushed concurrently, up to `concurrency` at a time and no more than
+        `onos_concurrency` for any one ONOS, so that a resync across many devices is bounded by ONOS rather than by
+        the round trip time of each request. Operations within a lane are sent one after the other in the order they
+        were submitted, which keeps the writes to a device ordered. After a lane is flushed, the cached xconnect table
+        of its ONOS is invalidated.
+    """
+
+    window = 0.05
+    concurrency = 8
+    onos_concurrency = 4
+
+    def __init__(self, window=None, concurrency=None, onos_concurrency=None):
+        if window is not None:
+            self.window = window
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if onos_concurrency is not None:
+            self.onos_concurrency = onos_concurrency
+        self.pool = None
+        self.onos_slots = {}
+        self.cond = threading.Condition()
+        self.pending = OrderedDict()
+        self.thread = None
+        self.submitted = 0
+        self.coalesced = 0
+
+    def start(self):
+        if (self.thread is None) or (not self.thread.is_alive()):
+            self.thread = threading.Thread(target=self.run, name="xconnect-queue")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def submit(self, client, method, data):
+        lane = (client.url, str(data["deviceId"]))
+        vlan = int(data["vlanId"])
+        with self.cond:
+            ops = self.pending.setdefault(lane, OrderedDict())
+            previous = ops.pop(vlan, None)
+            if previous is not None:
+                log.info("Coalescing xconnect operation", deviceId=data["deviceId"], vlanId=vlan,
+                         superseded=previous.method, method=method)
+                previous.supersede()
+                self.coalesced += 1
+            op = XconnectOp(client, method, data, position=len(ops) + 1, window=self.window)
+            ops[vlan] = op
+            self.submitted += 1
+            self.start()
+            self.cond.notify()
+        return op
+
+    def post(self, client, data):
+        return self.submit(client, "POST", data)
+
+    def delete(self, client, data):
+        return self.submit(client, "DELETE", data)
+
+    def take(self):
+        with self.cond:
+            batch = self.pending
+            self.pending = OrderedDict()
+        return batch
+
+    def send(self, op):
+        if not op.start():
+            log.info("Not sending cancelled xconnect operation", method=op.method, body=op.data)
+            return
+        try:
+            op.finish(response=op.client.request(op.method, XCONNECT_PATH, json=op.data))
+        except Exception as e:
+            op.finish(error=e)
+
+    def get_onos_slots(self, url):
+        with self.cond:
+            slots = self.onos_slots.get(url)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.onos_concurrency)
+                self.onos_slots[url] = slots
+            return slots
+
+    def flush_lane(self, lane_ops):
+        (lane, ops) = lane_ops
+        with self.get_onos_slots(lane[0]):
+            for op in ops.values():
+                self.send(op)
+        # our own writes make any cached snapshot of this ONOS stale
+        get_xconnect_tables().invalidate(lane[0])
+
+    def flush(self, batch):
+        if len(batch) <= 1:
+            for lane_ops in batch.items():
+                self.flush_lane(lane_ops)
+            return
+        if self.pool is None:
+            self.pool = ThreadPool(self.concurrency)
+        # wait for every lane, so that the next batch for a device can't overtake this one
+        self.pool.map(self.flush_lane, batch.items())
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+            # let operations from other steps accumulate before flushing them
+            time.sleep(self.window)
+            self.flush(self.take())
+
+
+_xconnect_queue = XconnectQueue()
+
+
+def get_xconnect_queue():
+    return _xconnect_queue
@@ -0,0 +1,280 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from collections import OrderedDict
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from helpers import Helpers
+from bng_index import get_bng_index
+from xconnect_queue import get_xconnect_queue
+from xconnect_table import get_xconnect_tables, XCONNECT_PATH
+
+log = create_logger(Config().get('logging'))
+
+
+class XconnectReconciler(object):
+    """ Brings the xconnects in ONOS in line with XOS.
+
+        The desired xconnects are built from every FabricCrossconnectServiceInstance that has been synchronized,
+        with the east port resolved through the BNGPortMapping index. The actual xconnects are read from each ONOS
+        once, and only the differences are written back:
+
+            missing ... desired but not in ONOS, POSTed
+            changed ... in ONOS with different endpoints, POSTed
+            extra ..... in ONOS on a device we manage, but not claimed by any FabricCrossconnectServiceInstance,
+                        DELETEd unless prune is False
+
+        An xconnect is claimed by every instance whose s_tag and switch_datapath_id, or whose backend_handle, point
+        at it, whether the instance is synchronized or not and whether its BNGPortMapping resolves or not. That keeps
+        the reconciler from deleting an xconnect that the sync step has pushed but not recorded yet, or every
+        xconnect whose mapping is briefly missing from the BNGPortMapping index.
+
+        Xconnects on devices that no FabricCrossconnectServiceInstance uses are never touched, since they may have
+        been configured by something other than XOS.
+    """
+
+    prune = True
+    # how long replay() waits for a restarted ONOS to answer, and how often it asks
+    ready_timeout = 120
+    ready_interval = 5
+
+    def __init__(self, model_accessor, prune=None):
+        self.model_accessor = model_accessor
+        if prune is not None:
+            self.prune = prune
+
+    def desired_entries(self, fcsis):
+        """ Yield (fcsi, client, (deviceId, vlanId), endpoints) for each synchronized instance in fcsis. endpoints is
+            None if no BNGPortMapping covers the instance's s-tag.
+        """
+        BNGPortMapping = self.model_accessor.BNGPortMapping
+
+        for fcsi in sorted(fcsis, key=lambda fcsi: fcsi.id):
+            if (not fcsi.backend_handle) or (fcsi.s_tag is None) or (fcsi.source_port is None) or \
+                    (not fcsi.switch_datapath_id):
+                # not synchronized yet, that's for the sync step to do
+                continue
+
+            client = Helpers.get_instance_onos_client(self.model_accessor, fcsi)
+            key = (str(fcsi.switch_datapath_id), int(fcsi.s_tag))
+
+            bng_mapping = get_bng_index().lookup(BNGPortMapping, fcsi.s_tag)
+            if not bng_mapping:
+                log.warning("Unable to determine BNG port for s_tag", s_tag=fcsi.s_tag, fcsi=fcsi.id)
+                yield (fcsi, client, key, None)
+                continue
+
+            yield (fcsi, client, key, [int(fcsi.source_port), int(bng_mapping.switch_port)])
+
+    def claimed_keys(self, fcsis):
+        """ Return the set of (deviceId, vlanId) claimed by any instance in fcsis """
+        claimed = set()
+        for fcsi in fcsis:
+            if (fcsi.s_tag is not None) and fcsi.switch_datapath_id:
+                claimed.add((str(fcsi.switch_datapath_id), int(fcsi.s_tag)))
+            if fcsi.backend_handle:
+                try:
+                    (s_tag, switch_datapath_id) = Helpers.extract_handle(fcsi.backend_handle)
+                except ValueError:
+                    continue
+                claimed.add((str(switch_datapath_id), s_tag))
+        return claimed
+
+    def desired_state(self, fcsis=None):
+        """ Return {onos url: (client, {(deviceId, vlanId): endpoints})} """
+        desired = {}
+        if fcsis is None:
+            fcsis = self.model_accessor.FabricCrossconnectServiceInstance.objects.all()
+
+        for (fcsi, client, key, endpoints) in self.desired_entries(fcsis):
+            if endpoints is None:
+                continue
+            (client, xconnects) = desired.setdefault(client.url, (client, {}))
+            if (key in xconnects) and (xconnects[key] != endpoints):
+                log.warning("Conflicting crossconnects for device and s_tag", deviceId=key[0], vlanId=key[1],
+                            fcsi=fcsi.id)
+                continue
+            xconnects[key] = endpoints
+
+        return desired
+
+    def diff(self, desired, table, claimed=()):
+        """ Return (missing, changed, extra) lists of (deviceId, vlanId) between desired and an XconnectTable.
+            Xconnects in claimed are never extra.
+        """
+        missing = []
+        changed = []
+        for (key, endpoints) in sorted(desired.items()):
+            actual = table.endpoints(*key)
+            if actual is None:
+                missing.append(key)
+            elif sorted(actual) != sorted(endpoints):
+                changed.append(key)
+
+        devices = set([device_id for (device_id, vlan_id) in desired])
+        extra = sorted([key for key in table.xconnects
+                        if (key[0] in devices) and (key not in desired) and (key not in claimed)])
+        return (missing, changed, extra)
+
+    def fetch_tables(self, fcsis):
+        """ Read the current xconnect table of every ONOS that the synchronized instances in fcsis use, returning
+            {onos url: XconnectTable}
+        """
+        tables = {}
+        for fcsi in fcsis:
+            if not fcsi.backend_handle:
+                continue
+            client = Helpers.get_instance_onos_client(self.model_accessor, fcsi)
+            if client.url not in tables:
+                # always read the current state, rather than a snapshot from before our last writes
+                get_xconnect_tables().invalidate(client.url)
+                tables[client.url] = get_xconnect_tables().get(client)
+        return tables
+
+    def is_claimed(self, key):
+        """ Ask the database whether any instance claims the xconnect key now """
+        FabricCrossconnectServiceInstance = self.model_accessor.FabricCrossconnectServiceInstance
+        (device_id, vlan_id) = key
+        return bool(FabricCrossconnectServiceInstance.objects.filter(switch_datapath_id=device_id, s_tag=vlan_id) or
+                    FabricCrossconnectServiceInstance.objects.filter(backend_handle="%s/%s" % (vlan_id, device_id)))
+
+    def reconcile(self):
+        """ Reconcile every ONOS, returning a dict of counts of the xconnects that were written.
+
+            ONOS is read before the instances are, so that an instance created and pushed in between is seen as
+            claiming its xconnect rather than the xconnect being seen as extra. Each extra xconnect is checked against
+            the database once more before it is deleted.
+        """
+        stats = {"missing": 0, "changed": 0, "extra": 0, "failed": 0}
+        ops = []
+        FabricCrossconnectServiceInstance = self.model_accessor.FabricCrossconnectServiceInstance
+        tables = self.fetch_tables(FabricCrossconnectServiceInstance.objects.all())
+
+        fcsis = list(FabricCrossconnectServiceInstance.objects.all())
+        claimed = self.claimed_keys(fcsis)
+        for (url, (client, desired)) in sorted(self.desired_state(fcsis).items()):
+            table = tables.get(url)
+            prune = self.prune and (table is not None)
+            if table is None:
+                # an ONOS that only showed up on the second read, whose table may be newer than our instances
+                table = get_xconnect_tables().get(client)
+            (missing, changed, extra) = self.diff(desired, table, claimed)
+            if prune:
+                extra = [key for key in extra if not self.is_claimed(key)]
+            log.info("Reconciling ONOS xconnects", url=url, desired=len(desired), missing=len(missing),
+                     changed=len(changed), extra=len(extra))
+
+            for key in missing + changed:
+                data = {"deviceId": key[0], "vlanId": key[1], "endpoints": desired[key]}
+                ops.append((200, data, get_xconnect_queue().post(client, data)))
+            if prune:
+                for key in extra:
+                    data = {"deviceId": key[0], "vlanId": key[1]}
+                    ops.append((204, data, get_xconnect_queue().delete(client, data)))
+
+            stats["missing"] += len(missing)
+            stats["changed"] += len(changed)
+            stats["extra"] += len(extra) if prune else 0
+
+        for (status_code, data, op) in ops:
+            try:
+                r = op.wait()
+                if (r is not None) and (r.status_code != status_code):
+                    raise Exception(r.text)
+            except Exception as e:
+                log.error("Failed to reconcile fabric crossconnect in ONOS", body=data, error=str(e))
+                stats["failed"] += 1
+
+        return stats
+
+    def wait_until_ready(self, client):
+        """ Poll ONOS until its xconnect API answers, for at most ready_timeout seconds. Returns False if it never
+            did.
+        """
+        deadline = time.time() + self.ready_timeout
+        while True:
+            try:
+                r = client.get(XCONNECT_PATH)
+                if r.status_code == 200:
+                    return True
+                error = r.text
+            except Exception as e:
+                error = str(e)
+            if time.time() + self.ready_interval > deadline:
+                log.warning("ONOS is not ready, giving up", url=client.url, error=error)
+                return False
+            log.info("Waiting for ONOS to be ready", url=client.url, error=error)
+            time.sleep(self.ready_interval)
+
+    def replay(self, fcsis):
+        """ Push the xconnect of every synchronized instance in fcsis straight to ONOS, without reading what ONOS
+            has first. Used to repopulate an ONOS that has restarted and lost its xconnects, so each ONOS is given
+            up to ready_timeout seconds to come up before its xconnects are pushed.
+
+            push_fingerprint is brought up to date on the instances that were pushed. The instances that were not
+            pushed, because they are not synchronized yet, their ONOS never came up, their xconnect failed or a later
+            operation on the same xconnect superseded it, are returned so that they can be left to the sync step
+            instead.
+        """
+        fcsis = list(fcsis)
+        entries = OrderedDict()
+        for (fcsi, client, key, endpoints) in self.desired_entries(fcsis):
+            if endpoints is None:
+                continue
+            entry = entries.get((client.url, key))
+            if entry is None:
+                data = {"deviceId": key[0], "vlanId": key[1], "endpoints": endpoints}
+                entry = entries[(client.url, key)] = (client, data, [])
+            elif entry[1]["endpoints"] != endpoints:
+                log.warning("Conflicting crossconnects for device and s_tag", deviceId=key[0], vlanId=key[1],
+                            fcsi=fcsi.id)
+                continue
+            entry[2].append(fcsi)
+
+        ready = {}
+        for (client, data, replayed) in entries.values():
+            if client.url not in ready:
+                ready[client.url] = self.wait_until_ready(client)
+
+        log.info("Replaying xconnects to ONOS", xconnects=len(entries))
+        ops = [(data, replayed, get_xconnect_queue().post(client, data))
+               for (client, data, replayed) in entries.values() if ready[client.url]]
+
+        pushed = set()
+        for (data, replayed, op) in ops:
+            try:
+                r = op.wait()
+                if r is None:
+                    # replaced by a later operation, which may have been a DELETE, so ONOS may not have our xconnect
+                    log.info("Replayed xconnect superseded", body=data)
+                    continue
+                if r.status_code != 200:
+                    raise Exception(r.text)
+            except Exception as e:
+                log.error("Failed to replay fabric crossconnect to ONOS", body=data, error=str(e))
+                continue
+
+            fingerprint = Helpers.make_fingerprint(data)
+            for fcsi in replayed:
+                pushed.add(fcsi.id)
+                if fcsi.push_fingerprint != fingerprint:
+                    fcsi.push_fingerprint = fingerprint
+                    fcsi.save(update_fields=["push_fingerprint"])
+
+        remaining = [fcsi for fcsi in fcsis if fcsi.id not in pushed]
+        log.info("Replayed xconnects to ONOS", replayed=len(pushed), remaining=len(remaining))
+        return remaining
@@ -0,0 +1,106 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+XCONNECT_PATH = '/onos/segmentrouting/xconnect'
+
+
+class XconnectTable(object):
+    """ Snapshot of the xconnects configured in one ONOS, indexed by (deviceId, vlanId) """
+
+    def __init__(self, xconnects):
+        self.xconnects = {}
+        for xconn in xconnects:
+            self.xconnects[(str(xconn['deviceId']), int(xconn['vlanId']))] = xconn
+
+    def __len__(self):
+        return len(self.xconnects)
+
+    def get(self, device_id, vlan_id):
+        return self.xconnects.get((str(device_id), int(vlan_id)))
+
+    def endpoints(self, device_id, vlan_id):
+        """ Return the endpoints of an xconnect as a list of ints, or None if ONOS does not have it """
+        xconn = self.get(device_id, vlan_id)
+        if xconn is None:
+            return None
+        return [int(port) for port in xconn['endpoints']]
+
+
+class XconnectTableCache(object):
+    """ Per-ONOS cache of XconnectTable snapshots.
+
+        A snapshot is fetched with a single GET and reused until it is ttl seconds old, or until invalidate() is
+        called for its ONOS, which the XconnectQueue does after writing to it.
+    """
+
+    ttl = 5
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.generation = 0
+
+    def fetch(self, client):
+        log.info("Sending request to ONOS", url=client.url + XCONNECT_PATH)
+        r = client.get(XCONNECT_PATH)
+        if r.status_code != 200:
+            log.error(r.text)
+            raise Exception("Failed to get onos devices")
+        try:
+            xconnects = r.json()["xconnects"]
+        except Exception:
+            log.info("Get devices exception response", text=r.text)
+            raise
+        table = XconnectTable(xconnects)
+        log.info("Fetched ONOS xconnects", url=client.url, xconnects=len(table))
+        return table
+
+    def get(self, client):
+        with self.lock:
+            entry = self.tables.get(client.url)
+            if (entry is not None) and (time.time() - entry[0] <= self.ttl):
+                return entry[1]
+            generation = self.generation
+
+        # fetch without holding the lock, a concurrent fetch of the same ONOS is harmless
+        fetched_at = time.time()
+        table = self.fetch(client)
+        with self.lock:
+            # don't cache a snapshot that may predate a write made while it was being fetched
+            if generation == self.generation:
+                self.tables[client.url] = (fetched_at, table)
+        return table
+
+    def invalidate(self, url=None):
+        with self.lock:
+            self.generation += 1
+            if url is None:
+                self.tables.clear()
+            else:
+                self.tables.pop(url, None)
+
+
+_xconnect_tables = XconnectTableCache()
+
+
+def get_xconnect_tables():
+    return _xconnect_tables
@@ -0,0 +1,355 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Bulk provisioning of FabricCrossconnectServiceInstances and BNGPortMappings.
+
+    The TOSCA recipes in samples/ create one object each, which does not scale to migrating a pod with thousands of
+    s-tags. This tool streams definitions from a CSV or YAML file instead, validates them with the same s_tag grammar
+    the synchronizer uses, and writes them through xosapi:
+
+        python bulk_provision.py -u admin@opencord.org -p letmein crossconnects.csv
+
+    CSV files have a header row and one definition per row. The `model` column is either BNGPortMapping or
+    FabricCrossconnectServiceInstance, and the other columns are the fields of that model:
+
+        model,s_tag,switch_port,switch_datapath_id,source_port,owner
+        BNGPortMapping,100-199,4,,,
+        FabricCrossconnectServiceInstance,111,,of:0000000000000201,3,fabric-crossconnect
+
+    YAML files are a stream of documents, each of them either one definition or a list of definitions, with the same
+    keys as the CSV columns. Only one document is held in memory at a time.
+
+    Definitions are handled in batches, which only bound how many existing objects are looked up and held in memory
+    at a time. xosapi has no bulk writes, so every object that is created or updated is saved on its own.
+
+    The whole file is read and checked before connecting to XOS, and nothing is written if it cannot be read or
+    any definition in it is invalid.
+
+    Loading is idempotent. A BNGPortMapping whose s_tag matches the same s-tags as an existing one, however it is
+    written, updates its switch_port, and a FabricCrossconnectServiceInstance that already exists for the same owner,
+    s_tag, switch_datapath_id and source_port is left alone. owner is the name of a FabricCrossconnectService, and may
+    be left out when there is only one.
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import yaml
+
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "../steps"))
+
+from s_tag_pattern import parse_s_tag_pattern  # noqa: E402
+
+BNG_PORT_MAPPING = "BNGPortMapping"
+FABRIC_CROSSCONNECT_SERVICE_INSTANCE = "FabricCrossconnectServiceInstance"
+
+
+class InvalidDefinition(ValueError):
+    pass
+
+
+def read_csv(stream):
+    """ Yield (location, definition) for each row of a CSV stream """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield ("line %d" % reader.line_num, dict([(k.strip(), (v or "").strip()) for (k, v) in row.items() if k]))
+
+
+def read_yaml(stream):
+    """ Yield (location, definition) for each definition in a YAML stream """
+    for (number, document) in enumerate(yaml.safe_load_all(stream), 1):
+        if document is None:
+            continue
+        if isinstance(document, dict):
+            document = [document]
+        if not isinstance(document, list):
+            raise InvalidDefinition("YAML document %d is neither a definition nor a list of them" % number)
+        for definition in document:
+            yield ("document %d" % number, definition)
+
+
+class BulkProvisioner(object):
+    """ Validates definitions and writes them to XOS, batch_size definitions at a time.
+
+        orm is the xosapi ORM, as xos_grpc_client provides it. Existing BNGPortMappings are read once up front, since
+        there are few of them, and are keyed by their parsed s_tag so that "100-199" and "100 - 199" are the same
+        mapping. Existing FabricCrossconnectServiceInstances are looked up once per batch and device, so memory stays
+        bounded by the batch rather than by the size of the file. Each object is still saved on its own.
+    """
+
+    batch_size = 500
+    # only the first errors are kept, so that a file full of bad definitions does not fill memory
+    max_errors = 100
+
+    def __init__(self, orm, batch_size=None, dry_run=False):
+        self.orm = orm
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.services = None
+        self.bng_mappings = None
+        self.stats = {"read": 0, "invalid": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        self.errors = []
+
+    def get_service(self, name):
+        if self.services is None:
+            self.services = dict([(service.name, service) for service in
+                                  self.orm.FabricCrossconnectService.objects.all()])
+        if not name:
+            if len(self.services) != 1:
+                raise InvalidDefinition("owner is required when there is more than one FabricCrossconnectService")
+            return list(self.services.values())[0]
+        if name not in self.services:
+            raise InvalidDefinition("unknown FabricCrossconnectService %s" % name)
+        return self.services[name]
+
+    def parse_int(self, definition, field):
+        value = definition.get(field)
+        if (value is None) or (value == ""):
+            raise InvalidDefinition("%s is required" % field)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise InvalidDefinition("%s is not an integer: %s" % (field, value))
+
+    def parse(self, definition):
+        """ Return (model, fields) for a definition without looking anything up in XOS, so owner is still a name.
+            Raises InvalidDefinition if the definition is not valid.
+        """
+        if not isinstance(definition, dict):
+            raise InvalidDefinition("definition is not a mapping")
+
+        model = definition.get("model")
+        s_tag = definition.get("s_tag")
+        if (s_tag is None) or (str(s_tag).strip() == ""):
+            raise InvalidDefinition("s_tag is required")
+        try:
+            pattern = parse_s_tag_pattern(str(s_tag))
+        except ValueError as e:
+            raise InvalidDefinition(str(e))
+
+        if model == BNG_PORT_MAPPING:
+            return (model, {"s_tag": str(s_tag).strip(),
+                            "switch_port": self.parse_int(definition, "switch_port")})
+
+        if model == FABRIC_CROSSCONNECT_SERVICE_INSTANCE:
+            if pattern.kind != "single":
+                raise InvalidDefinition("s_tag of a FabricCrossconnectServiceInstance must be a single s-tag: %s"
+                                        % s_tag)
+            switch_datapath_id = str(definition.get("switch_datapath_id") or "").strip()
+            if not switch_datapath_id:
+                raise InvalidDefinition("switch_datapath_id is required")
+            return (model, {"owner": definition.get("owner"),
+                            "s_tag": pattern.min,
+                            "switch_datapath_id": switch_datapath_id,
+                            "source_port": self.parse_int(definition, "source_port")})
+
+        raise InvalidDefinition("unknown model %s" % model)
+
+    def validate(self, definition):
+        """ Return (model, fields) for a definition, raising InvalidDefinition if it is not valid """
+        (model, fields) = self.parse(definition)
+        if model == FABRIC_CROSSCONNECT_SERVICE_INSTANCE:
+            fields["owner"] = self.get_service(fields["owner"])
+        return (model, fields)
+
+    def check(self, definitions):
+        """ Parse (location, definition) pairs without writing anything, returning the stats """
+        for (location, definition) in definitions:
+            self.stats["read"] += 1
+            try:
+                self.parse(definition)
+            except InvalidDefinition as e:
+                self.stats["invalid"] += 1
+                self.add_error(location, str(e))
+        return self.stats
+
+    def load(self, definitions):
+        """ Validate and write (location, definition) pairs, returning the stats """
+        start = time.time()
+        batch = []
+        for (location, definition) in definitions:
+            self.stats["read"] += 1
+            try:
+                (model, fields) = self.validate(definition)
+            except InvalidDefinition as e:
+                self.stats["invalid"] += 1
+                self.add_error(location, str(e))
+                continue
+
+            batch.append((location, model, fields))
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+
+        if batch:
+            self.write_batch(batch)
+
+        self.stats["seconds"] = time.time() - start
+        written = self.stats["created"] + self.stats["updated"] + self.stats["unchanged"]
+        self.stats["per_second"] = written / self.stats["seconds"] if self.stats["seconds"] else 0.0
+        return self.stats
+
+    def add_error(self, location, error):
+        if len(self.errors) < self.max_errors:
+            self.errors.append((location, error))
+
+    def write_batch(self, batch):
+        existing = {}
+        for (location, model, fields) in batch:
+            try:
+                if model == BNG_PORT_MAPPING:
+                    self.write_bng_mapping(fields)
+                else:
+                    self.write_service_instance(fields, existing)
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.add_error(location, "failed to write %s: %s" % (model, e))
+
+    def get_bng_mappings(self):
+        if self.bng_mappings is None:
+            self.bng_mappings = {}
+            for bng_mapping in self.orm.BNGPortMapping.objects.all():
+                try:
+                    self.bng_mappings[parse_s_tag_pattern(bng_mapping.s_tag)] = bng_mapping
+                except ValueError:
+                    # no valid definition can match it
+                    continue
+        return self.bng_mappings
+
+    def write_bng_mapping(self, fields):
+        bng_mappings = self.get_bng_mappings()
+        pattern = parse_s_tag_pattern(fields["s_tag"])
+
+        bng_mapping = bng_mappings.get(pattern)
+        if bng_mapping is None:
+            bng_mapping = self.orm.BNGPortMapping(**fields)
+            self.stats["created"] += 1
+        elif bng_mapping.switch_port != fields["switch_port"]:
+            bng_mapping.switch_port = fields["switch_port"]
+            self.stats["updated"] += 1
+        else:
+            self.stats["unchanged"] += 1
+            return
+
+        if not self.dry_run:
+            bng_mapping.save()
+        bng_mappings[pattern] = bng_mapping
+
+    def write_service_instance(self, fields, existing):
+        owner = fields["owner"]
+        device = (owner.id, fields["switch_datapath_id"])
+        if device not in existing:
+            existing[device] = set([(fcsi.s_tag, fcsi.source_port) for fcsi in
+                                    self.orm.FabricCrossconnectServiceInstance.objects.filter(
+                                        owner_id=owner.id, switch_datapath_id=fields["switch_datapath_id"])])
+
+        key = (fields["s_tag"], fields["source_port"])
+        if key in existing[device]:
+            self.stats["unchanged"] += 1
+            return
+
+        if not self.dry_run:
+            self.orm.FabricCrossconnectServiceInstance(**fields).save()
+        existing[device].add(key)
+        self.stats["created"] += 1
+
+
+def report(stats, errors, out=sys.stdout):
+    for (location, error) in errors:
+        print("%s: %s" % (location, error), file=out)
+    print("read %(read)d, created %(created)d, updated %(updated)d, unchanged %(unchanged)d, invalid %(invalid)d, "
+          "failed %(failed)d in %(seconds).1fs (%(per_second).1f/s)" % stats, file=out)
+
+
+def open_definitions(filename, fmt=None):
+    if fmt is None:
+        fmt = "csv" if filename.lower().endswith(".csv") else "yaml"
+    stream = open(filename, "rb" if fmt == "csv" else "r")
+    return read_csv(stream) if fmt == "csv" else read_yaml(stream)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load FabricCrossconnectServiceInstances and BNGPortMappings")
+    parser.add_argument("filename", help="CSV or YAML file of definitions")
+    parser.add_argument("--format", choices=["csv", "yaml"], help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=BulkProvisioner.batch_size,
+                        help="definitions whose existing objects are looked up together; each object is still saved "
+                             "on its own")
+    parser.add_argument("--dry-run", action="store_true", help="validate without writing")
+    parser.add_argument("--grpc-secure-endpoint", default="xos-core:50051")
+    parser.add_argument("-u", "--username", default="admin@opencord.org")
+    parser.add_argument("-p", "--password", required=True)
+    return parser.parse_args(argv)
+
+
+def check_definitions(filename, fmt=None, out=sys.stderr):
+    """ Read and parse the whole file before connecting to XOS. Returns True if it can be loaded. """
+    checker = BulkProvisioner(None)
+    try:
+        stats = checker.check(open_definitions(filename, fmt))
+    except (EnvironmentError, csv.Error, yaml.YAMLError, InvalidDefinition) as e:
+        print("unable to read %s: %s" % (filename, e), file=out)
+        return False
+
+    for (location, error) in checker.errors:
+        print("%s: %s" % (location, error), file=out)
+    if stats["invalid"]:
+        print("%(invalid)d of %(read)d definitions are invalid, nothing was written" % stats, file=out)
+        return False
+    return True
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if not check_definitions(args.filename, args.format):
+        return 1
+
+    from twisted.internet import reactor
+    from twisted.internet.error import ReactorNotRunning
+    from xosapi import xos_grpc_client
+
+    result = {}
+
+    def provision():
+        try:
+            provisioner = BulkProvisioner(xos_grpc_client.coreclient.xos_orm, batch_size=args.batch_size,
+                                          dry_run=args.dry_run)
+            result["stats"] = provisioner.load(open_definitions(args.filename, args.format))
+            report(result["stats"], provisioner.errors)
+        except Exception as e:
+            result["error"] = e
+            print("provisioning failed: %s" % e, file=sys.stderr)
+            # start_api only stops the reactor when this returns, so stop it here rather than hang
+            try:
+                reactor.stop()
+            except ReactorNotRunning:
+                pass
+            raise
+
+    xos_grpc_client.start_api(provision, endpoint=args.grpc_secure_endpoint, username=args.username,
+                              password=args.password)
+
+    stats = result.get("stats")
+    return 0 if stats and not (result.get("error") or stats["invalid"] or stats["failed"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Local stand-in for the ONOS segmentrouting xconnect API.
+
+    Serves GET, POST and DELETE on /onos/segmentrouting/xconnect the way ONOS does, keeping the xconnects in memory,
+    so that the synchronizer can be load tested without a fabric:
+
+        python onos_standin.py --port 8181 --latency 0.02 --jitter 0.01 --error-rate 0.05 --max-xconnects 4000
+
+    Faults are injected per request. Each request is delayed by latency seconds plus up to jitter seconds more, and
+    then fails with error_status instead of being handled with probability error_rate. POSTs of new xconnects are
+    rejected with a 500 once the table holds max_xconnects of them.
+
+    ONOSStandIn can also be started from the tests and benchmarks, in which case it listens on a free port of the
+    loopback interface and runs in a background thread until stop() is called.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+XCONNECT_PATH = "/onos/segmentrouting/xconnect"
+
+
+class TableFull(Exception):
+    pass
+
+
+class XconnectStore(object):
+    """ The xconnects of the stand-in, keyed by (deviceId, vlanId) """
+
+    def __init__(self, max_xconnects=None):
+        self.max_xconnects = max_xconnects
+        self.lock = threading.Lock()
+        self.xconnects = {}
+
+    def __len__(self):
+        return len(self.xconnects)
+
+    def list(self):
+        with self.lock:
+            return [{"deviceId": device_id, "vlanId": vlan_id, "endpoints": list(endpoints)}
+                    for ((device_id, vlan_id), endpoints) in sorted(self.xconnects.items())]
+
+    def get(self, device_id, vlan_id):
+        return self.xconnects.get((str(device_id), int(vlan_id)))
+
+    def post(self, device_id, vlan_id, endpoints):
+        key = (str(device_id), int(vlan_id))
+        with self.lock:
+            if (key not in self.xconnects) and (self.max_xconnects is not None) and \
+                    (len(self.xconnects) >= self.max_xconnects):
+                raise TableFull("Xconnect table is full, %d entries" % len(self.xconnects))
+            self.xconnects[key] = [int(port) for port in endpoints]
+
+    def delete(self, device_id, vlan_id):
+        with self.lock:
+            self.xconnects.pop((str(device_id), int(vlan_id)), None)
+
+    def clear(self):
+        with self.lock:
+            self.xconnects.clear()
+
+
+class FaultInjector(object):
+    """ Decides how long each request is delayed for, and whether it fails """
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, error_status=503, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self):
+        with self.lock:
+            return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def fails(self):
+        with self.lock:
+            return (self.error_rate > 0) and (self.random.random() < self.error_rate)
+
+
+class XconnectRequestHandler(BaseHTTPRequestHandler):
+    """ Handles one request for an ONOSStandIn, which is available as self.server.standin """
+
+    protocol_version = "HTTP/1.1"
+    # send each response in one write, the status line and headers on their own would stall in Nagle's algorithm
+    # waiting for the client's delayed ACK
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        if self.server.standin.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def read_json(self):
+        length = int(self.headers.getheader("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise ValueError("Malformed JSON body")
+
+    def respond(self, status_code, body=None):
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(status_code)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_method(self, method):
+        standin = self.server.standin
+        start = time.time()
+        # always consume the body, so that the connection can be reused even if the request fails
+        try:
+            data = self.read_json() if method in ("POST", "DELETE") else None
+        except ValueError as e:
+            data = e
+
+        time.sleep(standin.faults.delay())
+
+        if self.path.split("?", 1)[0].rstrip("/") != XCONNECT_PATH:
+            status_code = 404
+            self.respond(status_code, {"code": 404, "message": "HTTP 404 Not Found"})
+        elif standin.faults.fails():
+            status_code = standin.faults.error_status
+            self.respond(status_code, {"code": status_code, "message": "Injected failure"})
+        elif isinstance(data, ValueError):
+            status_code = 400
+            self.respond(status_code, {"code": 400, "message": str(data)})
+        else:
+            status_code = self.handle_xconnect(method, data)
+
+        standin.record(method, status_code, time.time() - start)
+
+    def handle_xconnect(self, method, data):
+        store = self.server.standin.store
+        try:
+            if method == "GET":
+                self.respond(200, {"xconnects": store.list()})
+                return 200
+            if method == "POST":
+                store.post(data["deviceId"], data["vlanId"], data["endpoints"])
+                self.respond(200)
+                return 200
+            store.delete(data["deviceId"], data["vlanId"])
+            self.respond(204)
+            return 204
+        except TableFull as e:
+            self.respond(500, {"code": 500, "message": str(e)})
+            return 500
+        except (KeyError, TypeError, ValueError) as e:
+            self.respond(400, {"code": 400, "message": "Invalid xconnect: %s" % e})
+            return 400
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_DELETE(self):
+        self.handle_method("DELETE")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class ONOSStandIn(object):
+    """ In-memory ONOS serving the segmentrouting xconnect API, with injected latency, errors and a table size limit.
+
+        stats() counts the requests handled by method and status code. latencies() returns the time spent handling
+        each request, injected delay included.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0, jitter=0, error_rate=0, error_status=503,
+                 max_xconnects=None, seed=None, verbose=False):
+        self.store = XconnectStore(max_xconnects)
+        self.faults = FaultInjector(latency, jitter, error_rate, error_status, seed)
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.durations = []
+
+        self.server = ThreadingHTTPServer((host, port), XconnectRequestHandler)
+        self.server.standin = self
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.address
+
+    def record(self, method, status_code, duration):
+        with self.lock:
+            key = "%s %d" % (method, status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.append(duration)
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "xconnects": len(self.store)}
+
+    def latencies(self):
+        with self.lock:
+            return list(self.durations)
+
+    def reset(self):
+        """ Forget the xconnects and the request counts, keeping the fault settings """
+        self.store.clear()
+        with self.lock:
+            self.requests = {}
+            self.durations = []
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="onos-standin")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def percentiles(values, points=(50, 90, 99, 100)):
+    """ Return {point: value} for each percentile point of values, using the nearest rank """
+    values = sorted(values)
+    if not values:
+        return dict([(point, None) for point in points])
+    return dict([(point, values[max(0, int(round(point / 100.0 * len(values))) - 1)]) for point in points])
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Serve the ONOS segmentrouting xconnect API from memory")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8181, help="port to listen on")
+    parser.add_argument("--latency", type=float, default=0, help="seconds to delay every request by")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many more seconds of random delay")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="status code of the requests that fail")
+    parser.add_argument("--max-xconnects", type=int, help="reject new xconnects once the table has this many")
+    parser.add_argument("--seed", type=int, help="seed for the injected jitter and failures")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    standin = ONOSStandIn(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, error_status=args.error_status,
+                          max_xconnects=args.max_xconnects, seed=args.seed, verbose=args.verbose)
+    print("Serving %s%s" % (standin.url, XCONNECT_PATH))
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        print(json.dumps(standin.stats(), sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from StringIO import StringIO
+
+from mock import Mock
+
+import os
+import shutil
+import sys
+import tempfile
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+CSV = """model,s_tag,switch_port,switch_datapath_id,source_port,owner
+BNGPortMapping,100-199,4,,,
+BNGPortMapping,ANY,5,,,
+BNGPortMapping,222,6,,,
+FabricCrossconnectServiceInstance,111,,of:0000000000000201,3,fcservice
+FabricCrossconnectServiceInstance,112,,of:0000000000000201,3,
+FabricCrossconnectServiceInstance,113,,of:0000000000000202,3,fcservice
+FabricCrossconnectServiceInstance,113,,of:0000000000000202,3,fcservice
+BNGPortMapping,300-200,4,,,
+FabricCrossconnectServiceInstance,100-120,,of:0000000000000201,3,fcservice
+FabricCrossconnectServiceInstance,114,,,3,fcservice
+FabricCrossconnectServiceInstance,115,,of:0000000000000201,three,fcservice
+Subscriber,116,,,,
+"""
+
+YAML = """
+model: BNGPortMapping
+s_tag: "100-199"
+switch_port: 4
+---
+- model: FabricCrossconnectServiceInstance
+  s_tag: 111
+  switch_datapath_id: of:0000000000000201
+  source_port: 3
+- model: FabricCrossconnectServiceInstance
+  s_tag: 4096
+  switch_datapath_id: of:0000000000000201
+  source_port: 3
+"""
+
+
+class TestBulkProvision(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+        sys.path.append(os.path.join(test_path, "../steps"))
+
+        import bulk_provision
+        self.module = bulk_provision
+
+        self.service = Mock(id=1)
+        self.service.name = "fcservice"
+
+        self.orm = Mock()
+        self.orm.FabricCrossconnectService.objects.all.return_value = [self.service]
+        # the ANY mapping exists already, with another port, and 222 is already up to date
+        self.orm.BNGPortMapping.objects.all.return_value = [Mock(s_tag="ANY", switch_port=4),
+                                                            Mock(s_tag="222", switch_port=6)]
+        self.orm.FabricCrossconnectServiceInstance.objects.filter.return_value = [Mock(s_tag=111, source_port=3)]
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        sys.path = self.sys_path_save
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, name, contents):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, "w") as f:
+            f.write(contents)
+        return filename
+
+    def load(self, definitions, **kwargs):
+        provisioner = self.module.BulkProvisioner(self.orm, **kwargs)
+        return (provisioner.load(definitions), provisioner)
+
+    def test_read_csv(self):
+        definitions = list(self.module.read_csv(StringIO(CSV)))
+
+        self.assertEqual(len(definitions), 12)
+        self.assertEqual(definitions[0], ("line 2", {"model": "BNGPortMapping", "s_tag": "100-199", "switch_port": "4",
+                                                     "switch_datapath_id": "", "source_port": "", "owner": ""}))
+
+    def test_read_yaml(self):
+        definitions = list(self.module.read_yaml(StringIO(YAML)))
+
+        self.assertEqual([location for (location, definition) in definitions],
+                         ["document 1", "document 2", "document 2"])
+        self.assertEqual(definitions[1][1]["s_tag"], 111)
+
+    def test_load_csv(self):
+        (stats, provisioner) = self.load(self.module.read_csv(StringIO(CSV)), batch_size=4)
+
+        self.assertEqual(dict([(k, stats[k]) for k in ["read", "created", "updated", "unchanged", "invalid",
+                                                       "failed"]]),
+                         {"read": 12, "created": 3, "updated": 1, "unchanged": 3, "invalid": 5, "failed": 0})
+        self.assertIn("per_second", stats)
+
+        self.assertEqual([location for (location, error) in provisioner.errors],
+                         ["line 9", "line 10", "line 11", "line 12", "line 13"])
+        self.assertEqual(provisioner.errors[1][1],
+                         "s_tag of a FabricCrossconnectServiceInstance must be a single s-tag: 100-120")
+
+        self.orm.BNGPortMapping.assert_called_once_with(s_tag="100-199", switch_port=4)
+        self.orm.FabricCrossconnectServiceInstance.assert_any_call(
+            owner=self.service, s_tag=112, switch_datapath_id="of:0000000000000201", source_port=3)
+        # 113 is only created once, although it is listed twice
+        self.assertEqual(self.orm.FabricCrossconnectServiceInstance.return_value.save.call_count, 2)
+
+        # existing instances are looked up once per batch and device, and mappings only once
+        self.assertEqual(self.orm.FabricCrossconnectServiceInstance.objects.filter.call_count, 3)
+        self.assertEqual(self.orm.BNGPortMapping.objects.all.call_count, 1)
+
+    def test_bng_mapping_normalized(self):
+        self.orm.BNGPortMapping.objects.all.return_value = [Mock(s_tag="100-150, 151-199", switch_port=4),
+                                                            Mock(s_tag="ANY", switch_port=4),
+                                                            Mock(s_tag="bad", switch_port=4)]
+        definitions = [("line 2", {"model": "BNGPortMapping", "s_tag": "100 - 199", "switch_port": "4"}),
+                       ("line 3", {"model": "BNGPortMapping", "s_tag": "any", "switch_port": "5"}),
+                       ("line 4", {"model": "BNGPortMapping", "s_tag": "200, 201", "switch_port": "6"}),
+                       ("line 5", {"model": "BNGPortMapping", "s_tag": "200-201", "switch_port": "6"})]
+        self.orm.BNGPortMapping.side_effect = lambda **fields: Mock(**fields)
+
+        (stats, provisioner) = self.load(definitions)
+
+        # mappings are matched on the s-tags they cover, not on how s_tag is written
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (1, 1, 2))
+        self.orm.BNGPortMapping.assert_called_once_with(s_tag="200, 201", switch_port=6)
+        self.assertEqual(self.orm.BNGPortMapping.objects.all.return_value[1].switch_port, 5)
+
+    def test_load_yaml(self):
+        self.orm.FabricCrossconnectServiceInstance.objects.filter.return_value = []
+
+        (stats, provisioner) = self.load(self.module.read_yaml(StringIO(YAML)))
+
+        self.assertEqual((stats["created"], stats["invalid"]), (2, 1))
+        self.assertEqual(provisioner.errors, [("document 2", "Malformed range 4096")])
+
+    def test_dry_run(self):
+        (stats, provisioner) = self.load(self.module.read_csv(StringIO(CSV)), dry_run=True)
+
+        self.assertEqual(stats["created"], 3)
+        self.orm.BNGPortMapping.return_value.save.assert_not_called()
+        self.orm.FabricCrossconnectServiceInstance.return_value.save.assert_not_called()
+
+    def test_write_failure(self):
+        self.orm.FabricCrossconnectServiceInstance.return_value.save.side_effect = Exception("XOS is down")
+
+        (stats, provisioner) = self.load(self.module.read_csv(StringIO(CSV)))
+
+        self.assertEqual((stats["created"], stats["failed"]), (1, 3))
+        self.assertIn(("line 6", "failed to write FabricCrossconnectServiceInstance: XOS is down"), provisioner.errors)
+
+    def test_report(self):
+        out = StringIO()
+        self.module.report({"read": 3, "created": 1, "updated": 1, "unchanged": 0, "invalid": 1, "failed": 0,
+                            "seconds": 2.0, "per_second": 1.0}, [("line 4", "s_tag is required")], out)
+
+        self.assertEqual(out.getvalue(), "line 4: s_tag is required\n"
+                                         "read 3, created 1, updated 1, unchanged 0, invalid 1, failed 0 in 2.0s "
+                                         "(1.0/s)\n")
+
+    def test_check_definitions(self):
+        out = StringIO()
+        good = self.write_file("good.yaml", YAML.replace("4096", "112"))
+        self.assertTrue(self.module.check_definitions(good, out=out))
+        self.assertEqual(out.getvalue(), "")
+
+        out = StringIO()
+        self.assertFalse(self.module.check_definitions(self.write_file("bad.csv", CSV), out=out))
+        self.assertIn("line 9: Malformed range 300-200\n", out.getvalue())
+        self.assertTrue(out.getvalue().endswith("5 of 12 definitions are invalid, nothing was written\n"))
+
+    def test_check_unreadable(self):
+        for filename in [os.path.join(self.tmpdir, "missing.csv"),
+                         self.write_file("unparseable.yaml", "model: [BNGPortMapping\n"),
+                         self.write_file("scalar.yaml", "BNGPortMapping\n")]:
+            out = StringIO()
+            self.assertFalse(self.module.check_definitions(filename, out=out))
+            self.assertTrue(out.getvalue().startswith("unable to read %s: " % filename))
+
+    def test_main_does_not_connect(self):
+        # an unreadable file is reported before xosapi is imported or the reactor started
+        self.assertEqual(self.module.main(["-p", "letmein", os.path.join(self.tmpdir, "missing.csv")]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+
+import requests
+
+import os
+import sys
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestONOSStandIn(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+        sys.path.append(test_path)
+
+        import onos_standin
+        self.module = onos_standin
+        self.standins = []
+
+    def tearDown(self):
+        for standin in self.standins:
+            standin.stop()
+        sys.path = self.sys_path_save
+
+    def start(self, **kwargs):
+        standin = self.module.ONOSStandIn(**kwargs).start()
+        self.standins.append(standin)
+        self.url = standin.url + self.module.XCONNECT_PATH
+        return standin
+
+    def test_xconnects(self):
+        standin = self.start()
+
+        r = requests.get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"xconnects": []})
+
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 200)
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 222, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 200)
+        # POSTing an existing xconnect replaces it
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 5]})
+        self.assertEqual(r.status_code, 200)
+
+        r = requests.delete(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 222})
+        self.assertEqual(r.status_code, 204)
+
+        r = requests.get(self.url)
+        self.assertEqual(r.json(), {"xconnects": [{"deviceId": "of:0000000000000201", "vlanId": 111,
+                                                   "endpoints": [3, 5]}]})
+        self.assertEqual(standin.stats(), {"xconnects": 1,
+                                           "requests": {"GET 200": 2, "POST 200": 3, "DELETE 204": 1}})
+        self.assertEqual(len(standin.latencies()), 6)
+
+    def test_bad_requests(self):
+        self.start()
+
+        r = requests.post(self.url, data="{not json", headers={"Content-Type": "application/json"})
+        self.assertEqual(r.status_code, 400)
+
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111})
+        self.assertEqual(r.status_code, 400)
+
+        r = requests.get(self.url.replace("xconnect", "xconnects"))
+        self.assertEqual(r.status_code, 404)
+
+    def test_max_xconnects(self):
+        standin = self.start(max_xconnects=1)
+
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 200)
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 222, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 500)
+        self.assertIn("full", r.json()["message"])
+        # replacing an xconnect that is in the table still works
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 5]})
+        self.assertEqual(r.status_code, 200)
+
+        self.assertEqual(standin.stats()["xconnects"], 1)
+
+    def test_error_rate(self):
+        standin = self.start(error_rate=1, error_status=502)
+
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 502)
+        self.assertEqual(standin.stats(), {"xconnects": 0, "requests": {"POST 502": 1}})
+
+        standin.faults.error_rate = 0
+        r = requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]})
+        self.assertEqual(r.status_code, 200)
+
+    def test_latency(self):
+        standin = self.start(latency=0.05, jitter=0.05, seed=1)
+
+        start = time.time()
+        requests.get(self.url)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertGreaterEqual(standin.latencies()[0], 0.05)
+
+    def test_reset(self):
+        standin = self.start()
+        requests.post(self.url, json={"deviceId": "of:0000000000000201", "vlanId": 111, "endpoints": [3, 4]})
+
+        standin.reset()
+
+        self.assertEqual(standin.stats(), {"xconnects": 0, "requests": {}})
+        self.assertEqual(standin.latencies(), [])
+
+    def test_percentiles(self):
+        self.assertEqual(self.module.percentiles(range(1, 101)), {50: 50, 90: 90, 99: 99, 100: 100})
+        self.assertEqual(self.module.percentiles([7]), {50: 7, 90: 7, 99: 7, 100: 7})
+        self.assertEqual(self.module.percentiles([]), {50: None, 90: None, 99: None, 100: None})
+
+
+if __name__ == '__main__':
+    unittest.main()